@@ -0,0 +1,77 @@
+"""Synthetic browsing history with known query -> URL pairs."""
+from pathlib import Path
+import json
+import random
+
+from benchmarks.stubs import stub_embedding
+
+FILLER = (
+    "the page article post read more home about contact news blog update guide "
+    "today week people time team latest share comments subscribe privacy terms"
+).split()
+
+SUBJECTS = [
+    "rust async runtime", "python packaging wheels", "kubernetes pod autoscaling",
+    "sourdough bread starter", "marathon training plan", "espresso grinder burr",
+    "faiss vector index", "chrome extension manifest", "postgres query planner",
+    "solar panel inverter", "mountain bike suspension", "jazz piano voicings",
+    "tax return deadline", "gpu memory bandwidth", "bonsai tree pruning",
+    "react state management", "linux kernel scheduler", "electric car charging",
+]
+
+SITES = ["github.com", "news.ycombinator.com", "medium.com", "en.wikipedia.org", "stackoverflow.com", "blog.example.org"]
+
+
+def synthetic_pages(n: int, seed: int = 0) -> list:
+    """Generate pages, each with a unique marker phrase and a query that should find it.
+
+    `paraphrase` asks for the same page in other words; `different_query` asks for another
+    note on the same subject, which no page has.
+    """
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n):
+        subject = SUBJECTS[i % len(SUBJECTS)]
+        marker = f"{subject} note{i}"
+        site = SITES[i % len(SITES)]
+        paragraphs = []
+        for _ in range(rng.randint(3, 6)):
+            words = rng.choices(FILLER, k=rng.randint(40, 90))
+            words.insert(rng.randrange(len(words)), marker)
+            paragraphs.append(" ".join(words))
+        url = f"https://{site}/{subject.replace(' ', '-')}-{i}"
+        title = f"{subject.title()} #{i}"
+        text = f"{title}\n\n" + "\n\n".join(paragraphs)
+        pages.append({
+            "url": url,
+            "title": title,
+            "text": text,
+            "body": f"<html><head><title>{title}</title></head><body>"
+                    + "".join(f"<p>{p}</p>" for p in paragraphs) + "</body></html>",
+            "query": f"that page about {marker}",
+            "paraphrase": f"where did I read about {marker} again",
+            "different_query": f"that page about {subject} note{n + i}",
+        })
+    return pages
+
+
+def build_index(index_dir: Path, pages: list, chunk_size: int = 256, overlap: int = 40) -> int:
+    """Write index.bin and metadata.json for the pages using stub embeddings; returns chunk count."""
+    import faiss
+    import numpy as np
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    vectors, metadata = [], []
+    for page in pages:
+        words = page["text"].split()
+        for i, start in enumerate(range(0, len(words), chunk_size - overlap)):
+            chunk = " ".join(words[start:start + chunk_size])
+            vectors.append(stub_embedding(chunk))
+            metadata.append({"url": page["url"], "chunk": chunk, "chunk_id": f"{page['url']}_{i}"})
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+    faiss.write_index(index, str(index_dir / "index.bin"))
+    (index_dir / "metadata.json").write_text(json.dumps(metadata))
+    return len(metadata)
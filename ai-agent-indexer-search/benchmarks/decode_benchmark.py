@@ -0,0 +1,93 @@
+"""Microbenchmark: decoding Ollama embedding responses and assembling them for the index.
+
+Compares the old path (response.json() into Python float lists, np.array per chunk,
+np.stack for the page) with embedder.decode_vectors decoding each batch to an array
+that is then copied into one preallocated result, both with orjson (its fast path)
+and with the numpy text parser it falls back to when orjson is missing.
+
+Run from the ai-agent-indexer-search directory:
+    python -m benchmarks.decode_benchmark --chunks 512 --batch-size 64
+"""
+from pathlib import Path
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+import embedder  # noqa: E402
+from embedder import decode_vectors  # noqa: E402
+
+
+def ollama_body(vectors: np.ndarray) -> bytes:
+    """A /api/embed response body as Ollama writes it"""
+    rows = ",".join("[" + ",".join(repr(float(v)) for v in row) + "]" for row in vectors)
+    return b'{"model":"nomic-embed-text","embeddings":[' + rows.encode() + b'],"total_duration":1}'
+
+
+def old_path(bodies: list) -> np.ndarray:
+    per_chunk = []
+    for body in bodies:
+        for embedding in json.loads(body)["embeddings"]:
+            per_chunk.append(np.array(embedding, dtype=np.float32))
+    return np.stack(per_chunk)
+
+
+def fast_path(bodies: list, rows: int, dim: int) -> np.ndarray:
+    out = np.empty((rows * len(bodies), dim), dtype=np.float32)
+    for i, body in enumerate(bodies):
+        out[i * rows:(i + 1) * rows] = decode_vectors(body, "embeddings", rows)
+    return out
+
+
+def median_ms(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.chunks, args.dim)).astype(np.float32)
+    bodies = [ollama_body(vectors[i:i + args.batch_size]) for i in range(0, args.chunks, args.batch_size)]
+    expected = old_path(bodies)
+    assert np.allclose(fast_path(bodies, args.batch_size, args.dim), expected)
+
+    results = {
+        "chunks": args.chunks,
+        "batch_size": args.batch_size,
+        "response_mb": round(sum(len(body) for body in bodies) / 1e6, 2),
+        "json_list_stack_ms": median_ms(lambda: old_path(bodies), args.repeats),
+    }
+    installed_orjson = embedder.orjson
+    try:
+        embedder.orjson = None
+        results["numpy_text_preallocated_ms"] = median_ms(lambda: fast_path(bodies, args.batch_size, args.dim), args.repeats)
+    finally:
+        embedder.orjson = installed_orjson
+    if installed_orjson is not None:
+        results["orjson_preallocated_ms"] = median_ms(lambda: fast_path(bodies, args.batch_size, args.dim), args.repeats)
+        results["speedup_vs_json"] = round(results["json_list_stack_ms"] / results["orjson_preallocated_ms"], 2)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Embedding throughput (chunks/sec) for each embedder backend.
+
+The Ollama backend is measured one chunk per request (how pages used to be indexed)
+and batched. Without --ollama-url it talks to the stub embedding server, which
+isolates the HTTP and JSON overhead from the model itself. Local backends are
+measured at every --threads value and skipped when their packages are missing.
+
+Run from the ai-agent-indexer-search directory:
+    python -m benchmarks.embed_benchmark --chunks 512 --threads 1 4 8
+    python -m benchmarks.embed_benchmark --ollama-url http://localhost:11434 --backends ollama onnx
+"""
+from pathlib import Path
+import argparse
+import json
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from benchmarks.corpus import synthetic_pages  # noqa: E402
+from benchmarks.stubs import StubEmbeddingServer  # noqa: E402
+from embedder import EMBED_LOCAL_MODEL, OllamaEmbedder, SentenceTransformerEmbedder  # noqa: E402
+from faiss_store import chunk_text  # noqa: E402
+
+
+def sample_chunks(count: int) -> list:
+    chunks = []
+    for page in synthetic_pages(max(1, count // 3)):
+        chunks.extend(chunk_text(page["text"]))
+    while len(chunks) < count:
+        chunks.extend(chunks)
+    return chunks[:count]
+
+
+def chunks_per_sec(embed, chunks: list, batch_size: int) -> float:
+    embed(chunks[:batch_size])  # warm up: connections, model load, ONNX graph optimisation
+    start = time.perf_counter()
+    for i in range(0, len(chunks), batch_size):
+        embed(chunks[i:i + batch_size])
+    return round(len(chunks) / (time.perf_counter() - start), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--backends", nargs="+", default=["ollama", "sentence-transformers", "onnx"])
+    parser.add_argument("--ollama-url", help="real Ollama server; the stub is used when omitted")
+    parser.add_argument("--model", default=EMBED_LOCAL_MODEL, help="model for the local backends")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    chunks = sample_chunks(args.chunks)
+    results = {"chunks": len(chunks), "batch_size": args.batch_size, "backends": {}}
+
+    if "ollama" in args.backends:
+        stub = None if args.ollama_url else StubEmbeddingServer()
+        base_url = args.ollama_url or stub.start()
+        embedder = OllamaEmbedder(batch_url=f"{base_url}/api/embed")
+        try:
+            results["backends"]["ollama"] = {
+                "server": "ollama" if args.ollama_url else "stub",
+                "per_chunk_chunks_per_sec": chunks_per_sec(lambda batch: [embedder.embed_one(text) for text in batch],
+                                                           chunks, args.batch_size),
+                "batched_chunks_per_sec": chunks_per_sec(embedder.embed, chunks, args.batch_size),
+            }
+        finally:
+            if stub:
+                stub.stop()
+
+    for backend, runtime in (("sentence-transformers", "torch"), ("onnx", "onnx")):
+        if backend not in args.backends:
+            continue
+        by_threads = {}
+        for threads in args.threads:
+            try:
+                embedder = SentenceTransformerEmbedder(model=args.model, backend=runtime, threads=threads,
+                                                       batch_size=args.batch_size)
+            except ImportError as e:
+                by_threads = {"skipped": f"missing package: {e.name}"}
+                break
+            by_threads[f"threads_{threads}"] = chunks_per_sec(embedder.embed, chunks, args.batch_size)
+        results["backends"][backend] = by_threads
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
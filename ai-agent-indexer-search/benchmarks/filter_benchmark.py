@@ -0,0 +1,88 @@
+"""Filtered vs unfiltered search latency on one shard of random vectors.
+
+Filters go through a FAISS ID selector, so a search restricted to a small share of
+the shard (one domain, a recent time window) should be faster than a full scan.
+
+Run from the ai-agent-indexer-search directory:
+    python -m benchmarks.filter_benchmark --vectors 200000 --domains 20
+"""
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from faiss_store import ShardCache, chunk_metadata, save_store, search_shards  # noqa: E402
+
+
+def build_shard(shard: Path, vectors: int, dim: int, domains: int, days: int, seed: int) -> None:
+    import faiss
+
+    rng = np.random.default_rng(seed)
+    index = faiss.IndexFlatL2(dim)
+    embeddings = rng.random((vectors, dim), dtype=np.float32)
+    faiss.normalize_L2(embeddings)  # unit length, like every embedding backend returns
+    index.add(embeddings)
+    now = datetime.now(timezone.utc)
+    metadata = [
+        chunk_metadata(f"https://site{i % domains}.example.com/page{i}", "", 0,
+                       visited_at=(now - timedelta(days=float(rng.uniform(0, days)))).isoformat(timespec="seconds"))
+        for i in range(vectors)
+    ]
+    save_store(index, metadata, {}, shard)
+
+
+def time_search(shard: Path, cache: ShardCache, queries: np.ndarray, **filters) -> float:
+    """Median milliseconds per query"""
+    search_shards([shard], queries[:1], 5, cache, **filters)  # warm up
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        search_shards([shard], query.reshape(1, -1), 5, cache, **filters)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--domains", type=int, default=20)
+    parser.add_argument("--days", type=int, default=365, help="visit times are spread over this many days")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    import faiss
+
+    queries = np.random.default_rng(args.seed + 1).random((args.queries, args.dim), dtype=np.float32)
+    faiss.normalize_L2(queries)
+    week_ago = time.time() - 7 * 86400
+    with tempfile.TemporaryDirectory() as tmp:
+        shard = Path(tmp)
+        build_shard(shard, args.vectors, args.dim, args.domains, args.days, args.seed)
+        cache = ShardCache()
+        results = {
+            "vectors": args.vectors,
+            "unfiltered_ms": time_search(shard, cache, queries),
+            "domain_ms": time_search(shard, cache, queries, domain="site0.example.com"),
+            "last_week_ms": time_search(shard, cache, queries, visited_after=week_ago),
+            "domain_and_last_week_ms": time_search(shard, cache, queries, domain="site0.example.com",
+                                                   visited_after=week_ago),
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Load test for /search-agent against stubbed embedding and Gemini backends.
+
+Run from the ai-agent-indexer-search directory:
+    python -m benchmarks.load_test --requests 200 --concurrency 16 --workers 4
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.corpus import build_index, synthetic_pages
+from benchmarks.stubs import StubEmbeddingServer
+
+PROJECT_ROOT = Path(__file__).parent.parent.resolve()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def latency_summary(latencies: list, elapsed: float, errors: int) -> dict:
+    ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+async def wait_until_ready(client: httpx.AsyncClient, url: str, query: str, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.post(url, json={"query": query})
+            if response.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Search agent at {url} did not become ready")
+
+
+async def run_load(url: str, queries: list, total: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        await wait_until_ready(client, url, queries[0])
+
+        async def one(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json={"query": queries[i % len(queries)]})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return latency_summary(latencies, elapsed, errors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=4, help="MCP sessions per worker")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--embed-latency-ms", type=float, default=5)
+    parser.add_argument("--output", type=Path, help="write the summary as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the server's log output")
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages)
+    embed_server = StubEmbeddingServer(latency_ms=args.embed_latency_ms)
+    embed_url = embed_server.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = Path(tmp) / "faiss_index"
+        build_index(index_dir, pages)
+
+        port = free_port()
+        env = {
+            **os.environ,
+            "EMBED_BATCH_URL": f"{embed_url}/api/embed",
+            "FAISS_INDEX_DIR": str(index_dir),
+            "MCP_POOL_SIZE": str(args.pool_size),
+            "STUB_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        }
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "benchmarks.stub_app:app",
+             "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=PROJECT_ROOT, env=env,
+            stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.DEVNULL,
+        )
+        try:
+            queries = [page["query"] for page in pages]
+            summary = asyncio.run(run_load(f"http://127.0.0.1:{port}/search-agent", queries, args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            embed_server.stop()
+
+    summary.update(workers=args.workers, concurrency=args.concurrency, pool_size=args.pool_size,
+                   llm_latency_ms=args.llm_latency_ms)
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
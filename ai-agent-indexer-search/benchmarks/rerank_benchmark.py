@@ -0,0 +1,140 @@
+"""Latency and quality of choosing the answer among search hits, with and without a reranker.
+
+    faiss   the top FAISS hit as is
+    llm     the top 5 chunks in a prompt and the model names the URL, which is how the planner selects today
+    rerank  RERANK_CANDIDATES chunks scored by the cross-encoder, best first; run twice, the
+            second time from the score cache
+
+The LLM is Gemini with --gemini (needs GOOGLE_API_KEY), otherwise the scripted stub, which
+picks the first hit after --llm-latency-ms. The cross-encoder is --model; when
+sentence-transformers is not installed a term-overlap stand-in takes its place, so the
+rerank numbers then show only the cost of the stage, not the model's quality.
+
+Run from the ai-agent-indexer-search directory:
+    python -m benchmarks.rerank_benchmark --pages 200 --queries 50
+    python -m benchmarks.rerank_benchmark --gemini --model cross-encoder/ms-marco-MiniLM-L-6-v2 --backend onnx
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from benchmarks.corpus import build_index, synthetic_pages  # noqa: E402
+from benchmarks.stubs import FakeGeminiClient, stub_embedding  # noqa: E402
+from faiss_store import ShardCache, search_shards  # noqa: E402
+from reranker import RERANK_CANDIDATES, RERANK_MODEL, CrossEncoderReranker, Reranker  # noqa: E402
+
+LLM_MODEL = "gemini-2.0-flash"  # same as the planner
+URL = re.compile(r"https?://\S+?(?=[\s\]\"'>,]|$)")
+
+
+class TermOverlapReranker(Reranker):
+    """Stand-in scoring by shared words, for machines without sentence-transformers"""
+
+    name = "stub-term-overlap"
+
+    def predict(self, query, passages):
+        terms = set(query.lower().split())
+        return np.array([len(terms & set(passage.lower().split())) for passage in passages], dtype=np.float32)
+
+
+def search_results(hits: list) -> str:
+    """Hits formatted the way the search tool returns them to the planner"""
+    return "\n".join(f"{data['chunk']}\n[Source: {data['url']}, ID: {data['chunk_id']}, Distance: {distance:.4f}]"
+                     for distance, data in hits)
+
+
+def summary(latencies: list, picks: list, expected: list) -> dict:
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "p50_ms": round(statistics.median(ms), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "recall_at_1": round(sum(pick == url for pick, url in zip(picks, expected)) / len(expected), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--candidates", type=int, default=RERANK_CANDIDATES)
+    parser.add_argument("--model", default=RERANK_MODEL)
+    parser.add_argument("--backend", default="onnx", choices=["onnx", "torch"])
+    parser.add_argument("--gemini", action="store_true", help="select with the real Gemini API")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="stub LLM latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages, seed=args.seed)
+    queries = pages[:args.queries]
+    expected = [page["url"] for page in queries]
+    try:
+        reranker = CrossEncoderReranker(model=args.model, backend=args.backend)
+    except ImportError as e:
+        print(f"sentence-transformers unavailable ({e.name}), using the term-overlap stand-in", file=sys.stderr)
+        reranker = TermOverlapReranker()
+    if args.gemini:
+        from google import genai
+        llm = genai.Client(api_key=os.environ["GOOGLE_API_KEY"])
+    else:
+        llm = FakeGeminiClient(latency_ms=args.llm_latency_ms)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shard = Path(tmp)
+        build_index(shard, pages)
+        cache = ShardCache()
+        vectors = {page["query"]: np.asarray([stub_embedding(page["query"])], dtype=np.float32) for page in queries}
+        search_shards([shard], vectors[queries[0]["query"]], 5, cache)  # load the shard outside the timings
+
+        def run(select) -> dict:
+            latencies, picks = [], []
+            for page in queries:
+                start = time.perf_counter()
+                picks.append(select(page["query"]))
+                latencies.append(time.perf_counter() - start)
+            return summary(latencies, picks, expected)
+
+        def faiss_pick(query: str) -> str:
+            return search_shards([shard], vectors[query], 5, cache)[0][1]["url"]
+
+        def llm_pick(query: str) -> str:
+            hits = search_shards([shard], vectors[query], 5, cache)
+            prompt = (f"Query: {query}\nSearch results:\n{search_results(hits)}\n\n"
+                      "Reply with only the URL of the page that best matches the query.")
+            match = URL.search(llm.models.generate_content(model=LLM_MODEL, contents=prompt).text or "")
+            return match.group(0) if match else ""
+
+        def rerank_pick(query: str) -> str:
+            hits = search_shards([shard], vectors[query], args.candidates, cache)
+            order = reranker.rerank(query, [data["chunk"] for _, data in hits], 5)
+            return hits[order[0]][1]["url"]
+
+        results = {
+            "pages": args.pages,
+            "queries": len(queries),
+            "candidates": args.candidates,
+            "reranker": reranker.name,
+            "llm": LLM_MODEL if args.gemini else f"stub ({args.llm_latency_ms} ms)",
+            "faiss": run(faiss_pick),
+            "llm_select": run(llm_pick),
+            "rerank_cold": run(rerank_pick),
+            "rerank_cached": run(rerank_pick),
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Startup benchmark for the MCP server: module import time and time to the first list_tools response.
+
+Run from the ai-agent-indexer-search directory:
+    python -m benchmarks.startup_benchmark --runs 5 --tool-profiles search full
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+SRC_DIR = Path(__file__).parent.parent.resolve() / "src"
+
+IMPORT_PROBE = (
+    "import time; start = time.perf_counter(); import mcp_server; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure_import(tool_profile: str) -> float:
+    """Seconds spent importing mcp_server in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=SRC_DIR, env={**os.environ, "MCP_TOOL_PROFILE": tool_profile},
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+async def measure_first_list_tools(tool_profile: str) -> tuple:
+    """Seconds from spawning the server to its first list_tools reply, and the tool count."""
+    server_params = StdioServerParameters(
+        command=sys.executable,
+        args=[str(SRC_DIR / "mcp_server.py"), "--tool-profile", tool_profile],
+        env=dict(os.environ),
+    )
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        async with stdio_client(server_params, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                tools = (await session.list_tools()).tools
+                elapsed = time.perf_counter() - start
+    return elapsed, len(tools)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tool-profiles", nargs="+", default=["search", "full"])
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for tool_profile in args.tool_profiles:
+        imports = [measure_import(tool_profile) for _ in range(args.runs)]
+        first_list = [asyncio.run(measure_first_list_tools(tool_profile)) for _ in range(args.runs)]
+        results[tool_profile] = {
+            "tools": first_list[0][1],
+            "import_ms_median": round(statistics.median(imports) * 1000, 1),
+            "first_list_tools_ms_median": round(statistics.median(t for t, _ in first_list) * 1000, 1),
+            "first_list_tools_ms_min": round(min(t for t, _ in first_list) * 1000, 1),
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""ASGI entry point serving main.app with Gemini replaced by the scripted fake.
+
+Each uvicorn worker imports this module, so every worker gets the fake client.
+"""
+import os
+
+from benchmarks.stubs import install_fake_gemini
+from main import app
+
+install_fake_gemini(app, latency_ms=float(os.getenv("STUB_LLM_LATENCY_MS", "0")))
+
+__all__ = ["app"]
@@ -0,0 +1,151 @@
+"""Stand-ins for the Ollama embedding server and the Gemini client, used by the benchmarks."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+
+EMBED_DIM = 768
+
+# Words that say how a question is asked rather than what it is about; real embedding models
+# barely move for them, so "that page about X" and "where did I read about X" land together
+QUESTION_WORDS = {"a", "about", "again", "did", "do", "find", "i", "me", "page", "read", "that", "the", "was",
+                  "where", "which"}
+
+
+def stub_embedding(text: str, dim: int = EMBED_DIM, normalise: bool = True) -> list:
+    """Deterministic set-of-words vector, so texts sharing words land close together.
+
+    Words count once however often they repeat, which keeps filler words from
+    drowning out the few that identify a page; QUESTION_WORDS are left out. Unit
+    length unless `normalise` is False, like Ollama's /api/embed and /api/embeddings
+    respectively.
+    """
+    vec = [0.0] * dim
+    for word in set(re.findall(r"\w+", text.lower())) - QUESTION_WORDS:
+        h = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16)
+        vec[h % dim] += 1.0 if (h >> 64) & 1 else -1.0
+    norm = (math.sqrt(sum(v * v for v in vec)) or 1.0) if normalise else 1.0
+    return [v / norm for v in vec]
+
+
+class _EmbeddingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000)
+
+        if self.path == "/api/embeddings":
+            body = {"embedding": stub_embedding(payload.get("prompt", ""), normalise=False)}
+        elif self.path == "/api/embed":
+            inputs = payload.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            body = {"embeddings": [stub_embedding(text) for text in inputs]}
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubEmbeddingServer:
+    """Ollama-compatible /api/embeddings and /api/embed endpoints backed by stub_embedding."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0):
+        self._server = ThreadingHTTPServer((host, port), _EmbeddingHandler)
+        self._server.latency_ms = latency_ms
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def scripted_reply(prompt: str) -> str:
+    """Answer perception and plan prompts the way a well-behaved model would."""
+    if "Return the response as a Python dictionary" in prompt:
+        match = re.search(r'Input: "(.*?)"\n', prompt, re.S)
+        words = re.findall(r"\w+", match.group(1) if match else "")
+        return json.dumps({"intent": "find a visited url", "entities": words[:8], "tool_hint": "find_url_for_given_text"})
+
+    sources = re.findall(r"\[Source: (\S+?), ID:", prompt)
+    if sources:
+        return json.dumps({"response_type": "FINAL_ANSWER", "final_answer": sources[0], "reasoning_type": "lookup"})
+
+    match = re.search(r"Original task: (.*)", prompt)
+    task = match.group(1).strip() if match else ""
+    return json.dumps({"response_type": "FUNCTION_CALL", "tool": "find_url_for_given_text",
+                       "arguments": {"query": task}, "reasoning_type": "lookup"})
+
+
+def _fake_response(prompt: str) -> SimpleNamespace:
+    text = scripted_reply(prompt)
+    part = SimpleNamespace(text=text)
+    return SimpleNamespace(
+        text=text,
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+        usage_metadata=SimpleNamespace(prompt_token_count=len(prompt.split()), candidates_token_count=len(text.split())),
+    )
+
+
+class _FakeModels:
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+
+    def generate_content(self, model: str, contents: str) -> SimpleNamespace:
+        time.sleep(self.latency_ms / 1000)
+        return _fake_response(contents)
+
+
+class _FakeAsyncModels(_FakeModels):
+    async def generate_content(self, model: str, contents: str) -> SimpleNamespace:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return _fake_response(contents)
+
+
+class FakeGeminiClient:
+    """Mimics the parts of google.genai.Client the agent uses, with a fixed per-call latency."""
+
+    def __init__(self, latency_ms: float = 0):
+        self.models = _FakeModels(latency_ms)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(latency_ms))
+
+
+def install_fake_gemini(app, latency_ms: float = 0) -> FakeGeminiClient:
+    """Give the app the scripted fake as its Gemini client; its lifespan then keeps it instead of making a real one."""
+    client = FakeGeminiClient(latency_ms)
+    app.state.llm_client = client
+    return client
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the stub embedding server")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    server = StubEmbeddingServer(port=args.port, latency_ms=args.latency_ms)
+    print(f"Stub embedding server on {server.url}")
+    server._server.serve_forever()
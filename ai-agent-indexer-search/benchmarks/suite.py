@@ -0,0 +1,273 @@
+"""Offline benchmark suite: ingest, search and the full agent against stubbed Ollama and Gemini.
+
+Every stage runs on the same synthetic corpus of HTML pages, each with a query
+known to point at it, so the numbers are reproducible and comparable across runs:
+
+    ingest    pages/sec through POST /index-website and through the bulk indexer
+    search    find_url_for_given_text latency (p50/p99) and recall@1/@5 over MCP stdio
+    agent     /search-agent latency (p50/p99), iterations per query and recall@1
+
+Run from the ai-agent-indexer-search directory:
+    python -m benchmarks.suite --pages 200 --output benchmark-results.json
+    python -m benchmarks.suite --baseline benchmark-results.json   # exit 1 on regressions
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from benchmarks.corpus import synthetic_pages
+from benchmarks.stubs import StubEmbeddingServer
+
+PROJECT_ROOT = Path(__file__).parent.parent.resolve()
+SRC_DIR = PROJECT_ROOT / "src"
+
+# metric path -> True when higher is better; checked against --baseline
+TRACKED_METRICS = {
+    "ingest.single.pages_per_sec": True,
+    "ingest.bulk.pages_per_sec": True,
+    "search.p50_ms": False,
+    "search.p99_ms": False,
+    "search.recall_at_1": True,
+    "search.recall_at_5": True,
+    "agent.p50_ms": False,
+    "agent.p99_ms": False,
+    "agent.iterations_mean": False,
+    "agent.recall_at_1": True,
+    "agent.highlight_located": True,
+    "agent.paraphrased.p50_ms": False,
+    "agent.paraphrased.cache_hit_rate": True,
+    "agent.different.false_hit_rate": False,
+}
+
+
+def percentiles(latencies: list) -> dict:
+    ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+    }
+
+
+def recall_at(ranked: list, expected: list, k: int) -> float:
+    hits = sum(1 for urls, url in zip(ranked, expected) if url in urls[:k])
+    return round(hits / len(expected), 4) if expected else 0.0
+
+
+def bench_ingest_single(pages: list) -> dict:
+    """Pages/sec through the extension's endpoint: queue -> HTML -> markdown -> batched embedding -> log."""
+    from fastapi.testclient import TestClient
+    import chrome_website_indexer
+
+    with TestClient(chrome_website_indexer.app) as client:
+        start = time.perf_counter()
+        for page in pages:
+            client.post("/index-website", json={"url": page["url"], "body": page["body"]}).raise_for_status()
+        chrome_website_indexer.scheduler.wait_idle()  # the endpoint only queues the page
+        elapsed = time.perf_counter() - start
+    return {"pages": len(pages), "seconds": round(elapsed, 3), "pages_per_sec": round(len(pages) / elapsed, 2)}
+
+
+def bench_ingest_bulk(pages: list, index_dir: Path, workers: int) -> dict:
+    """Pages/sec through the bulk indexer's process pool and batched embeddings."""
+    from bulk_indexer import index_records
+
+    records = [{"url": page["url"], "body": page["body"]} for page in pages]
+    stats = index_records(records, workers=workers, index_dir=index_dir)
+    return {key: stats[key] for key in ("pages", "chunks", "seconds", "pages_per_sec")}
+
+
+async def bench_search(pages: list, env: dict) -> dict:
+    """Call find_url_for_given_text once per query over a real MCP stdio session."""
+    from src.action import source_urls
+
+    server_params = StdioServerParameters(
+        command=sys.executable,
+        args=[str(SRC_DIR / "mcp_server.py"), "--tool-profile", "search"],
+        env=env,
+    )
+    latencies, ranked = [], []
+    with open(os.devnull, "w") as devnull:
+        async with stdio_client(server_params, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                # First call loads the index from disk; keep it out of the timings
+                await session.call_tool("find_url_for_given_text", arguments={"query": pages[0]["query"]})
+                for page in pages:
+                    start = time.perf_counter()
+                    result = await session.call_tool("find_url_for_given_text", arguments={"query": page["query"]})
+                    latencies.append(time.perf_counter() - start)
+                    ranked.append(source_urls("\n".join(getattr(item, "text", "") for item in result.content)))
+
+    expected = [page["url"] for page in pages]
+    return {
+        "queries": len(pages),
+        **percentiles(latencies),
+        "recall_at_1": recall_at(ranked, expected, 1),
+        "recall_at_5": recall_at(ranked, expected, 5),
+    }
+
+
+def iterations_total(metrics_text: str) -> float:
+    return sum(float(value) for value in re.findall(r"^agent_iterations_sum\{[^}]*\} (\S+)$", metrics_text, re.M))
+
+
+def bench_agent(pages: list) -> dict:
+    """Drive /search-agent in-process with the scripted Gemini; iterations come from /metrics.
+
+    Every query is then asked again in other words, which the answer cache should serve, and
+    then for a note on the same subject that no page has, which it must not.
+    """
+    from fastapi.testclient import TestClient
+    from benchmarks.stub_app import app
+
+    latencies, iterations, answers, errors, located = [], [], [], 0, 0
+    with TestClient(app) as client:
+        client.post("/search-agent", json={"query": "warm up"})  # warm up the MCP pool, without caching a real query
+        before = iterations_total(client.get("/metrics").text)
+        for page in pages:
+            start = time.perf_counter()
+            response = client.post("/search-agent", json={"query": page["query"]})
+            latencies.append(time.perf_counter() - start)
+            after = iterations_total(client.get("/metrics").text)
+            iterations.append(after - before)
+            before = after
+            if response.status_code == 200:
+                answers.append([response.json()["url"]])
+                located += response.json().get("highlight_start") is not None
+            else:
+                answers.append([])
+                errors += 1
+
+        paraphrased_latencies, paraphrased_answers, cached = [], [], 0
+        for page in pages:
+            start = time.perf_counter()
+            response = client.post("/search-agent", json={"query": page["paraphrase"]})
+            paraphrased_latencies.append(time.perf_counter() - start)
+            body = response.json() if response.status_code == 200 else {}
+            paraphrased_answers.append([body["url"]] if body else [])
+            cached += bool(body.get("cached"))
+
+        false_hits = 0
+        for page in pages:
+            response = client.post("/search-agent", json={"query": page["different_query"]})
+            false_hits += response.status_code == 200 and bool(response.json().get("cached"))
+
+    return {
+        "queries": len(pages),
+        "errors": errors,
+        **percentiles(latencies),
+        "iterations_mean": round(float(np.mean(iterations)), 3),
+        "iterations_max": int(max(iterations)),
+        "recall_at_1": recall_at(answers, [page["url"] for page in pages], 1),
+        "highlight_located": round(located / len(pages), 4) if pages else 0.0,  # answers with a passage offset
+        "paraphrased": {
+            **percentiles(paraphrased_latencies),
+            "cache_hit_rate": round(cached / len(pages), 4) if pages else 0.0,
+            "recall_at_1": recall_at(paraphrased_answers, [page["url"] for page in pages], 1),
+        },
+        "different": {
+            "false_hit_rate": round(false_hits / len(pages), 4) if pages else 0.0,  # cached answers to new questions
+        },
+    }
+
+
+def lookup(results: dict, path: str):
+    for key in path.split("."):
+        results = results.get(key) if isinstance(results, dict) else None
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Tracked metrics that moved the wrong way by more than `tolerance` (a fraction)."""
+    regressions = []
+    for path, higher_is_better in TRACKED_METRICS.items():
+        current, previous = lookup(results, path), lookup(baseline, path)
+        if current is None or previous is None:
+            continue
+        if not previous:  # no relative change from zero, e.g. a false hit rate; any move the wrong way counts
+            if (current < 0) if higher_is_better else (current > 0):
+                regressions.append({"metric": path, "baseline": previous, "current": current, "change_pct": None})
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({"metric": path, "baseline": previous, "current": current,
+                                "change_pct": round(change * 100, 1)})
+    return regressions
+
+
+def git_commit() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--single-pages", type=int, default=50, help="extra pages ingested one request at a time")
+    parser.add_argument("--agent-queries", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="bulk indexer processes")
+    parser.add_argument("--embed-latency-ms", type=float, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    parser.add_argument("--baseline", type=Path, help="earlier results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative change before flagging")
+    args = parser.parse_args()
+
+    # Pages past --pages go through the single-page endpoint and stay in the index as distractors
+    corpus = synthetic_pages(args.pages + args.single_pages, seed=args.seed)
+    pages, extra_pages = corpus[:args.pages], corpus[args.pages:]
+    embed_server = StubEmbeddingServer(latency_ms=args.embed_latency_ms)
+    embed_url = embed_server.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = Path(tmp) / "faiss_index"
+        # The src modules read these at import time, so set them before importing any of them
+        os.environ.update({
+            "EMBED_BATCH_URL": f"{embed_url}/api/embed",
+            "FAISS_INDEX_DIR": str(index_dir),
+            "MCP_POOL_SIZE": "1",
+            "STUB_LLM_LATENCY_MS": str(args.llm_latency_ms),
+            "INGEST_DOMAIN_RATE": "0",  # measure indexing, not the per-domain rate limit
+        })
+        sys.path.insert(0, str(SRC_DIR))
+        try:
+            results = {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+                "ingest": {
+                    "single": bench_ingest_single(extra_pages),
+                    "bulk": bench_ingest_bulk(pages, index_dir, args.workers),
+                },
+            }
+            results["search"] = asyncio.run(bench_search(pages, dict(os.environ)))
+            results["agent"] = bench_agent(pages[:args.agent_queries])
+        finally:
+            embed_server.stop()
+
+    regressions = []
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        results["regressions"] = regressions
+
+    args.output.write_text(json.dumps(results, indent=2))
+    print(json.dumps(results, indent=2))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
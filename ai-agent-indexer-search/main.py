@@ -1,84 +1,250 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from google import genai
+from mcp import StdioServerParameters
 import asyncio
+import json
+import os
+import sys
+from src.mcp_pool import MCPSessionPool
+from src.telemetry import counter, histogram, render_metrics, span
 from src.memory_data import update_user_query, get_recent_memory_interactions, add_interaction
 from src.perception import get_perception
 from src.plan import get_plan
-from src.action import execute_action
-from pydantic import BaseModel
-from typing import Any, Dict
+from src.action import best_hit, confident_url, execute_action, source_urls
+from src.highlight import locate_passage
+from src.answer_cache import AnswerCache
+from src.embedder import get_embedding
+from src.model import ActionOutput, PlanOutput
+from pydantic import BaseModel, Field
+from typing import Any, AsyncIterator, Dict, Optional
 
-app = Flask(__name__)
-CORS(app)
+load_dotenv()
+
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "4"))
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "120"))  # seconds before a silent MCP server is replaced
+WORKERS = int(os.getenv("SEARCH_AGENT_WORKERS", "4"))
+MCP_TOOL_PROFILE = os.getenv("MCP_TOOL_PROFILE", "search")  # tool groups of the MCP servers, see src/mcp_server.py
+FIRST_RETRIEVAL_TOOL = "find_url_for_given_text"
+# Search tools read only the shards of the requesting profile; the agent sets the argument, not the LLM
+PROFILE_SCOPED_TOOLS = {"find_url_for_given_text", "search_documents"}
+DEFAULT_PROFILE = "default"  # same as src/faiss_store.py
+PROFILE_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+# Stop without asking the LLM once the top hit's distance is this fraction of the runner-up URL's (0 disables);
+# not applied to reranked hits, where the distance order no longer holds
+EARLY_STOP_MARGIN = float(os.getenv("EARLY_STOP_MARGIN", "0.8"))
+# Reuse an earlier answer when a query's embedding is at least this similar (cosine) to the one it answered
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.9"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))  # answers kept per worker; 0 disables the cache
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+NO_RESULTS = "No results found for the query"
+
+AGENT_ITERATIONS = histogram("agent_iterations", "Perception/plan iterations per search", buckets=tuple(range(0, 16)))
+AGENT_REQUESTS = counter("agent_requests_total", "Searches handled, by outcome")
+AGENT_TOOL_CALLS = counter("agent_tool_calls_total", "Tool calls made by the agent, by whether MCP was called or the result reused")
+ANSWER_CACHE_LOOKUPS = counter("agent_answer_cache_lookups_total", "Answer cache lookups, by hit, miss or stale (page re-indexed)")
+
+answer_cache = AnswerCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One Gemini client per worker for perception and planning; benchmarks/stub_app.py sets a fake one beforehand
+    if getattr(app.state, "llm_client", None) is None:
+        app.state.llm_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    # One pool of MCP server processes per worker, shared by every request it serves
+    server_params = StdioServerParameters(
+        command=sys.executable,
+        args=["src/mcp_server.py", "--tool-profile", MCP_TOOL_PROFILE],
+        env=dict(os.environ)
+    )
+    app.state.mcp_pool = MCPSessionPool(server_params, size=MCP_POOL_SIZE, call_timeout=MCP_CALL_TIMEOUT)
+    with span("mcp_pool_start", size=MCP_POOL_SIZE):
+        await app.state.mcp_pool.start()
+    try:
+        yield
+    finally:
+        await app.state.mcp_pool.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# Configure CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Allows all origins
+    allow_credentials=True,
+    allow_methods=["*"],  # Allows all methods
+    allow_headers=["*"],  # Allows all headers
+)
 
 class InputSearchQuery(BaseModel):
     query: str
+    profile: str = Field(default=DEFAULT_PROFILE, pattern=PROFILE_PATTERN)  # browser profile to search
 
 class OutputSearchQuery(BaseModel):
-    url: str
+    url: Optional[str] = None
+    highlight_text: Optional[str] = None
+    # Character offsets in the page text as indexed: the best chunk and the sentence to highlight in it
+    chunk_start: Optional[int] = None
+    chunk_end: Optional[int] = None
+    highlight_start: Optional[int] = None
+    highlight_end: Optional[int] = None
+    cached: bool = False  # answered from the answer cache without searching
 
-@app.route("/search-agent", methods=["POST"])
-async def search_text():
-    data = request.get_json()
-    query = data.get("query")
+@app.post("/search-agent")
+async def search_text(data: InputSearchQuery):
+    query = data.query
     if not query:
-        return jsonify({"detail": "'query' is required"}), 400
+        raise HTTPException(status_code=400, detail="'query' is required")
 
     print("INFO", f"Processing query: {query}")
-    output_search_query: OutputSearchQuery = await agent_process(query)
+    output_search_query = await agent_process(query, data.profile)
     print("INFO", f"Response data: {output_search_query}")
+    return {"query": query, **output_search_query.model_dump()}
+
+@app.post("/search-agent/stream")
+async def search_text_stream(data: InputSearchQuery):
+    """Stream newline-delimited JSON events: candidate URLs first, then refinements, then the final answer."""
+    query = data.query
+    if not query:
+        raise HTTPException(status_code=400, detail="'query' is required")
 
-    if output_search_query.url is None:
-        return jsonify({"detail": "No results found for the query"}), 500
+    async def ndjson() -> AsyncIterator[str]:
+        done = False
+        async for event in agent_events(query, data.profile):
+            if event["type"] == "final":
+                event = {**event, "query": query}
+            done = done or event["type"] in ("final", "error")
+            yield json.dumps(event) + "\n"
+        if not done:
+            yield json.dumps({"type": "error", "detail": NO_RESULTS}) + "\n"
 
-    url = output_search_query.url
-    #highlight_text = output_search_query.get("highlight_text", "")
+    print("INFO", f"Streaming query: {query}")
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
-    response = {
-        "query": query,
-        "url": url,
-        "highlight_text": query
-    }
-    return jsonify(response)
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint for this worker's latency histograms and counters"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
-async def agent_process(query: str) -> str:
+async def agent_process(query: str, profile: str = DEFAULT_PROFILE) -> OutputSearchQuery:
+    """The agent's answer; HTTP 500 with the same detail the stream reports when there is none"""
+    output_search_query, detail = None, NO_RESULTS
+    # Drain the generator so the pooled session is handed back before returning
+    async for event in agent_events(query, profile):
+        if event["type"] == "final":
+            output_search_query = OutputSearchQuery(**{key: value for key, value in event.items() if key != "type"})
+        elif event["type"] == "error":
+            detail = event["detail"]
+    if output_search_query is None:
+        raise HTTPException(status_code=500, detail=detail)
+    return output_search_query
+
+async def agent_events(query: str, profile: str = DEFAULT_PROFILE) -> AsyncIterator[Dict[str, Any]]:
+    """Run the agent loop, yielding candidate URLs as soon as they are known and the final answer last."""
     print("ASSISTANT:", "Starting main execution...")
-    try:
-        print("ASSISTANT:", "Establishing connection to MCP server...")
-        server_params = StdioServerParameters(
-            command="python",
-            args=["src/mcp_server.py"]
-        )
-
-        async with stdio_client(server_params) as (read, write):
-            print("ASSISTANT:", "Connection established, creating session...")
-            async with ClientSession(read, write) as session:
-                print("ASSISTANT:", "Session created, initializing...")
-                await session.initialize()
+    pool: MCPSessionPool = app.state.mcp_pool
+    llm_client = app.state.llm_client
+    iteration = 0
+    outcome = "no_answer"
+    # (tool, arguments) -> result, so a repeated call never goes back to MCP
+    tool_results: Dict[str, ActionOutput] = {}
+
+    async def call_tool(plan_output: PlanOutput, session, **span_attrs) -> ActionOutput:
+        if plan_output.tool in PROFILE_SCOPED_TOOLS:
+            plan_output = plan_output.model_copy(update={"arguments": {**(plan_output.arguments or {}), "profile": profile}})
+        key = json.dumps([plan_output.tool, plan_output.arguments], sort_keys=True, default=str)
+        if key in tool_results:
+            print("ASSISTANT:", f"Reusing result of duplicate call to {plan_output.tool}")
+            AGENT_TOOL_CALLS.inc(tool=plan_output.tool, source="cache")
+            return tool_results[key]
+        with span("execute_action", tool=plan_output.tool, **span_attrs):
+            action_output = await execute_action(plan_output, session)
+            await pool.pull_spans(session)
+        AGENT_TOOL_CALLS.inc(tool=plan_output.tool, source="mcp")
+        tool_results[key] = action_output
+        return action_output
 
+    async def final(session, url: str, iterations: int) -> Dict[str, Any]:
+        # Point the client at the best passage of the answer, from the closest chunk of it the searches returned
+        hit = best_hit(tool_results.values(), url)
+        if hit is None:
+            passage = locate_passage("", query)
+        else:
+            passage = locate_passage(hit.text, query, hit.start, hit.end)
+        if query_vec is not None and url:
+            content_hash = await pool.url_hash(session, url, profile)
+            if content_hash:  # only pages in the index, so the entry can be checked against it later
+                answer_cache.add(profile, query_vec, query, url, content_hash, passage)
+        return {"type": "final", "url": url, "iterations": iterations, **passage}
+
+    async def cached_answer(session) -> Optional[Dict[str, Any]]:
+        found = answer_cache.lookup(profile, query_vec)
+        if found is None:
+            ANSWER_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        entry_id, entry = found
+        if await pool.url_hash(session, entry["url"], profile) != entry["content_hash"]:
+            print("ASSISTANT:", f"Cached answer {entry['url']} is stale, searching again")
+            answer_cache.invalidate(entry_id)
+            ANSWER_CACHE_LOOKUPS.inc(result="stale")
+            return None
+        print("ASSISTANT:", f"✅ Reusing the answer to {entry['query']!r} (similarity {entry['similarity']:.3f}): {entry['url']}")
+        ANSWER_CACHE_LOOKUPS.inc(result="hit")
+        return {"type": "final", "url": entry["url"], "iterations": 0, "cached": True, **entry["answer"]}
+
+    query_vec = None
+    if answer_cache.enabled and pool.supports_url_hash:
+        try:
+            with span("embed_query"):
+                query_vec = await asyncio.to_thread(get_embedding, query)
+        except Exception as e:
+            print("ASSISTANT:", f"Could not embed the query, skipping the answer cache: {e}")
+
+    try:
+        with span("agent_process", query_chars=len(query), profile=profile):
+            print("ASSISTANT:", "Borrowing MCP session from pool...")
+            async with pool.session() as session:
                 user_query = query
 
                 update_user_query(user_query)
                 print("ASSISTANT:", "-" * 50)
 
-                tools_result = await session.list_tools()
-                tools = tools_result.tools
-                tools_descriptions = "\n".join(
-                    f"- {tool.name}: {getattr(tool, 'description', 'No description')}" 
-                    for tool in tools
-                )
-                print("ASSISTANT:", f"Successfully retrieved {len(tools)} tools")
+                tools_descriptions = pool.tools_descriptions
+
+                if query_vec is not None:
+                    cached = await cached_answer(session)
+                    if cached:
+                        outcome = "cache"
+                        yield cached
+                        return
+
+                # Retrieve straight away so callers have candidates before the first LLM round trip
+                if FIRST_RETRIEVAL_TOOL in pool.tool_names:
+                    retrieval = PlanOutput(response_type="FUNCTION_CALL", tool=FIRST_RETRIEVAL_TOOL, arguments={"query": query})
+                    action_output = await call_tool(retrieval, session, stage="retrieval")
+                    add_interaction(input_text=f"Tool call: {action_output.tool} with {action_output.arguments}, got: {action_output.result}",
+                                     output_text=action_output.result)
+                    user_query = f"{query} \n You have called a tool {action_output.tool} with arguments {action_output.arguments}, result is: {action_output.result}."
+                    yield {"type": "candidates", "stage": "retrieval", "urls": source_urls(action_output.result)}
+
+                    url = confident_url(action_output.content, query, EARLY_STOP_MARGIN)
+                    if url:
+                        print("ASSISTANT:", f"✅ High-confidence match, skipping the LLM: {url}")
+                        outcome = "early_stop"
+                        yield await final(session, url, iteration)
+                        return
 
                 max_iterations = 15
-                iteration = 0
 
                 while iteration < max_iterations:
                     print("ASSISTANT:", f"--- Iteration {iteration + 1} ---")
-                   
+
                     # Perception
-                    perception_output = get_perception(user_query)
+                    with span("get_perception", iteration=iteration + 1):
+                        perception_output = await get_perception(user_query, llm_client)
                     print("ASSISTANT:", f"Perception Output: {perception_output}")
 
                     # Get Latest interaction in memory
@@ -86,38 +252,70 @@ async def agent_process(query: str) -> str:
                     print("ASSISTANT:", f"Recent Interactions fetched: {len(recent_memory_interactions)}")
 
                     # Plan
-                    plan_output = get_plan(perception_output, tools_descriptions, recent_memory_interactions)
+                    with span("get_plan", iteration=iteration + 1):
+                        plan_output = await get_plan(perception_output, tools_descriptions, recent_memory_interactions, llm_client)
                     print("ASSISTANT:", f"Plan Output: {plan_output}")
 
                     if plan_output.response_type == "FINAL_ANSWER":
                         print("ASSISTANT:", f"✅ FINAL RESULT: {plan_output}")
-                        return OutputSearchQuery(url=plan_output.final_answer)
+                        iteration += 1
+                        if not plan_output.final_answer:
+                            yield {"type": "error", "detail": f"{NO_RESULTS}: the agent answered without a URL"}
+                            return
+                        outcome = "final"
+                        yield await final(session, plan_output.final_answer, iteration)
+                        return
+
+                    if plan_output.response_type != "FUNCTION_CALL":
+                        # Unusable plan; ask again rather than failing the whole request
+                        print("ASSISTANT:", f"Plan was not usable, retrying: {plan_output.response_type}")
+                        iteration += 1
+                        continue
 
                     try:
                         # Action
-                        action_output = await execute_action(plan_output, session)
+                        action_output = await call_tool(plan_output, session, iteration=iteration + 1)
                         print("ASSISTANT:", f"Action Output: {action_output}")
 
-                        add_interaction(input_text=f"Tool call: {action_output.tool} with {action_output.arguments}, got: {action_output.result}", 
+                        add_interaction(input_text=f"Tool call: {action_output.tool} with {action_output.arguments}, got: {action_output.result}",
                                          output_text=action_output.result)
                         print("ASSISTANT:", f"Memory updated with action output: {action_output.result}")
 
                         user_query = f"{query} \n You have called a tool {action_output.tool} with arguments {action_output.arguments}, result is: {action_output.result}."
 
+                        urls = source_urls(action_output.result)
+                        if urls:
+                            yield {"type": "candidates", "stage": "refinement", "iteration": iteration + 1, "urls": urls}
+
+                        url = confident_url(action_output.content, query, EARLY_STOP_MARGIN)
+                        if url:
+                            print("ASSISTANT:", f"✅ High-confidence match, stopping: {url}")
+                            iteration += 1
+                            outcome = "early_stop"
+                            yield await final(session, url, iteration)
+                            return
+
                     except Exception as e:
                         print("ASSISTANT:", f"Failed to get LLM response: {e}")
+                        outcome = "error"
                         break
 
                     iteration += 1
 
     except Exception as e:
+        outcome = "error"
         print("ASSISTANT:", f"Error in main execution: {e}")
         import traceback
         traceback.print_exc()
-    except KeyboardInterrupt:
-        print("ASSISTANT:", "\nGoodbye!")
-
-    return None
+    finally:
+        AGENT_ITERATIONS.observe(iteration, outcome=outcome)
+        AGENT_REQUESTS.inc(outcome=outcome)
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=8081, debug=True)
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(
+        "main:app",
+        host="127.0.0.1",
+        port=8081,
+        workers=WORKERS
+    )
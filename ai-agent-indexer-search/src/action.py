@@ -1,4 +1,6 @@
 from mcp import ClientSession
+import re
+from typing import Iterable, List, NamedTuple, Optional
 from src.model import PlanOutput
 from mcp.types import TextContent
 from src.model import ActionOutput
@@ -29,5 +31,73 @@ async def execute_action(plan_output:PlanOutput, session:ClientSession) -> TextC
         arguments=plan_output.arguments,
         tool=plan_output.tool,
         raw_response=str(result),
-        result=str(iteration_result)
+        result=str(iteration_result),
+        content=iteration_result if isinstance(iteration_result, list) else [iteration_result]
     )
+
+
+def source_urls(result: str) -> List[str]:
+    """Return the distinct source URLs cited in a search tool result, best match first."""
+    urls = []
+    for url in re.findall(r"\[Source: (\S+?), ID:", result):
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+SEARCH_HIT = re.compile(r"\[Source: (\S+?), ID: \S+?, Distance: ([-+\d.eE]+)(?:, Rerank: ([-+\d.eE]+))?"
+                        r"(?:, Offsets: (\d+)-(\d+))?\]\s*$")
+
+
+class SearchHit(NamedTuple):
+    url: str
+    distance: float
+    text: str  # the chunk, plus its title/date header when the offsets are unknown
+    start: Optional[int]  # character offsets of the chunk in the page text
+    end: Optional[int]
+    rerank: Optional[float] = None  # cross-encoder score, higher is better, when the server reranked the hits
+
+
+def search_hits(content: List[str]) -> List[SearchHit]:
+    """Parse the hits out of a search tool result, best first"""
+    hits = []
+    for item in content:
+        match = SEARCH_HIT.search(item)
+        if not match:
+            continue
+        text = item[:match.start()].rstrip("\n")
+        start = end = None
+        if match.group(4) is not None:
+            start, end = int(match.group(4)), int(match.group(5))
+            text = text[len(text) - (end - start):]  # the chunk is the last end - start characters; drops the header
+        rerank = float(match.group(3)) if match.group(3) is not None else None
+        hits.append(SearchHit(match.group(1), float(match.group(2)), text, start, end, rerank))
+    return hits
+
+
+def best_hit(results: Iterable[ActionOutput], url: str) -> Optional[SearchHit]:
+    """The closest chunk of `url` in any of the search results seen so far"""
+    hits = [hit for result in results for hit in search_hits(result.content) if hit.url == url]
+    return min(hits, key=lambda hit: hit.distance, default=None)
+
+
+def confident_url(content: List[str], query: str, margin: float) -> Optional[str]:
+    """The top search hit's URL when it is clearly the answer, else None.
+
+    Either the hit contains the query text verbatim, or its distance is at most
+    `margin` times that of the best hit from any other URL. Hits from a single URL
+    say nothing about how close it is, so they never stop the search on distance,
+    nor do reranked hits, whose order the distances no longer follow.
+    """
+    hits = search_hits(content)
+    if not hits:
+        return None
+
+    top = hits[0]
+    phrase = " ".join(query.lower().split())
+    if len(phrase.split()) >= 4 and phrase in " ".join(top.text.lower().split()):
+        return top.url
+    runner_up = next((hit.distance for hit in hits if hit.url != top.url), None)
+    if margin > 0 and top.rerank is None and runner_up is not None and top.distance <= margin * runner_up:
+        return top.url
+    return None
@@ -0,0 +1,79 @@
+"""Answers to earlier searches, found again when a new query's embedding is close enough to theirs."""
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+import time
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+
+
+def _normalise(vector: np.ndarray) -> np.ndarray:
+    row = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+    return row / max(float(np.linalg.norm(row)), 1e-12)
+
+
+class AnswerCache:
+    """One inner-product index of unit-length query vectors per profile; the oldest entries go first.
+
+    Each entry keeps the content hash its URL had when the answer was given, so callers can
+    drop it with invalidate() once the page has been re-indexed or removed.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_entries: int = 1000, ttl_seconds: float = 86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._indexes: Dict[str, "faiss.IndexIDMap"] = {}
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()  # id -> entry, oldest first
+        self._next_id = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, profile: str, vector: np.ndarray) -> Optional[Tuple[int, dict]]:
+        """(entry id, entry) of the most similar earlier query, if its cosine similarity clears the threshold"""
+        index = self._indexes.get(profile)
+        query = _normalise(vector)
+        if index is None or index.ntotal == 0 or index.d != query.shape[1]:
+            return None
+        similarities, ids = index.search(query, 1)
+        entry_id = int(ids[0][0])
+        if entry_id < 0 or similarities[0][0] < self.threshold:
+            return None
+        entry = self._entries[entry_id]
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            self.invalidate(entry_id)
+            return None
+        return entry_id, {**entry, "similarity": float(similarities[0][0])}
+
+    def add(self, profile: str, vector: np.ndarray, query: str, url: str, content_hash: str, answer: dict) -> int:
+        """Remember `answer` (the response fields to return on a hit) for queries like this one"""
+        import faiss
+
+        row = _normalise(vector)
+        index = self._indexes.get(profile)
+        if index is None or index.d != row.shape[1]:
+            # New profile, or the embedding model changed and the old vectors are meaningless
+            for entry_id in [entry_id for entry_id, entry in self._entries.items() if entry["profile"] == profile]:
+                del self._entries[entry_id]
+            index = self._indexes[profile] = faiss.IndexIDMap(faiss.IndexFlatIP(row.shape[1]))
+
+        entry_id = self._next_id
+        self._next_id += 1
+        index.add_with_ids(row, np.array([entry_id], dtype=np.int64))
+        self._entries[entry_id] = {"profile": profile, "query": query, "url": url, "content_hash": content_hash,
+                                   "answer": answer, "created_at": time.time()}
+        while len(self._entries) > self.max_entries:
+            self.invalidate(next(iter(self._entries)))
+        return entry_id
+
+    def invalidate(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            self._indexes[entry["profile"]].remove_ids(np.array([entry_id], dtype=np.int64))
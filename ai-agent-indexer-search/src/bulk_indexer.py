@@ -0,0 +1,306 @@
+"""Bulk (re-)indexing of saved pages: extraction fans out over a process pool, embeddings are batched.
+
+Input is either an NDJSON file with one {"url", "text" | "body", "profile"?, "title"?,
+"visited_at"?} object per line (e.g. an export of browsing history with page content)
+or a directory of saved HTML/documents. Pages go to the shard of their profile (--profile when a record has
+none). Run from the src directory:
+
+    python bulk_indexer.py history.ndjson --workers 8 --checkpoint backfill.manifest --profile alice
+    python bulk_indexer.py ~/saved_pages --checkpoint saved_pages.manifest
+
+The website indexer may keep running: each commit merges into a shard under its lock file
+(faiss_store.shard_lock), reloading it first if the indexer logged pages since. On Windows,
+where there is no lock file, stop the website indexer first.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+import argparse
+import html
+import io
+import json
+import multiprocessing
+import os
+import re
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+from telemetry import span
+from embedder import embed_texts
+from faiss_store import (DEFAULT_PROFILE, INDEX_DIR, add_embeddings, chunk_metadata, chunk_spans, compute_hash,
+                         candidate_shards, drop_urls, iso_time, load_store, mcp_log, save_store, shard_catalog,
+                         shard_dir, shard_lock, store_version)
+
+EMBED_BATCH_SIZE = 64
+CHECKPOINT_EVERY = 500  # pages between saves of the store and the manifest
+DOCUMENT_SUFFIXES = {".html", ".htm", ".mhtml", ".md", ".txt", ".pdf", ".docx", ".pptx", ".xlsx"}
+
+# Chrome's "Save page as" writes the original address into the file as <!-- saved from url=(0042)https://... -->
+SAVED_FROM_URL = re.compile(r"<!-- saved from url=\(\d+\)(\S+?) -->")
+HTML_TITLE = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+
+def html_to_markdown(html_body: str) -> str:
+    from markitdown import MarkItDown, StreamInfo
+    stream = io.BytesIO(html_body.encode("utf-8"))
+    return MarkItDown().convert_stream(stream, stream_info=StreamInfo(mimetype="text/html", extension=".html", charset="utf-8")).text_content
+
+
+def html_title(html_body: str) -> Optional[str]:
+    match = HTML_TITLE.search(html_body[:65536])
+    return html.unescape(" ".join(match.group(1).split())) if match else None
+
+
+def extract_page(record: dict) -> Optional[dict]:
+    """Turn one input record into its chunks. Runs in a worker process."""
+    try:
+        title = record.get("title")
+        if record.get("text") is not None:
+            text = record["text"]
+        elif record.get("body") is not None:
+            text = html_to_markdown(record["body"])
+            title = title or html_title(record["body"])
+        else:
+            from markitdown import MarkItDown
+            text = MarkItDown().convert(record["path"]).text_content
+            title = title or Path(record["path"]).stem
+        return {
+            "url": record["url"],
+            "profile": record["profile"],
+            "shard": record["shard"],
+            "content_hash": record["content_hash"],
+            "title": title,
+            "visited_at": record["visited_at"],
+            "chunks": list(chunk_spans(text)),
+        }
+    except Exception as e:
+        mcp_log("ERROR", f"Failed to extract {record.get('url')}: {e}")
+        return None
+
+
+def read_ndjson(path: Path) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_documents(doc_path: Path) -> Iterator[dict]:
+    """Records for saved pages and documents in a directory tree"""
+    for file in sorted(doc_path.rglob("*")):
+        if not file.is_file() or file.suffix.lower() not in DOCUMENT_SUFFIXES:
+            continue
+        url = file.resolve().as_uri()
+        if file.suffix.lower() in (".html", ".htm"):
+            match = SAVED_FROM_URL.search(file.read_text(encoding="utf-8", errors="ignore")[:4096])
+            url = match.group(1) if match else url
+        yield {"url": url, "path": str(file), "visited_at": file.stat().st_mtime}
+
+
+def read_records(source: Path) -> Iterator[dict]:
+    return read_documents(source) if source.is_dir() else read_ndjson(source)
+
+
+def load_checkpoint(checkpoint: Optional[Path]) -> Dict[tuple, str]:
+    """(shard, url) -> content hash of every page a previous run already committed"""
+    if not checkpoint or not checkpoint.exists():
+        return {}
+    done = {}
+    for entry in read_ndjson(checkpoint):
+        done[(entry.get("shard"), entry["url"])] = entry["content_hash"]
+    return done
+
+
+def record_hash(record: dict) -> str:
+    if record.get("text") is not None:
+        return compute_hash(record["text"])
+    if record.get("body") is not None:
+        return compute_hash(record["body"])
+    return compute_hash(Path(record["path"]).read_bytes().decode("utf-8", errors="ignore"))
+
+
+def index_records(records: Iterable[dict], workers: Optional[int] = None, batch_size: int = EMBED_BATCH_SIZE,
+                  checkpoint: Optional[Path] = None, checkpoint_every: int = CHECKPOINT_EVERY,
+                  index_dir: Path = INDEX_DIR, profile: str = DEFAULT_PROFILE) -> dict:
+    """Extract, chunk and embed every record and add it to its shard in one pass.
+
+    The shards are saved, and the committed pages appended to the checkpoint manifest,
+    every `checkpoint_every` pages, so an interrupted run resumes where it stopped.
+    """
+    workers = workers or os.cpu_count() or 1
+    done = load_checkpoint(checkpoint)
+    stats = {"pages": 0, "chunks": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+
+    # Pages are extracted and embedded without holding any lock; commit() locks one shard at a
+    # time to merge them in, so the website indexer keeps serving uploads during a long backfill
+    with span("bulk_index", workers=workers):
+        staged: Dict[str, dict] = {}  # shard dir -> embedded pages waiting for the next commit
+        saved: Dict[str, tuple] = {}  # shard dir -> (store_version, [index, metadata, cache_meta]) as last saved
+        pending_chunks: List[str] = []
+        pending_metadata: List[dict] = []
+        pending_shards: List[str] = []
+        pending_pages: List[dict] = []
+        pending_keys = set()  # (shard, url) of the pending pages
+        uncommitted: List[dict] = []
+
+        def stage(shard: str, vectors: Optional[np.ndarray], rows: List[dict], pages: List[dict]) -> None:
+            entry = staged.setdefault(shard, {"vectors": [], "metadata": [], "hashes": {}})
+            replaced = {page["url"] for page in pages} & set(entry["hashes"])
+            if replaced and entry["metadata"]:
+                # A later version of a page staged earlier in this commit window replaces it
+                keep = np.asarray([data["url"] not in replaced for data in entry["metadata"]])
+                entry["vectors"] = [np.concatenate(entry["vectors"])[keep]]
+                entry["metadata"] = [data for data, kept in zip(entry["metadata"], keep) if kept]
+            if vectors is not None:
+                entry["vectors"].append(vectors)
+                entry["metadata"].extend(rows)
+            for page in pages:
+                entry["hashes"][page["url"]] = page["content_hash"]
+
+        def flush_embeddings() -> None:
+            embeddings = None
+            if pending_chunks:
+                with span("embed_batch", chunks=len(pending_chunks)):
+                    embeddings = embed_texts(pending_chunks, batch_size)
+            shard_of = np.asarray(pending_shards, dtype=object)
+            for shard in dict.fromkeys(page["shard"] for page in pending_pages):
+                pages = [page for page in pending_pages if page["shard"] == shard]
+                if embeddings is None or not pages:
+                    stage(shard, None, [], pages)
+                elif len(pages) == len(pending_pages):
+                    # Usual case: the whole block goes to one shard as is, without copying rows out
+                    stage(shard, embeddings, list(pending_metadata), pages)
+                else:
+                    rows = np.flatnonzero(shard_of == shard)
+                    stage(shard, embeddings[rows] if len(rows) else None,
+                          [pending_metadata[i] for i in rows], pages)
+            uncommitted.extend(pending_pages)
+            stats["chunks"] += len(pending_chunks)
+            pending_chunks.clear()
+            pending_metadata.clear()
+            pending_shards.clear()
+            pending_pages.clear()
+            pending_keys.clear()
+
+        def commit() -> None:
+            flush_embeddings()
+            # Committed pages replace what any other shard of their profile holds for them
+            # (with SHARD_BY=month, the month the page was first indexed in)
+            stale: Dict[str, set] = {}
+            for page in uncommitted:
+                for shard in map(str, candidate_shards(page["url"], page["profile"], index_dir)):
+                    if shard != page["shard"] and page["url"] in shard_catalog(Path(shard)).hashes:
+                        stale.setdefault(shard, set()).add(page["url"])
+            for shard in sorted(set(staged) | set(stale)):
+                entry = staged.get(shard, {"vectors": [], "metadata": [], "hashes": {}})
+                urls = stale.get(shard, set()) | set(entry["hashes"])
+                with shard_lock(Path(shard)):
+                    # Reload unless the copy this run saved last is still what is on disk
+                    version, store = saved.get(shard, (None, None))
+                    if store is None or version != store_version(Path(shard)):
+                        store = list(load_store(Path(shard)))
+                    store[0], store[1] = drop_urls(store[0], store[1], urls)
+                    for url in urls:
+                        store[2].pop(url, None)
+                    for vectors in entry["vectors"]:
+                        store[0] = add_embeddings(store[0], vectors)
+                    store[1].extend(entry["metadata"])
+                    store[2].update(entry["hashes"])
+                    save_store(*store, Path(shard))
+                    saved[shard] = (store_version(Path(shard)), store)
+            staged.clear()
+            if checkpoint and uncommitted:
+                with open(checkpoint, "a", encoding="utf-8") as f:
+                    for page in uncommitted:
+                        f.write(json.dumps(page) + "\n")
+            uncommitted.clear()
+
+        def wanted(records: Iterable[dict]) -> Iterator[dict]:
+            # Hash in the parent so unchanged pages never reach the pool
+            for record in records:
+                if not record.get("url") or not (record.get("text") or record.get("body") or record.get("path")):
+                    mcp_log("ERROR", f"Skipping record without url or content: {str(record)[:200]}")
+                    stats["failed"] += 1
+                    continue
+                try:
+                    shard = str(shard_dir(record.get("profile") or profile, record["url"], index_dir))
+                except ValueError as e:
+                    mcp_log("ERROR", f"Skipping {record['url']}: {e}")
+                    stats["failed"] += 1
+                    continue
+                try:
+                    record["visited_at"] = iso_time(record.get("visited_at"))
+                except (TypeError, ValueError) as e:
+                    mcp_log("ERROR", f"Skipping {record['url']}: bad visited_at: {e}")
+                    stats["failed"] += 1
+                    continue
+                record["shard"] = shard
+                record["profile"] = record.get("profile") or profile
+                record["content_hash"] = record_hash(record)
+                if (shard_catalog(Path(shard)).hashes.get(record["url"]) == record["content_hash"]
+                        or done.get((shard, record["url"])) == record["content_hash"]):
+                    stats["skipped"] += 1
+                    continue
+                done[(shard, record["url"])] = record["content_hash"]
+                yield record
+
+        # spawn, not fork: this also runs inside the multi-threaded indexer server
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, tqdm(desc="Indexing", unit="page") as progress:
+            remaining = wanted(records)
+            while True:
+                window = list(islice(remaining, workers * 4))
+                if not window:
+                    break
+                for page in pool.map(extract_page, window):
+                    progress.update(1)
+                    if page is None:
+                        stats["failed"] += 1
+                        continue
+                    if (page["shard"], page["url"]) in pending_keys:
+                        flush_embeddings()  # an earlier visit's content is pending; add it so this one replaces it
+                    pending_keys.add((page["shard"], page["url"]))
+                    for i, (chunk, chunk_start, chunk_end) in enumerate(page["chunks"]):
+                        pending_chunks.append(chunk)
+                        pending_metadata.append(chunk_metadata(page["url"], chunk, i, page["title"], page["visited_at"],
+                                                               chunk_start, chunk_end))
+                        pending_shards.append(page["shard"])
+                    pending_pages.append({"url": page["url"], "profile": page["profile"], "shard": page["shard"],
+                                          "content_hash": page["content_hash"], "chunks": len(page["chunks"])})
+                    stats["pages"] += 1
+
+                    if len(pending_chunks) >= batch_size:
+                        flush_embeddings()
+                    if stats["pages"] % checkpoint_every == 0:
+                        commit()
+        commit()
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["pages_per_sec"] = round(stats["pages"] / stats["seconds"], 2) if stats["seconds"] else 0.0
+    mcp_log("INFO", f"Bulk indexing finished: {stats}")
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", type=Path, help="NDJSON file or directory of saved pages")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks per embedding call")
+    parser.add_argument("--checkpoint", type=Path, help="manifest of committed pages, used to resume")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY)
+    parser.add_argument("--index-dir", type=Path, default=INDEX_DIR)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, help="profile for records that do not name one")
+    args = parser.parse_args()
+
+    stats = index_records(read_records(args.source), workers=args.workers, batch_size=args.batch_size,
+                          checkpoint=args.checkpoint, checkpoint_every=args.checkpoint_every,
+                          index_dir=args.index_dir, profile=args.profile)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,41 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from fastapi.middleware.cors import CORSMiddleware
-import hashlib
-import numpy as np
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field, ValidationError
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-import faiss
-import sys
-import requests
-import json
-from markitdown import MarkItDown
-from tqdm import tqdm
+from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+import os
+import gzip
+import uuid
+from faiss_store import (DEFAULT_PROFILE, PROFILE_PATTERN, SNAPSHOT_EVERY, candidate_shards,
+                         chunk_metadata, chunk_spans, compute_hash, indexed_hash, iso_time, load_store,
+                         log_page, log_visit, mcp_log, recover_stores, remove_from_other_shards, save_store,
+                         shard_catalog, shard_dir, shard_lock, to_timestamp)
+from bulk_indexer import EMBED_BATCH_SIZE, html_title, html_to_markdown, index_records
+from ingest_scheduler import IngestScheduler
+from telemetry import render_metrics, span
+from embedder import embed_texts
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Replay pages logged before a crash or restart into fresh snapshots before taking new ones
+    with span("recover_stores"):
+        recovered = await run_in_threadpool(recover_stores)
+    if recovered:
+        mcp_log("INFO", f"Recovered {recovered} shards from their write-ahead logs")
+    scheduler.start()
+    try:
+        yield
+    finally:
+        scheduler.stop()
+        bulk_pool.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -22,112 +46,232 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-EMBED_URL = "http://localhost:11434/api/embeddings"
-EMBED_MODEL = "nomic-embed-text"
-CHUNK_SIZE = 128
-CHUNK_OVERLAP = 30
-ROOT = Path(__file__).parent.resolve()
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", os.cpu_count() or 1))
+BULK_JOBS_KEPT = 100  # finished bulk jobs whose status can still be fetched
+# Revisits of an unchanged page closer together than this are not logged again; visit filters work in days
+VISIT_UPDATE_SECONDS = float(os.getenv("VISIT_UPDATE_SECONDS", "3600"))
+RECENT_VISITS = 10000  # (profile, url) -> last logged visit, for the above
+INGEST_MESSAGES = {
+    "queued": "Queued for indexing",
+    "coalesced": "Already queued, the latest content will be indexed",
+    "debounced": "Indexed recently, skipped",
+    "blocked": "Domain is not indexed, skipped",
+    "full": "Indexing queue is full, try again later",
+}
 
 class InputData(BaseModel):
     url: str
-    body: str
-
-def get_embedding(text: str) -> np.ndarray:
-    response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
-    response.raise_for_status()
-    return np.array(response.json()["embedding"], dtype=np.float32)
-
-def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    words = text.split()
-    for i in range(0, len(words), size - overlap):
-        yield " ".join(words[i:i+size])
-
-def mcp_log(level: str, message: str) -> None:
-    """Log a message to stderr to avoid interfering with JSON communication"""
-    sys.stderr.write(f"{level}: {message}\n")
-    sys.stderr.flush()
-
-def process_documents(url: str, html_body: str):
-    """Process a single document (URL) and create/update FAISS index"""
-    mcp_log("INFO", f"Indexing document for URL: {url}")
-    ROOT = Path(__file__).parent.resolve()
-    INDEX_CACHE = ROOT / "faiss_index"
-    INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
-
-    def compute_hash(content):
-        return hashlib.md5(content.encode('utf-8')).hexdigest()
-
-    CACHE_META = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
-    metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-    index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() else None
-
-    # Convert HTML body to markdown text
-    # Ensure the result is a string
-    markdown_text = str(MarkItDown().convert(str("data:"+html_body)))
-
-    # Compute hash for the markdown text
-    content_hash = compute_hash(url)
-    print(f"Content hash: {content_hash}")
-    if url in CACHE_META and CACHE_META[url] == content_hash:
-        mcp_log("SKIP", f"Skipping unchanged URL: {url}")
-        return
+    body: Optional[str] = None
+    text: Optional[str] = None  # page text already extracted by the extension; skips HTML conversion
+    profile: str = Field(default=DEFAULT_PROFILE, pattern=PROFILE_PATTERN)  # browser profile the page belongs to
+    title: Optional[str] = None
+    visited_at: Optional[datetime] = None  # when the page was visited; defaults to when it is indexed
 
+class VisitData(BaseModel):
+    url: str
+    profile: str = Field(default=DEFAULT_PROFILE, pattern=PROFILE_PATTERN)
+    visited_at: Optional[datetime] = None  # defaults to now
+
+def decode_body(raw: bytes, content_encoding: str) -> bytes:
+    """Undo the request's Content-Encoding (gzip or zstd)"""
+    encoding = content_encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return raw
+    if encoding not in ("gzip", "zstd"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {content_encoding}")
     try:
-        chunks = list(chunk_text(markdown_text))
-        embeddings_for_url = []
-        new_metadata = []
-        for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {url}")):
-            embedding = get_embedding(chunk)
-            embeddings_for_url.append(embedding)
-            new_metadata.append({"url": url, "chunk": chunk, "chunk_id": f"{url}_{i}"})
-
-        if embeddings_for_url:
-            if index is None:
-                dim = len(embeddings_for_url[0])
-                index = faiss.IndexFlatL2(dim)
-            index.add(np.stack(embeddings_for_url))
-            metadata.extend(new_metadata)
-
-        CACHE_META[url] = content_hash
+        if encoding == "gzip":
+            return gzip.decompress(raw)
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(raw)
     except Exception as e:
-        mcp_log("ERROR", f"Failed to process URL {url}: {e}")
+        raise HTTPException(status_code=400, detail=f"Could not decode {encoding} body: {e}")
 
-    CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
-    METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-    if index and index.ntotal > 0:
-        faiss.write_index(index, str(INDEX_FILE))
-        mcp_log("SUCCESS", "Saved FAISS index and metadata")
-    else:
-        mcp_log("WARN", "No new data or updates to process.")
-
-def ensure_faiss_ready():
-    from pathlib import Path
-    index_path = ROOT / "faiss_index" / "index.bin"
-    meta_path = ROOT / "faiss_index" / "metadata.json"
-    if not (index_path.exists() and meta_path.exists()):
-        mcp_log("INFO", "Index not found — running process_documents()...")
-        process_documents()
+def process_documents(url: str, html_body: Optional[str] = None, text: Optional[str] = None,
+                      profile: str = DEFAULT_PROFILE, title: Optional[str] = None,
+                      visited_at: Optional[datetime] = None):
+    """Process a single document (URL) and create/update the FAISS index of its profile shard.
+
+    Pass `text` when the page text is already extracted; otherwise `html_body` is converted to markdown.
+    """
+    mcp_log("INFO", f"Indexing document for URL: {url} (profile {profile})")
+    index_dir = shard_dir(profile, url)
+    with span("process_documents", profile=profile):
+        if _process_document(url, html_body, text, index_dir, title, iso_time(visited_at)):
+            remove_from_other_shards(url, profile, index_dir)
+
+def _process_document(url: str, html_body: Optional[str], text: Optional[str], index_dir: Path,
+                      title: Optional[str], visited_at: str) -> bool:
+    """Index the page into the shard, replacing its earlier chunks; False if unchanged.
+
+    Conversion and embedding run without the shard lock, which is held only to log the page
+    (and, every SNAPSHOT_EVERY pages, to fold the log into a snapshot). Raises when the page
+    cannot be embedded or logged, so the scheduler does not debounce it.
+    """
+    # Compute hash for the uploaded content
+    content_hash = compute_hash(text if text is not None else html_body)
+    mcp_log("INFO", f"Content hash: {content_hash}")
+    if shard_catalog(index_dir).hashes.get(url) == content_hash:
+        mcp_log("SKIP", f"Skipping unchanged URL: {url}")
+        return False
+
+    if text is not None:
+        markdown_text = text
     else:
-        mcp_log("INFO", "Index already exists. Skipping regeneration.")
+        # Convert HTML body to markdown text
+        with span("html_to_markdown", bytes=len(html_body)):
+            markdown_text = html_to_markdown(html_body)
+        title = title or html_title(html_body)
+
+    spans = list(chunk_spans(markdown_text))
+    rows, embeddings_for_url = [], None
+    if spans:
+        chunks = [chunk for chunk, _, _ in spans]
+        # One batched call for the whole page instead of a round trip per chunk
+        with span("embed", chunks=len(chunks)):
+            embeddings_for_url = embed_texts(chunks, EMBED_BATCH_SIZE)
+        rows = [chunk_metadata(url, chunk, i, title, visited_at, start, end)
+                for i, (chunk, start, end) in enumerate(spans)]
+    with shard_lock(index_dir):
+        # The log record replaces the page's earlier chunks when the store is loaded
+        if log_page(index_dir, url, content_hash, rows, embeddings_for_url) >= SNAPSHOT_EVERY:
+            save_store(*load_store(index_dir), index_dir)
+    return True
+
+# Uploads from the extension are indexed in the background, in priority order
+scheduler = IngestScheduler(process_documents)
+
+# Backfills run one at a time on their own thread, not in the request or the shared threadpool
+bulk_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-index")
+bulk_jobs: "OrderedDict[str, dict]" = OrderedDict()  # job id -> status, and stats once finished
+
+def run_bulk_job(job_id: str, records: list) -> None:
+    job = bulk_jobs[job_id]
+    job["status"] = "running"
+    try:
+        job.update(index_records(records, workers=BULK_WORKERS), status="finished")
+    except Exception as e:
+        mcp_log("ERROR", f"Bulk job {job_id} failed: {e}")
+        job.update(status="failed", detail=str(e))
+
+recent_visits: "OrderedDict[tuple, float]" = OrderedDict()
+
+def record_visit(url: str, profile: str = DEFAULT_PROFILE, visited_at: Optional[datetime] = None) -> str:
+    """Log a revisit of an indexed, unchanged page so visit-time filters see it.
+
+    Returns recorded, recent (logged within VISIT_UPDATE_SECONDS) or not_indexed.
+    """
+    visited_at = iso_time(visited_at)
+    timestamp = to_timestamp(visited_at)
+    if timestamp - recent_visits.get((profile, url), float("-inf")) < VISIT_UPDATE_SECONDS:
+        return "recent"
+    shard = next((shard for shard in candidate_shards(url, profile) if url in shard_catalog(shard).hashes), None)
+    if shard is None:
+        return "not_indexed"
+    with shard_lock(shard), span("record_visit", profile=profile):
+        if log_visit(shard, url, visited_at) >= SNAPSHOT_EVERY:
+            save_store(*load_store(shard), shard)
+        recent_visits[(profile, url)] = timestamp
+        recent_visits.move_to_end((profile, url))
+        while len(recent_visits) > RECENT_VISITS:
+            recent_visits.popitem(last=False)
+    return "recorded"
+
+@app.head("/index-website")
+async def index_website_status(url: str, request: Request,
+                               profile: str = Query(DEFAULT_PROFILE, pattern=PROFILE_PATTERN)):
+    """ETag-style check so the extension can skip uploading content that is already indexed"""
+    stored_hash = await run_in_threadpool(indexed_hash, url, profile)
+    if stored_hash is None:
+        return Response(status_code=404)
+
+    etag = f'"{stored_hash}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(status_code=200, headers={"ETag": etag})
 
 @app.post("/index-website")
-async def index_website(data: InputData):
-    if not data.url or not data.body:
-        raise HTTPException(status_code=400, detail="Both 'url' and 'body' are required")
+async def index_website(request: Request):
+    raw = decode_body(await request.body(), request.headers.get("content-encoding", ""))
+    try:
+        data = InputData.model_validate_json(raw)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
 
-    # Pass the URL and body to process_documents
-    mcp_log("INFO", f"Processing website: {data.url}")
-    process_documents(data.url, data.body)
+    if not data.url or not (data.body or data.text):
+        raise HTTPException(status_code=400, detail="'url' and one of 'body' or 'text' are required")
 
+    content_hash = compute_hash(data.text if data.text is not None else data.body)
+    stored_hash = await run_in_threadpool(indexed_hash, data.url, data.profile)
+    if stored_hash == content_hash:
+        mcp_log("SKIP", f"Content unchanged for URL: {data.url}")
+        await run_in_threadpool(record_visit, data.url, data.profile, data.visited_at)
+        return {"message": "Content unchanged, skipped", "url": data.url, "content_hash": content_hash}
+
+    # Queue the page for the scheduler's background thread; pages not in the index yet go first
+    decision = scheduler.submit(data.url, data.profile, refresh=stored_hash is not None, html_body=data.body,
+                                text=data.text, title=data.title,
+                                visited_at=data.visited_at or datetime.now(timezone.utc))
+    mcp_log("INFO", f"Ingest {decision}: {data.url}")
     response = {
-        "message": "Data processed successfully",
+        "message": INGEST_MESSAGES[decision],
+        "status": decision,
         "url": data.url,
-        "body": data.body
+        "profile": data.profile,
+        "content_hash": content_hash
     }
-    return response
+    if decision == "full":
+        return JSONResponse(response, status_code=429, headers={"Retry-After": "60"})
+    return JSONResponse(response, status_code=202 if decision in ("queued", "coalesced") else 200)
+
+@app.post("/index-website/visit")
+async def index_website_visit(data: VisitData):
+    """Record that an already indexed page was visited again (the extension's HEAD check returned 304)"""
+    status = await run_in_threadpool(record_visit, data.url, data.profile, data.visited_at)
+    return {"status": status, "url": data.url, "profile": data.profile}
+
+@app.post("/index-website/bulk")
+async def index_website_bulk(request: Request):
+    """Backfill many pages at once from an NDJSON body (one {"url", "text" | "body"} per line, gzip/zstd allowed).
+
+    Returns 202 with a job id straight away; GET /index-website/bulk/{job} reports progress.
+    """
+    raw = decode_body(await request.body(), request.headers.get("content-encoding", ""))
+    records = []
+    for line_number, line in enumerate(raw.decode("utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            data = InputData.model_validate_json(line)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Line {line_number}: {e.errors(include_url=False)}")
+        records.append(data.model_dump(mode="json"))
+
+    if not records:
+        raise HTTPException(status_code=400, detail="No records in request body")
+
+    job_id = uuid.uuid4().hex
+    bulk_jobs[job_id] = {"job": job_id, "status": "queued", "records": len(records)}
+    while len(bulk_jobs) > BULK_JOBS_KEPT and next(iter(bulk_jobs.values()))["status"] in ("finished", "failed"):
+        bulk_jobs.popitem(last=False)
+    response = {"message": "Bulk indexing queued", **bulk_jobs[job_id]}
+    bulk_pool.submit(run_bulk_job, job_id, records)
+    mcp_log("INFO", f"Bulk job {job_id} queued with {len(records)} pages")
+    return JSONResponse(response, status_code=202, headers={"Location": f"/index-website/bulk/{job_id}"})
+
+@app.get("/index-website/bulk/{job_id}")
+async def index_website_bulk_status(job_id: str):
+    """Status of a bulk job: queued, running, finished (with the indexing stats) or failed"""
+    job = bulk_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown bulk job: {job_id}")
+    return job
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint for ingest timings"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,157 @@
+"""Text embedding backends, chosen with EMBED_BACKEND.
+
+    ollama                 Ollama's HTTP API (default), /api/embed for queries and documents alike
+    sentence-transformers  in-process CPU model (PyTorch), batched, EMBED_THREADS threads
+    onnx                   the same model through ONNX Runtime, usually faster on CPU
+
+The local backends load EMBED_LOCAL_MODEL, by default the model Ollama serves as
+nomic-embed-text, so their vectors live in the same space. Every backend returns unit-length
+vectors, as /api/embed does; stores written by older versions through the unnormalised
+/api/embeddings are normalised in place when first loaded (faiss_store.normalise_store).
+After switching to another model, run `python faiss_store.py reembed`.
+
+Standard library and numpy only at import time (plus orjson when installed), so this can be
+imported as `src.embedder` or as `embedder` from inside src/.
+"""
+from typing import List, Optional
+import json
+import os
+import re
+import threading
+import warnings
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "ollama")
+EMBED_BATCH_URL = os.getenv("EMBED_BATCH_URL", "http://localhost:11434/api/embed")
+EMBED_MODEL = "nomic-embed-text"
+EMBED_LOCAL_MODEL = os.getenv("EMBED_LOCAL_MODEL", "nomic-ai/nomic-embed-text-v1.5")
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", os.cpu_count() or 1))
+EMBED_LOCAL_BATCH = int(os.getenv("EMBED_LOCAL_BATCH", "32"))
+
+
+def decode_vectors(body: bytes, key: str, rows: int) -> np.ndarray:
+    """The (rows, dim) float32 matrix under `key` in a JSON response.
+
+    orjson parses about five times faster than json when it is installed. Without it the
+    numbers are cut out of the raw bytes and parsed by numpy, so no Python float objects
+    are created; json is the last resort for anything unexpected.
+    """
+    if orjson is not None:
+        return np.asarray(orjson.loads(body)[key], dtype=np.float32).reshape(rows, -1)
+    match = re.search(rb'"' + key.encode() + rb'"\s*:\s*\[', body)
+    if match:
+        end = body.find(b"]]" if key == "embeddings" else b"]", match.end())
+        if end != -1:
+            numbers = body[match.end():end].replace(b"[", b" ").replace(b"]", b" ")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", DeprecationWarning)  # raised for unparsable input; caught by the size check
+                values = np.fromstring(numbers, dtype=np.float32, sep=",")
+            if values.size and values.size % rows == 0:
+                return values.reshape(rows, -1)
+    return np.asarray(json.loads(body)[key], dtype=np.float32).reshape(rows, -1)
+
+
+class Embedder:
+    """Turns texts into float32 vectors"""
+
+    name = ""
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32 array"""
+        raise NotImplementedError
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+class OllamaEmbedder(Embedder):
+    name = "ollama"
+
+    def __init__(self, batch_url: str = EMBED_BATCH_URL, model: str = EMBED_MODEL):
+        import requests
+
+        self.batch_url = batch_url
+        self.model = model
+        self._session = requests.Session()  # keeps the connection to Ollama open between calls
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self._session.post(self.batch_url, json={"model": self.model, "input": texts})
+        response.raise_for_status()
+        return decode_vectors(response.content, "embeddings", len(texts))
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """In-process CPU embedding; `backend` is "torch" or "onnx" (ONNX Runtime)"""
+
+    def __init__(self, model: str = EMBED_LOCAL_MODEL, backend: str = "torch", threads: int = EMBED_THREADS,
+                 batch_size: int = EMBED_LOCAL_BATCH):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = "onnx" if backend == "onnx" else "sentence-transformers"
+        self.batch_size = batch_size
+        model_kwargs = {}
+        if backend == "onnx":
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            model_kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+        else:
+            import torch
+
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model, device="cpu", backend=backend, trust_remote_code=True,
+                                         model_kwargs=model_kwargs)
+        self._lock = threading.Lock()  # one batch at a time; each already uses every thread
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                        normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def create_embedder(backend: str = EMBED_BACKEND, **kwargs) -> Embedder:
+    if backend == "ollama":
+        return OllamaEmbedder(**kwargs)
+    if backend == "sentence-transformers":
+        return SentenceTransformerEmbedder(backend="torch", **kwargs)
+    if backend == "onnx":
+        return SentenceTransformerEmbedder(backend="onnx", **kwargs)
+    raise ValueError(f"Unknown EMBED_BACKEND: {backend!r} (use ollama, sentence-transformers or onnx)")
+
+
+_embedder: Optional[Embedder] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> Embedder:
+    """The process-wide embedder for EMBED_BACKEND, created on first use"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = create_embedder()
+    return _embedder
+
+
+def get_embedding(text: str) -> np.ndarray:
+    return get_embedder().embed_one(text)
+
+
+def embed_texts(texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+    """(len(texts), dim) float32 array, embedded `batch_size` texts per call.
+
+    Each response is decoded into its own array; a single batch is returned as is and
+    several are joined with one np.concatenate, without per-chunk arrays or np.stack.
+    """
+    embedder = get_embedder()
+    if not batch_size or len(texts) <= batch_size:
+        return embedder.embed(texts)
+    return np.concatenate([embedder.embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
@@ -0,0 +1,754 @@
+"""On-disk FAISS store shared by the website indexer, the bulk indexer and the MCP server.
+
+Each browser profile gets its own shards under INDEX_DIR/profiles/<profile>/<shard>/,
+each holding the usual index.bin, metadata.json and doc_index_cache.json.
+SHARD_BY splits a profile further by site ("domain") or by month of indexing ("month").
+A flat index left directly in INDEX_DIR by older versions is searched as part of the default profile.
+
+Those three files are a snapshot, replaced atomically and completed by manifest.json
+(log sequence number and row counts). Pages indexed or revisited since the last snapshot
+live in wal.log, which load_store replays; `python faiss_store.py check` verifies every shard.
+
+Writers hold shard_lock, which adds an flock on the shard's store.lock to the in-process
+store_lock, so the website indexer, the bulk indexer CLI and this module's CLI can write
+the same shards at once. Where fcntl is missing (Windows) only threads are serialised:
+stop the website indexer before running either CLI there.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import urlparse
+import argparse
+import base64
+import contextvars
+import hashlib
+import heapq
+import json
+import os
+import re
+import sys
+import threading
+import zlib
+
+import faiss
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from telemetry import counter, span
+
+ROOT = Path(__file__).parent.resolve()
+INDEX_DIR = Path(os.getenv("FAISS_INDEX_DIR", ROOT / "faiss_index"))
+CHUNK_SIZE = 128
+CHUNK_OVERLAP = 30
+
+DEFAULT_PROFILE = "default"
+PROFILE_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+SHARD_BY = os.getenv("SHARD_BY", "none")  # none | domain | month
+MAX_LOADED_SHARDS = int(os.getenv("MAX_LOADED_SHARDS", "32"))
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", min(8, os.cpu_count() or 1)))
+SNAPSHOT_EVERY = int(os.getenv("SNAPSHOT_EVERY", "50"))  # logged pages before a shard is snapshotted
+WAL_FILE = "wal.log"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "store.lock"
+
+SHARD_LOADS = counter("faiss_shard_loads_total", "Shards read from disk into the LRU cache")
+SHARD_EVICTIONS = counter("faiss_shard_evictions_total", "Shards dropped from the LRU cache")
+
+# Writers in one process take this lock around load -> modify -> save; shard_lock adds other processes
+store_lock = threading.RLock()
+_shard_locks: Dict[Path, list] = {}  # shard -> [open lock file, depth] while this process holds it
+
+
+@contextmanager
+def shard_lock(index_dir: Path) -> Iterator[None]:
+    """Hold store_lock and the shard's lock file, for a load -> modify -> save of the shard. Reentrant."""
+    with store_lock:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        key = index_dir.resolve()
+        held = _shard_locks.get(key)
+        if held:
+            held[1] += 1
+        else:
+            lock_file = open(key / LOCK_FILE, "a+b")
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            held = _shard_locks[key] = [lock_file, 1]
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if not held[1]:
+                del _shard_locks[key]
+                held[0].close()  # releases the flock
+
+
+def index_files(index_dir: Path = INDEX_DIR) -> Tuple[Path, Path, Path]:
+    """Paths of index.bin, metadata.json and doc_index_cache.json"""
+    return index_dir / "index.bin", index_dir / "metadata.json", index_dir / "doc_index_cache.json"
+
+
+def chunk_spans(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[str, int, int]]:
+    """(chunk, start, end) for overlapping windows of `size` words; each chunk is text[start:end]"""
+    words = [match.span() for match in re.finditer(r"\S+", text)]
+    for i in range(0, len(words), size - overlap):
+        start, end = words[i][0], words[min(i + size, len(words)) - 1][1]
+        yield text[start:end], start, end
+
+
+def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    for chunk, _, _ in chunk_spans(text, size, overlap):
+        yield chunk
+
+
+def compute_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def mcp_log(level: str, message: str) -> None:
+    """Log a message to stderr to avoid interfering with JSON communication"""
+    sys.stderr.write(f"{level}: {message}\n")
+    sys.stderr.flush()
+
+
+def domain_of(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def to_timestamp(value: Union[None, str, float, datetime]) -> Optional[float]:
+    """Epoch seconds for an ISO 8601 string, datetime or number; naive times are taken as UTC"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def iso_time(value: Union[None, str, float, datetime] = None) -> str:
+    """Normalise a visit time to ISO 8601 UTC, defaulting to now"""
+    timestamp = to_timestamp(value)
+    moment = datetime.now(timezone.utc) if timestamp is None else datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.isoformat(timespec="seconds")
+
+
+def chunk_metadata(url: str, chunk: str, i: int, title: Optional[str] = None, visited_at: Optional[str] = None,
+                   start: Optional[int] = None, end: Optional[int] = None) -> dict:
+    """Metadata stored next to each vector; title, domain and visit time are what searches filter on.
+    start and end are the chunk's character offsets in the indexed page text."""
+    return {"url": url, "chunk": chunk, "chunk_id": f"{url}_{i}", "title": title,
+            "domain": domain_of(url), "visited_at": visited_at, "start": start, "end": end}
+
+
+def read_manifest(index_dir: Path = INDEX_DIR) -> Optional[dict]:
+    """The last complete snapshot's manifest, None for stores written before manifests existed"""
+    manifest_file = index_dir / MANIFEST_FILE
+    return json.loads(manifest_file.read_text()) if manifest_file.exists() else None
+
+
+def _log_lines(index_dir: Path) -> Tuple[List[dict], int, int]:
+    """The write-ahead log's intact records (vectors still encoded), the bytes they span and the bytes after them.
+
+    Each line is "<crc32 hex> <json>"; reading stops at the first line that is cut short or fails its checksum,
+    which is where a crash while appending leaves the log.
+    """
+    wal_file = index_dir / WAL_FILE
+    raw = wal_file.read_bytes() if wal_file.exists() else b""
+    records, valid = [], 0
+    for line in raw.splitlines(keepends=True):
+        checksum, _, body = line.rstrip(b"\n").partition(b" ")
+        if not line.endswith(b"\n") or checksum != b"%08x" % zlib.crc32(body):
+            break
+        records.append(json.loads(body))
+        valid += len(line)
+    return records, valid, len(raw) - valid
+
+
+def read_log(index_dir: Path = INDEX_DIR) -> List[dict]:
+    """Intact write-ahead log records, with their vectors decoded to (n, dim) float32 arrays"""
+    records = _log_lines(index_dir)[0]
+    for record in records:
+        if "vectors" not in record:
+            continue  # a visit
+        vectors = np.frombuffer(base64.b64decode(record["vectors"]), dtype=np.float32)
+        record["vectors"] = vectors.reshape(len(record["metadata"]), -1) if record["metadata"] else None
+    return records
+
+
+class ShardCatalog:
+    """What lookups and appends need from a shard without reading its vectors: url -> content hash
+    (snapshot plus log), the last sequence number, and how many records and intact bytes the log holds"""
+
+    def __init__(self, version: tuple, hashes: Dict[str, str], seq: int, records: int, valid: int, torn: int):
+        self.version = version
+        self.hashes = hashes
+        self.seq = seq
+        self.records = records
+        self.valid = valid
+        self.torn = torn
+
+
+_catalogs: Dict[Path, ShardCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def shard_catalog(index_dir: Path = INDEX_DIR) -> ShardCatalog:
+    """The shard's catalog, read from disk only when its files changed since the last call.
+
+    log_page and save_store keep it current for the writes of this process, so the
+    website indexer parses the log once at startup rather than on every request.
+    """
+    version = store_version(index_dir)  # before reading, so a concurrent change is picked up next time
+    with _catalogs_lock:
+        catalog = _catalogs.get(index_dir)
+    if catalog is not None and catalog.version == version:
+        return catalog
+
+    records, valid, torn = _log_lines(index_dir)
+    manifest = read_manifest(index_dir)
+    snapshot_seq = manifest["seq"] if manifest else 0
+    cache_file = index_files(index_dir)[2]
+    hashes = json.loads(cache_file.read_text()) if cache_file.exists() else {}
+    for record in records:
+        if record["seq"] > snapshot_seq and "content_hash" in record:
+            _set_hash(hashes, record["url"], record["content_hash"])
+    catalog = ShardCatalog(version, hashes, max([record["seq"] for record in records] + [snapshot_seq]),
+                           len(records), valid, torn)
+    with _catalogs_lock:
+        _catalogs[index_dir] = catalog
+    return catalog
+
+
+def _set_hash(hashes: Dict[str, str], url: str, content_hash: Optional[str]) -> None:
+    if content_hash is None:
+        hashes.pop(url, None)
+    else:
+        hashes[url] = content_hash
+
+
+def log_page(index_dir: Path, url: str, content_hash: Optional[str], metadata: List[dict],
+             embeddings: Optional[np.ndarray]) -> int:
+    """Durably append one indexed page to the shard's write-ahead log; returns how many records the log holds.
+
+    The record replaces whatever the shard held for the URL; a content_hash of None with no
+    chunks removes the page. Call before changing the in-memory store, then save_store once
+    the log grows past SNAPSHOT_EVERY.
+    """
+    vectors = b"" if embeddings is None else np.ascontiguousarray(embeddings, dtype=np.float32).tobytes()
+    with span("log_page", chunks=len(metadata)):
+        return _append_log(index_dir, {"url": url, "content_hash": content_hash, "metadata": metadata,
+                                       "vectors": base64.b64encode(vectors).decode("ascii")})
+
+
+def log_visit(index_dir: Path, url: str, visited_at: str) -> int:
+    """Durably record a revisit of an indexed page, which moves its chunks' visited_at forward on replay"""
+    with span("log_visit"):
+        return _append_log(index_dir, {"url": url, "visited_at": visited_at})
+
+
+def _append_log(index_dir: Path, record: dict) -> int:
+    with shard_lock(index_dir):
+        catalog = shard_catalog(index_dir)
+        seq = catalog.seq + 1
+        body = json.dumps({"seq": seq, **record}).encode("utf-8")
+        line = b"%08x %s\n" % (zlib.crc32(body), body)
+        with open(index_dir / WAL_FILE, "ab") as f:
+            if catalog.torn:
+                mcp_log("WARN", f"Dropping {catalog.torn} bytes of an interrupted write from {index_dir / WAL_FILE}")
+                f.truncate(catalog.valid)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        with _catalogs_lock:
+            if "content_hash" in record:
+                _set_hash(catalog.hashes, record["url"], record["content_hash"])
+            catalog.seq = seq
+            catalog.records += 1
+            catalog.valid += len(line)
+            catalog.torn = 0
+            catalog.version = store_version(index_dir)
+        return catalog.records
+
+
+def load_store(index_dir: Path = INDEX_DIR) -> Tuple[Optional[faiss.Index], List[dict], Dict[str, str]]:
+    """Read the index, chunk metadata and url -> content hash map (empty when not created yet).
+
+    Rows beyond the manifest's count come from a snapshot that was cut short; they are dropped
+    and the pages logged since the manifest are replayed on top instead.
+    """
+    index_file, metadata_file, cache_file = index_files(index_dir)
+    manifest = read_manifest(index_dir)  # before the files, which a snapshot replaces first
+    cache_meta = json.loads(cache_file.read_text()) if cache_file.exists() else {}
+    metadata = json.loads(metadata_file.read_text()) if metadata_file.exists() else []
+    index = faiss.read_index(str(index_file)) if index_file.exists() else None
+
+    ntotal = index.ntotal if index is not None else 0
+    rows = min(len(metadata), ntotal, manifest["rows"] if manifest else ntotal)
+    if manifest and rows < manifest["rows"]:
+        mcp_log("ERROR", f"{index_dir} has {rows} rows but its manifest expects {manifest['rows']}")
+    if rows < len(metadata) or rows < ntotal:
+        mcp_log("WARN", f"Rolling {index_dir} back to its last complete snapshot ({rows} chunks)")
+        metadata = metadata[:rows]
+        if index is not None:  # None when the first snapshot stopped before writing index.bin
+            index.remove_ids(faiss.IDSelectorRange(rows, ntotal))
+        urls = {data["url"] for data in metadata}
+        cache_meta = {url: content_hash for url, content_hash in cache_meta.items() if url in urls}
+
+    snapshot_seq = manifest["seq"] if manifest else 0
+    for record in read_log(index_dir):
+        if record["seq"] <= snapshot_seq:
+            continue  # already in the snapshot; the log was not cleared before a crash
+        if "content_hash" not in record:
+            mark_visited(metadata, record["url"], record["visited_at"])
+            continue
+        if record["url"] in cache_meta:
+            index, metadata = drop_urls(index, metadata, {record["url"]})
+        if record["vectors"] is not None:
+            index = add_embeddings(index, record["vectors"])
+            metadata.extend(record["metadata"])
+        _set_hash(cache_meta, record["url"], record["content_hash"])
+    return index, metadata, cache_meta
+
+
+def _fsync_dir(directory: Path) -> None:
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _replace_file(path: Path, write) -> None:
+    """Write through `write(tmp_path)` and rename over `path`, so readers see the old file or the new one"""
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_store(index: Optional[faiss.Index], metadata: List[dict], cache_meta: Dict[str, str], index_dir: Path = INDEX_DIR) -> None:
+    """Write a snapshot of the whole store and clear the write-ahead log it now contains.
+
+    The manifest goes last: until it is replaced, load_store treats the new files as an
+    interrupted snapshot and rebuilds from the previous one plus the log. Callers that loaded
+    the store hold shard_lock from the load on, so no page is logged in between and then cleared.
+    """
+    index_file, metadata_file, cache_file = index_files(index_dir)
+    rows = index.ntotal if index is not None else 0
+    if rows != len(metadata):
+        raise ValueError(f"Refusing to save {index_dir}: {rows} vectors but {len(metadata)} metadata rows")
+
+    with shard_lock(index_dir), span("save_store", chunks=len(metadata)):
+        catalog = shard_catalog(index_dir)
+        seq = catalog.seq
+        _replace_file(cache_file, lambda tmp: tmp.write_text(json.dumps(cache_meta, indent=2)))
+        _replace_file(metadata_file, lambda tmp: tmp.write_text(json.dumps(metadata, indent=2)))
+        if rows > 0:
+            _replace_file(index_file, lambda tmp: faiss.write_index(index, str(tmp)))
+        _replace_file(index_dir / MANIFEST_FILE, lambda tmp: tmp.write_text(json.dumps(
+            {"seq": seq, "rows": rows, "urls": len(cache_meta), "saved_at": iso_time()}, indent=2)))
+        _fsync_dir(index_dir)
+        if catalog.valid or catalog.torn:
+            with open(index_dir / WAL_FILE, "r+b") as f:
+                f.truncate(0)
+                os.fsync(f.fileno())
+        with _catalogs_lock:
+            _catalogs[index_dir] = ShardCatalog(store_version(index_dir), dict(cache_meta), seq, 0, 0, 0)
+        if rows > 0:
+            mcp_log("SUCCESS", "Saved FAISS index and metadata")
+        else:
+            mcp_log("WARN", "No new data or updates to process.")
+
+
+def add_embeddings(index: Optional[faiss.Index], embeddings: np.ndarray) -> faiss.Index:
+    """Append a (n, dim) float32 block, creating the index on first use"""
+    if index is None:
+        index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+    return index
+
+
+def mark_visited(metadata: List[dict], url: str, visited_at: str) -> None:
+    """Move the visit time of the URL's chunks forward to `visited_at`"""
+    timestamp = to_timestamp(visited_at)
+    for data in metadata:
+        if data["url"] == url and (to_timestamp(data.get("visited_at")) or 0) < timestamp:
+            data["visited_at"] = visited_at
+
+
+def drop_urls(index: Optional[faiss.Index], metadata: List[dict],
+              urls: set) -> Tuple[Optional[faiss.Index], List[dict]]:
+    """Remove every chunk of the URLs, before their re-indexed chunks are added"""
+    stale = [i for i, data in enumerate(metadata) if data["url"] in urls]
+    if not stale:
+        return index, metadata
+    if index is not None:
+        index.remove_ids(np.asarray(stale, dtype=np.int64))  # the remaining rows keep their order
+    return index, [data for data in metadata if data["url"] not in urls]
+
+
+def remove_from_other_shards(url: str, profile: Optional[str], keep: Path, index_dir: Path = INDEX_DIR) -> None:
+    """Log the page's removal from every shard of the profile but `keep`, e.g. the month it was first indexed in"""
+    for shard in candidate_shards(url, profile, index_dir):
+        if shard != keep and url in shard_catalog(shard).hashes:
+            log_page(shard, url, None, [], None)
+
+
+def check_profile(profile: Optional[str]) -> str:
+    """The profile id to use, rejecting anything that is not safe as a directory name"""
+    profile = profile or DEFAULT_PROFILE
+    if not re.match(PROFILE_PATTERN, profile):
+        raise ValueError(f"Invalid profile id: {profile!r}")
+    return profile
+
+
+def shard_key(url: str) -> str:
+    if SHARD_BY == "domain":
+        host = (urlparse(url).hostname or "local").lower()
+        return re.sub(r"[^a-z0-9._-]", "_", host)
+    if SHARD_BY == "month":
+        return datetime.now(timezone.utc).strftime("%Y-%m")
+    return "all"
+
+
+def shard_dir(profile: Optional[str], url: str, index_dir: Path = INDEX_DIR) -> Path:
+    """Directory of the shard a page from this profile is written to"""
+    return index_dir / "profiles" / check_profile(profile) / shard_key(url)
+
+
+def profile_shards(profile: Optional[str], index_dir: Path = INDEX_DIR) -> List[Path]:
+    """Every shard directory holding an index for the profile"""
+    profile = check_profile(profile)
+    root = index_dir / "profiles" / profile
+    shards = sorted(shard for shard in root.iterdir() if has_store(shard)) if root.exists() else []
+    if profile == DEFAULT_PROFILE and has_store(index_dir):
+        shards.append(index_dir)
+    return shards
+
+
+def candidate_shards(url: str, profile: Optional[str], index_dir: Path = INDEX_DIR) -> List[Path]:
+    """Shards of the profile that may hold the URL, the one it is written to now first.
+
+    Under SHARD_BY=domain a URL always maps to the same shard, so only a legacy flat index is
+    added; otherwise any shard may hold it, e.g. the month the page was first indexed in.
+    """
+    target = shard_dir(profile, url, index_dir)
+    shards = profile_shards(profile, index_dir)
+    if SHARD_BY == "domain":
+        shards = [shard for shard in shards if shard == index_dir]
+    return [target] + [shard for shard in shards if shard != target]
+
+
+def has_store(shard: Path) -> bool:
+    """Whether the directory holds a snapshot or pages logged before the first one"""
+    return (shard / "index.bin").exists() or (shard / WAL_FILE).exists()
+
+
+def all_shards(index_dir: Path = INDEX_DIR) -> List[Path]:
+    """Every shard of every profile, plus a legacy flat index"""
+    profiles_dir = index_dir / "profiles"
+    shards = sorted(shard for shard in profiles_dir.glob("*/*") if has_store(shard)) if profiles_dir.exists() else []
+    return shards + ([index_dir] if has_store(index_dir) else [])
+
+
+def indexed_hash(url: str, profile: Optional[str] = DEFAULT_PROFILE, index_dir: Path = INDEX_DIR) -> Optional[str]:
+    """Hash of the content last indexed for the URL in the profile, None if it is not indexed"""
+    for shard in candidate_shards(url, profile, index_dir):
+        content_hash = shard_catalog(shard).hashes.get(url)
+        if content_hash:
+            return content_hash
+    return None
+
+
+class LoadedShard(NamedTuple):
+    index: faiss.Index
+    metadata: List[dict]
+    visited_at: np.ndarray    # epoch seconds per vector, NaN when unknown
+    domain_names: np.ndarray  # distinct domains in the shard
+    domain_codes: np.ndarray  # index into domain_names per vector
+
+
+def unit_length(index: Optional[faiss.Index], sample: int = 100) -> bool:
+    """Whether the first vectors of an index are unit length, as every embedding backend now returns.
+
+    Older stores were embedded through Ollama's /api/embeddings, which returns the same
+    vectors as /api/embed without normalising them; their oldest rows come first.
+    """
+    if index is None or not index.ntotal:
+        return True
+    norms = np.linalg.norm(index.reconstruct_n(0, min(sample, index.ntotal)), axis=1)
+    return bool(np.all(np.abs(norms - 1) < 1e-3))
+
+
+def normalised(index: Optional[faiss.Index]) -> Optional[faiss.Index]:
+    """The index itself when its vectors are unit length, else a copy with every vector scaled to it"""
+    if unit_length(index):
+        return index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    faiss.normalize_L2(vectors)
+    return add_embeddings(None, vectors)
+
+
+def normalise_store(shard: Path) -> bool:
+    """Scale a shard's vectors to unit length on disk, no embedder needed; False if they already were"""
+    with shard_lock(shard):
+        index, metadata, cache_meta = load_store(shard)
+        if unit_length(index):
+            return False
+        with span("normalise_store", shard=shard.name, rows=index.ntotal):
+            save_store(normalised(index), metadata, cache_meta, shard)
+    mcp_log("INFO", f"Normalised the vectors of {shard} to unit length")
+    return True
+
+
+_normalise_failed = set()  # shards already warned about
+
+
+def load_shard(shard: Path) -> LoadedShard:
+    """Read a shard (snapshot plus write-ahead log) and build the per-vector columns used for filtering.
+
+    A store written before every backend returned unit-length vectors is normalised on disk
+    the first time it is loaded; if that fails it is searched through a normalised copy.
+    """
+    index, metadata, _ = load_store(shard)
+    if index is None:
+        index = faiss.IndexFlatL2(1)
+    elif not unit_length(index):
+        try:
+            normalise_store(shard)
+        except OSError as e:
+            if shard not in _normalise_failed:
+                _normalise_failed.add(shard)
+                mcp_log("WARN", f"Could not normalise the vectors of {shard} on disk ({e}); "
+                                "`python faiss_store.py check --repair` will")
+        index = normalised(index)
+    visited_at = np.full(len(metadata), np.nan)
+    for i, data in enumerate(metadata):
+        try:
+            visited_at[i] = to_timestamp(data.get("visited_at")) or np.nan
+        except (TypeError, ValueError):
+            pass
+    # Chunks written before domains were recorded get theirs from the URL
+    domains = [data.get("domain") or domain_of(data["url"]) for data in metadata]
+    domain_names, domain_codes = np.unique(np.asarray(domains, dtype=object), return_inverse=True)
+    return LoadedShard(index, metadata, visited_at, domain_names, domain_codes)
+
+
+def domain_matches(domain: str, wanted: str) -> bool:
+    """"github.com" matches itself and subdomains; a bare "github" matches any github.* host"""
+    wanted = wanted.lower().strip().removeprefix("www.")
+    if domain == wanted or domain.endswith("." + wanted):
+        return True
+    return "." not in wanted and wanted in domain.split(".")
+
+
+def filter_mask(shard: LoadedShard, domain: Optional[str] = None, visited_after: Optional[float] = None,
+                visited_before: Optional[float] = None) -> Optional[np.ndarray]:
+    """Boolean mask of the vectors passing the filters, or None when there are no filters"""
+    if domain is None and visited_after is None and visited_before is None:
+        return None
+    mask = np.ones(len(shard.metadata), dtype=bool)
+    if domain:
+        codes = [code for code, name in enumerate(shard.domain_names) if domain_matches(name, domain)]
+        mask &= np.isin(shard.domain_codes, codes)
+    # NaN compares false, so chunks with an unknown visit time drop out of time-filtered searches
+    if visited_after is not None:
+        mask &= shard.visited_at >= visited_after
+    if visited_before is not None:
+        mask &= shard.visited_at < visited_before
+    return mask
+
+
+def store_version(shard: Path) -> tuple:
+    """Changes whenever a snapshot is written or a page is logged"""
+    paths = (*index_files(shard), shard / MANIFEST_FILE, shard / WAL_FILE)
+    return tuple((stat.st_mtime_ns, stat.st_size) for stat in (path.stat() for path in paths if path.exists()))
+
+
+class ShardCache:
+    """Loaded shards keyed by directory; the least recently used are dropped beyond max_shards"""
+
+    def __init__(self, max_shards: int = MAX_LOADED_SHARDS):
+        self.max_shards = max_shards
+        self._shards: "OrderedDict[Path, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, shard: Path) -> LoadedShard:
+        """The loaded shard, re-read when its files changed on disk"""
+        key = store_version(shard)
+        with self._lock:
+            cached = self._shards.get(shard)
+            if cached and cached[0] == key:
+                self._shards.move_to_end(shard)
+                return cached[1]
+
+        loaded = load_shard(shard)
+        SHARD_LOADS.inc()
+        with self._lock:
+            self._shards[shard] = (key, loaded)
+            self._shards.move_to_end(shard)
+            while len(self._shards) > self.max_shards:
+                evicted, _ = self._shards.popitem(last=False)
+                SHARD_EVICTIONS.inc()
+                mcp_log("INFO", f"Unloaded shard {evicted}")
+        return loaded
+
+
+_search_pool: Optional[ThreadPoolExecutor] = None
+
+
+def search_shards(shards: List[Path], query_vec: np.ndarray, k: int, cache: ShardCache,
+                  **filters) -> List[Tuple[float, dict]]:
+    """Search every shard in parallel and merge the hits into one top-k list of (distance, metadata).
+
+    `filters` (domain, visited_after, visited_before) are applied inside FAISS through an ID
+    selector, so only the vectors that pass are compared with the query.
+    """
+    global _search_pool
+
+    def search_one(shard: Path) -> List[Tuple[float, dict]]:
+        loaded = cache.get(shard)
+        if loaded.index.ntotal == 0:
+            return []
+        mask = filter_mask(loaded, **filters)
+        params, candidates = None, loaded.index.ntotal
+        if mask is not None:
+            candidates = int(mask.sum())
+            if candidates == 0:
+                return []
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(np.packbits(mask, bitorder="little")))
+        with span("index.search", shard=shard.name, ntotal=loaded.index.ntotal, candidates=candidates):
+            D, I = loaded.index.search(query_vec, min(k, candidates), params=params)
+        return [(float(distance), loaded.metadata[idx]) for distance, idx in zip(D[0], I[0]) if idx >= 0]
+
+    if len(shards) <= 1:
+        hits = [hit for shard in shards for hit in search_one(shard)]
+    else:
+        # faiss releases the GIL while searching, so shards really are searched concurrently
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="shard-search")
+        # Each task runs in a copy of the caller's context so its span joins the caller's trace
+        futures = [_search_pool.submit(contextvars.copy_context().run, search_one, shard) for shard in shards]
+        hits = [hit for future in futures for hit in future.result()]
+    return heapq.nsmallest(k, hits, key=lambda hit: hit[0])
+
+
+def recover_stores(index_dir: Path = INDEX_DIR) -> int:
+    """Fold every shard's write-ahead log into a fresh snapshot; returns how many shards were rewritten"""
+    recovered = 0
+    for shard in all_shards(index_dir):
+        with shard_lock(shard):
+            if check_shard(shard)["ok"] and not shard_catalog(shard).records:
+                continue
+            with span("recover_store", shard=shard.name):
+                index, metadata, cache_meta = load_store(shard)
+                save_store(normalised(index), metadata, cache_meta, shard)
+        recovered += 1
+    return recovered
+
+
+def reembed_store(shard: Path, batch_size: int = 64) -> int:
+    """Embed every chunk of a shard again with the current backend and rewrite its snapshot; returns the rows.
+
+    Only needed after switching to a different embedding model; normalise_store is enough for
+    stores of the same model embedded without normalisation.
+    """
+    from embedder import embed_texts
+
+    with shard_lock(shard):
+        _, metadata, cache_meta = load_store(shard)
+        index = None
+        if metadata:
+            index = add_embeddings(None, embed_texts([data["chunk"] for data in metadata], batch_size))
+        with span("reembed_store", shard=shard.name, rows=len(metadata)):
+            save_store(index, metadata, cache_meta, shard)
+    return len(metadata)
+
+
+def check_shard(shard: Path) -> dict:
+    """Row counts of a shard's files, manifest and log, and what disagrees between them"""
+    index_file, metadata_file, cache_file = index_files(shard)
+    manifest = read_manifest(shard)
+    index = faiss.read_index(str(index_file)) if index_file.exists() else None
+    metadata = json.loads(metadata_file.read_text()) if metadata_file.exists() else []
+    cache_meta = json.loads(cache_file.read_text()) if cache_file.exists() else {}
+    records, _, torn = _log_lines(shard)
+    report = {
+        "shard": str(shard),
+        "index_rows": index.ntotal if index is not None else 0,
+        "metadata_rows": len(metadata),
+        "cached_urls": len(cache_meta),
+        "manifest_rows": manifest["rows"] if manifest else None,
+        "logged_pages": len([record for record in records if record["seq"] > (manifest["seq"] if manifest else 0)]),
+        "torn_log_bytes": torn,
+        "problems": [],
+    }
+    problems = report["problems"]
+    if report["index_rows"] != len(metadata):
+        problems.append(f"index.bin has {report['index_rows']} rows, metadata.json {len(metadata)}")
+    if manifest and manifest["rows"] != report["index_rows"]:
+        problems.append(f"manifest.json expects {manifest['rows']} rows (interrupted snapshot)")
+    if manifest and manifest["urls"] != len(cache_meta):
+        problems.append(f"manifest.json expects {manifest['urls']} cached URLs, doc_index_cache.json has {len(cache_meta)}")
+    if not unit_length(index):
+        problems.append("vectors are not unit length (embedded through Ollama's /api/embeddings); --repair normalises them")
+    uncached = {data["url"] for data in metadata} - set(cache_meta)
+    if uncached:
+        problems.append(f"{len(uncached)} URLs have chunks but no content hash, e.g. {min(uncached)}")
+    for record in records:
+        rows = len(record.get("metadata", []))
+        dim = len(base64.b64decode(record["vectors"])) // 4 // rows if rows else None
+        if dim and index is not None and dim != index.d:
+            problems.append(f"logged page {record['url']} has {dim}-dimensional vectors, the index {index.d}")
+            break
+    report["ok"] = not problems
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the FAISS store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    check = commands.add_parser("check", help="verify row counts across index.bin, metadata.json, "
+                                              "doc_index_cache.json, the manifest and the log of every shard")
+    check.add_argument("--index-dir", type=Path, default=INDEX_DIR)
+    check.add_argument("--repair", action="store_true",
+                       help="rebuild inconsistent shards from their last snapshot and log, fold logs into snapshots "
+                            "and normalise vectors that are not unit length")
+    reembed = commands.add_parser("reembed", help="embed every stored chunk again with the current EMBED_BACKEND, "
+                                                  "after switching to another embedding model")
+    reembed.add_argument("--index-dir", type=Path, default=INDEX_DIR)
+    reembed.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.command == "reembed":
+        for shard in all_shards(args.index_dir):
+            mcp_log("INFO", f"Re-embedded {reembed_store(shard, args.batch_size)} chunks in {shard}")
+        return
+    if args.repair:
+        mcp_log("INFO", f"Rewrote {recover_stores(args.index_dir)} shards")
+    reports = [check_shard(shard) for shard in all_shards(args.index_dir)]
+    for report in reports:
+        status = "OK" if report["ok"] else "INCONSISTENT"
+        print(f"{status:12} {report['shard']}: {report['index_rows']} vectors, {report['metadata_rows']} metadata rows, "
+              f"{report['cached_urls']} URLs, {report['logged_pages']} logged pages"
+              + (f", {report['torn_log_bytes']} torn log bytes" if report["torn_log_bytes"] else ""))
+        for problem in report["problems"]:
+            print(f"{'':12}   {problem}")
+    if not all(report["ok"] for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Find the sentence of a search hit that best matches the query, for the extension to scroll to and highlight."""
+from typing import List, Optional, Tuple
+import re
+
+import numpy as np
+
+MAX_SPAN_WORDS = 40  # longer runs without sentence punctuation are cut into windows of this many words
+WORD = re.compile(r"\w+")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was were what when "
+    "where which who why will with you".split()
+)
+
+
+def sentence_spans(text: str, max_words: int = MAX_SPAN_WORDS) -> List[Tuple[int, int]]:
+    """(start, end) of each sentence or line in `text`, without surrounding whitespace"""
+    spans = []
+    start = 0
+    for match in [*SENTENCE_BREAK.finditer(text), None]:
+        end = match.start() if match else len(text)
+        words = [word.span() for word in re.finditer(r"\S+", text[start:end])]
+        for i in range(0, len(words), max_words):
+            window = words[i:i + max_words]
+            spans.append((start + window[0][0], start + window[-1][1]))
+        start = match.end() if match else end
+    return spans
+
+
+def query_terms(query: str) -> List[str]:
+    words = set(WORD.findall(query.lower()))
+    return sorted(words - STOPWORDS or words)
+
+
+def best_sentence(text: str, query: str) -> Optional[Tuple[int, int]]:
+    """Offsets in `text` of the sentence sharing the most query terms, or None if none shares any.
+
+    Terms are weighted by how few sentences contain them and scores are divided by the
+    square root of the sentence length, so a short sentence with the rare query words
+    wins over a long one that only repeats common ones. All sentences are scored at once.
+    """
+    spans = sentence_spans(text)
+    terms = np.array(query_terms(query))
+    if not spans or not terms.size:
+        return None
+
+    words = [(match.start(), match.group().lower()) for match in WORD.finditer(text)]
+    positions = np.fromiter((position for position, _ in words), dtype=np.int64, count=len(words))
+    tokens = np.array([token for _, token in words])
+    starts = np.array([start for start, _ in spans])
+    ends = np.array([end for _, end in spans])
+
+    sentence = np.searchsorted(starts, positions, side="right") - 1
+    inside = (sentence >= 0) & (positions < ends[np.maximum(sentence, 0)])
+    term = np.minimum(np.searchsorted(terms, tokens), terms.size - 1)
+    matched = inside & (terms[term] == tokens)
+
+    present = np.zeros((len(spans), terms.size), dtype=bool)
+    present[sentence[matched], term[matched]] = True
+    idf = np.log1p(len(spans) / np.maximum(present.sum(axis=0), 1))
+    lengths = np.bincount(sentence[inside], minlength=len(spans))
+    scores = (present @ idf) / np.sqrt(np.maximum(lengths, 1))
+
+    best = int(np.argmax(scores))
+    return spans[best] if scores[best] > 0 else None
+
+
+def locate_passage(chunk: str, query: str, chunk_start: Optional[int] = None,
+                   chunk_end: Optional[int] = None) -> dict:
+    """The text to highlight and, when the chunk's offsets in the page are known, where it is.
+
+    Falls back to the query itself when no sentence of the chunk shares a word with it.
+    """
+    span = best_sentence(chunk, query)
+    passage = {"highlight_text": chunk[span[0]:span[1]] if span else query,
+               "chunk_start": chunk_start, "chunk_end": chunk_end,
+               "highlight_start": None, "highlight_end": None}
+    if span and chunk_start is not None:
+        passage["highlight_start"], passage["highlight_end"] = chunk_start + span[0], chunk_start + span[1]
+    return passage
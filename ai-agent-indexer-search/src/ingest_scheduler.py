@@ -0,0 +1,210 @@
+"""Queue between the extension's page uploads and the embedder.
+
+The extension posts every completed navigation: redirects, single-page-app route changes,
+dashboards that reload every minute. The website indexer hands them to IngestScheduler,
+which indexes them one at a time in a background thread and
+  - drops pages from INGEST_BLOCKLIST domains, or outside INGEST_ALLOWLIST when that is set,
+  - skips a URL visited again within INGEST_DEBOUNCE_SECONDS of being indexed (a failed
+    attempt does not count), and folds
+    repeat uploads of a URL that is still queued into one job with the latest content,
+  - indexes pages new to the index before refreshes of pages it already holds,
+  - starts at most INGEST_DOMAIN_RATE pages a minute per domain, in bursts of up to
+    INGEST_DOMAIN_BURST (0 turns the limit off).
+Queued pages are held in memory only; after a restart the extension uploads them again.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import heapq
+import os
+import threading
+import time
+
+from faiss_store import domain_matches, domain_of, mcp_log
+from telemetry import counter, gauge, histogram, span
+
+
+def _domains(value: str) -> List[str]:
+    return [domain.strip() for domain in value.split(",") if domain.strip()]
+
+
+INGEST_ALLOWLIST = _domains(os.getenv("INGEST_ALLOWLIST", ""))
+INGEST_BLOCKLIST = _domains(os.getenv("INGEST_BLOCKLIST", ""))
+INGEST_DEBOUNCE_SECONDS = float(os.getenv("INGEST_DEBOUNCE_SECONDS", "300"))
+INGEST_DOMAIN_RATE = float(os.getenv("INGEST_DOMAIN_RATE", "6"))  # pages per minute per domain
+INGEST_DOMAIN_BURST = int(os.getenv("INGEST_DOMAIN_BURST", "3"))
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "1000"))
+RECENT_URLS = 10000  # indexed URLs remembered for debouncing
+
+NEW, REFRESH = 0, 1  # priorities, lowest first
+PRIORITY_NAMES = {NEW: "new", REFRESH: "refresh"}
+
+QUEUE_DEPTH = gauge("ingest_queue_depth", "Pages waiting to be indexed, by priority")
+DECISIONS = counter("ingest_decisions_total", "Page uploads by what the scheduler did with them")
+QUEUE_WAIT = histogram("ingest_queue_wait_seconds", "Time pages spent queued before indexing started")
+
+
+class TokenBucket:
+    """`rate` tokens a second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token and return 0, or return how many seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class IngestScheduler:
+    """Prioritised, rate-limited queue of pages for `handler(url=..., profile=..., **page)`, which raises on failure"""
+
+    def __init__(self, handler: Callable[..., None], allowlist: List[str] = INGEST_ALLOWLIST,
+                 blocklist: List[str] = INGEST_BLOCKLIST, debounce_seconds: float = INGEST_DEBOUNCE_SECONDS,
+                 domain_rate: float = INGEST_DOMAIN_RATE, domain_burst: int = INGEST_DOMAIN_BURST,
+                 max_queue: int = INGEST_QUEUE_MAX):
+        self.handler = handler
+        self.allowlist = allowlist
+        self.blocklist = blocklist
+        self.debounce_seconds = debounce_seconds
+        self.domain_rate = domain_rate / 60
+        self.domain_burst = domain_burst
+        self.max_queue = max_queue
+        self._heap: List[Tuple[int, int, tuple]] = []  # (priority, seq, key); stale entries are skipped
+        self._pending: Dict[tuple, dict] = {}  # (profile, url) -> job
+        self._recent: "OrderedDict[tuple, float]" = OrderedDict()  # (profile, url) -> when it was last indexed
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._seq = 0
+        self._running = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def allowed(self, url: str) -> bool:
+        if urlparse(url).scheme not in ("http", "https"):
+            return False
+        domain = domain_of(url)
+        if any(domain_matches(domain, blocked) for blocked in self.blocklist):
+            return False
+        return not self.allowlist or any(domain_matches(domain, allowed) for allowed in self.allowlist)
+
+    def submit(self, url: str, profile: str, refresh: bool, **page) -> str:
+        """Queue a page; returns queued, coalesced, debounced, blocked or full"""
+        key = (profile, url)
+        priority = REFRESH if refresh else NEW
+        with self._cond:
+            if not self.allowed(url):
+                decision = "blocked"
+            elif key in self._pending:
+                self._pending[key]["page"] = page  # keep its place in the queue, index the latest content
+                decision = "coalesced"
+            elif time.monotonic() - self._recent.get(key, float("-inf")) < self.debounce_seconds:
+                decision = "debounced"
+            elif len(self._pending) >= self.max_queue and not (priority == NEW and self._drop_newest_refresh()):
+                decision = "full"
+            else:
+                self._seq += 1
+                self._pending[key] = {"seq": self._seq, "priority": priority, "domain": domain_of(url),
+                                      "page": page, "queued_at": time.monotonic()}
+                heapq.heappush(self._heap, (priority, self._seq, key))
+                self._update_depth()
+                self._cond.notify_all()
+                decision = "queued"
+        DECISIONS.inc(decision=decision, priority=PRIORITY_NAMES[priority])
+        return decision
+
+    def _drop_newest_refresh(self) -> bool:
+        """Make room for a new page by dropping the refresh queued last"""
+        refreshes = [(job["seq"], key) for key, job in self._pending.items() if job["priority"] == REFRESH]
+        if not refreshes:
+            return False
+        _, key = max(refreshes)
+        del self._pending[key]
+        DECISIONS.inc(decision="dropped", priority=PRIORITY_NAMES[REFRESH])
+        return True
+
+    def _update_depth(self) -> None:
+        for priority, name in PRIORITY_NAMES.items():
+            QUEUE_DEPTH.set(sum(job["priority"] == priority for job in self._pending.values()), priority=name)
+
+    def _take_next(self, now: float) -> Tuple[Optional[Tuple[tuple, dict]], Optional[float]]:
+        """The best job whose domain may start now, else None and the seconds until one may"""
+        deferred, wait, chosen = [], None, None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            _, seq, key = entry
+            job = self._pending.get(key)
+            if job is None or job["seq"] != seq:
+                continue  # dropped to make room
+            if self.domain_rate > 0:
+                bucket = self._buckets.get(job["domain"])
+                if bucket is None:
+                    bucket = self._buckets[job["domain"]] = TokenBucket(self.domain_rate, self.domain_burst, now)
+                delay = bucket.take(now)
+                if delay > 0:
+                    deferred.append(entry)
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+            chosen = (key, self._pending.pop(key))
+            break
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        return chosen, wait
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    chosen, wait = self._take_next(time.monotonic())
+                    if chosen:
+                        break
+                    self._cond.wait(wait)
+                (profile, url), job = chosen
+                self._running += 1
+                self._update_depth()
+
+            priority = PRIORITY_NAMES[job["priority"]]
+            QUEUE_WAIT.observe(time.monotonic() - job["queued_at"], priority=priority)
+            indexed = False
+            try:
+                with span("ingest_job", priority=priority):
+                    self.handler(url=url, profile=profile, **job["page"])
+                indexed = True
+            except Exception as e:
+                mcp_log("ERROR", f"Failed to index {url}: {e}")
+            finally:
+                with self._cond:
+                    if indexed:  # a failed page may be retried as soon as it is uploaded again
+                        self._recent[(profile, url)] = time.monotonic()
+                        self._recent.move_to_end((profile, url))
+                        while len(self._recent) > RECENT_URLS:
+                            self._recent.popitem(last=False)
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def start(self) -> None:
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="ingest-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30) -> None:
+        """Stop after the page being indexed, if any; pages still queued are dropped"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until nothing is queued or being indexed; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._running, timeout)
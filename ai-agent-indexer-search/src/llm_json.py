@@ -0,0 +1,61 @@
+"""Lenient parsing of the JSON objects the LLM is asked to return."""
+from typing import Any, Dict
+import ast
+import json
+import re
+
+FENCE = re.compile(r"^```(?:json)?|```$", re.MULTILINE)
+
+# Double-quoted strings are matched first so nothing inside them is rewritten
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\bTrue\b|\bFalse\b|\bNone\b|=|,\s*(?=[}\]])')
+_REPLACEMENTS = {"True": "true", "False": "false", "None": "null", "=": ":"}
+_DECODER = json.JSONDecoder()
+
+
+def _fix_token(match: re.Match) -> str:
+    token = match.group(0)
+    if token.startswith('"'):
+        return token
+    if token.startswith(","):
+        return ""  # trailing comma
+    return _REPLACEMENTS[token]
+
+
+def repair_json(text: str) -> str:
+    """Fix the mistakes models make most: `"key"="value"`, Python literals, trailing commas, missing closers"""
+    repaired = _TOKEN.sub(_fix_token, text)
+    closers = []
+    for char in re.sub(r'"(?:[^"\\]|\\.)*"', '""', repaired):
+        if char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]" and closers:
+            closers.pop()
+    return repaired + "".join(reversed(closers))
+
+
+def parse_llm_json(text: str) -> Dict[str, Any]:
+    """Parse the first JSON object in an LLM reply, repairing it if needed; ValueError if there is none"""
+    clean = FENCE.sub("", text.strip()).strip()
+    start = clean.find("{")
+    if start == -1:
+        raise ValueError(f"No JSON object in: {clean[:200]}")
+    end = clean.rfind("}")
+    candidate = clean[start:end + 1] if end > start else clean[start:]
+
+    # raw_decode stops at the end of the first object, so text or objects after it are ignored
+    for attempt in (candidate, repair_json(candidate)):
+        try:
+            value, _ = _DECODER.raw_decode(attempt)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+
+    # Single-quoted, Python-style dictionaries
+    try:
+        value = ast.literal_eval(candidate)
+    except (ValueError, SyntaxError):
+        value = None
+    if isinstance(value, dict):
+        return value
+    raise ValueError(f"Could not parse JSON object from: {clean[:200]}")
@@ -0,0 +1,176 @@
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import AsyncIterator, List, Optional, Set
+from urllib.parse import quote
+from pydantic import AnyUrl
+import anyio
+import asyncio
+import json
+from src.telemetry import add_remote_spans, counter, span
+
+TRACE_RESOURCE = "trace://spans"
+URL_HASH_TEMPLATE = "index://url-hash/{profile}/{quoted_url}"
+REQUEST_TIMEOUT = 408  # McpError code when the server does not answer within the read timeout
+# Raised by a session whose server process has exited or whose pipes are closed
+TRANSPORT_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, OSError)
+
+SESSIONS_REPLACED = counter("mcp_sessions_replaced_total", "Pooled MCP sessions dropped after their server stopped answering")
+
+
+class PooledSession:
+    """A ClientSession that remembers when its server stopped answering, so the pool replaces it."""
+
+    def __init__(self, session: ClientSession, stop: asyncio.Event):
+        self._session = session
+        self._stop = stop
+        self.broken = False
+
+    def close(self) -> None:
+        """Let the task that owns the session shut it and its server down"""
+        self._stop.set()
+
+    def __getattr__(self, name):
+        attr = getattr(self._session, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            try:
+                return await attr(*args, **kwargs)
+            except TRANSPORT_ERRORS:
+                self.broken = True
+                raise
+            except McpError as e:
+                self.broken = self.broken or e.error.code == REQUEST_TIMEOUT
+                raise
+        return call
+
+
+class MCPSessionPool:
+    """Keep a fixed number of initialised MCP stdio sessions that requests borrow and return.
+
+    Each session lives in its own task, which starts and stops its server process. A session
+    whose server crashed or timed out is closed when it is returned and a new one takes its place.
+    """
+
+    def __init__(self, server_params: StdioServerParameters, size: int = 4, call_timeout: Optional[float] = None):
+        self.server_params = server_params
+        self.size = size
+        self.call_timeout = call_timeout
+        self.tools_descriptions: str = ""
+        self.tool_names: List[str] = []
+        self.supports_tracing = False
+        self.supports_url_hash = False
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._sessions: Set[PooledSession] = set()
+        self._servers: Set[asyncio.Task] = set()  # one per session, owning its server process
+        self._replacements: Set[asyncio.Task] = set()
+        self._closed = False
+
+    async def _serve(self, ready: asyncio.Future) -> None:
+        """Run one server process and its session until the pool closes it"""
+        timeout = timedelta(seconds=self.call_timeout) if self.call_timeout else None
+        try:
+            async with stdio_client(self.server_params) as (read, write), \
+                    ClientSession(read, write, read_timeout_seconds=timeout) as session:
+                await session.initialize()
+                stop = asyncio.Event()
+                pooled = PooledSession(session, stop)
+                self._sessions.add(pooled)
+                ready.set_result(pooled)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print("ASSISTANT:", f"MCP session closed with an error: {e!r}")
+
+    async def _open(self) -> PooledSession:
+        ready = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(self._serve(ready))
+        self._servers.add(task)
+        task.add_done_callback(self._servers.discard)
+        return await ready
+
+    async def _replace(self) -> None:
+        """Start a session in place of a broken one, retrying while the server fails to start"""
+        delay = 1.0
+        while not self._closed:
+            try:
+                self._idle.put_nowait(await self._open())
+                print("ASSISTANT:", "Replaced a broken MCP session")
+                return
+            except Exception as e:
+                print("ASSISTANT:", f"Could not start a replacement MCP session, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def start(self) -> None:
+        """Spawn the MCP server processes and fetch the tool list once."""
+        for session in await asyncio.gather(*(self._open() for _ in range(self.size))):
+            self._idle.put_nowait(session)
+
+        async with self.session() as session:
+            tools_result = await session.list_tools()
+            resources = (await session.list_resources()).resources
+            templates = (await session.list_resource_templates()).resourceTemplates
+        self.supports_tracing = any(str(resource.uri) == TRACE_RESOURCE for resource in resources)
+        self.supports_url_hash = any(template.uriTemplate == URL_HASH_TEMPLATE for template in templates)
+        tools = tools_result.tools
+        self.tool_names = [tool.name for tool in tools]
+        self.tools_descriptions = "\n".join(
+            f"- {tool.name}: {getattr(tool, 'description', 'No description')}"
+            for tool in tools
+        )
+        print("ASSISTANT:", f"MCP pool ready: {self.size} sessions, {len(tools)} tools")
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[PooledSession]:
+        """Borrow an idle session, waiting if all of them are busy."""
+        with span("mcp_session_wait"):
+            session = await self._idle.get()
+        try:
+            yield session
+        finally:
+            if session.broken and not self._closed:
+                print("ASSISTANT:", "MCP server stopped answering, replacing its session")
+                SESSIONS_REPLACED.inc()
+                self._sessions.discard(session)
+                session.close()
+                task = asyncio.create_task(self._replace())
+                self._replacements.add(task)
+                task.add_done_callback(self._replacements.discard)
+            else:
+                self._idle.put_nowait(session)
+
+    async def pull_spans(self, session: PooledSession) -> None:
+        """Attach the spans the server recorded for the last tool call to the current trace."""
+        if not self.supports_tracing:
+            return
+        result = await session.read_resource(AnyUrl(TRACE_RESOURCE))
+        for trace in json.loads(result.contents[0].text):
+            add_remote_spans(trace)
+
+    async def url_hash(self, session: PooledSession, url: str, profile: str) -> Optional[str]:
+        """Content hash the index holds for the URL in the profile, None when it is not indexed."""
+        if not self.supports_url_hash:
+            return None
+        uri = URL_HASH_TEMPLATE.format(profile=profile, quoted_url=quote(url, safe=""))
+        try:
+            result = await session.read_resource(AnyUrl(uri))
+        except Exception as e:
+            print("ASSISTANT:", f"Could not read {uri}: {e}")
+            return None
+        return result.contents[0].text or None
+
+    async def close(self) -> None:
+        """Shut down every session and its server process."""
+        self._closed = True
+        for task in list(self._replacements):
+            task.cancel()
+        for session in list(self._sessions):
+            session.close()
+        await asyncio.gather(*self._replacements, *self._servers, return_exceptions=True)
@@ -2,164 +2,173 @@
 from mcp.server.fastmcp import FastMCP, Image
 from mcp.server.fastmcp.prompts import base
 from mcp.types import TextContent
-from PIL import Image as PILImage
 import math
 import sys
-from pywinauto.application import Application
-import win32gui
-import win32con
 import time
-from rich.console import Console
 from pathlib import Path
-from markitdown import MarkItDown
-from mcp.server.fastmcp import FastMCP, Image
-from mcp.server.fastmcp.prompts import base
-from mcp.types import TextContent
-from PIL import Image as PILImage
-
-import sys
+import argparse
 import json
-import faiss
-import numpy as np
-import requests
-from tqdm import tqdm
-import hashlib
-
-EMBED_URL = "http://localhost:11434/api/embeddings"
-EMBED_MODEL = "nomic-embed-text"
-CHUNK_SIZE = 256
-CHUNK_OVERLAP = 40
+import os
+from urllib.parse import unquote
+from telemetry import drain_traces, span
+from embedder import get_embedding
+from reranker import RERANK_CANDIDATES, get_reranker
+from faiss_store import DEFAULT_PROFILE, ShardCache, indexed_hash, profile_shards, search_shards, to_timestamp
+
+# Paint automation (pywinauto, win32gui, win32con, PIL), rich and markitdown
+# are imported inside the tools that use them, so the search-only tool profile
+# starts quickly and the server also runs on machines without them.
+
 ROOT = Path(__file__).parent.resolve()
+INDEX_DIR = Path(os.getenv("FAISS_INDEX_DIR", ROOT / "faiss_index"))  # root of all profile shards
+
+paint_app = None
 
-console = Console()
 # instantiate an MCP server client
 mcp = FastMCP("Calculator")
 
+# Tools are collected per group and registered on the server at the bottom of
+# this file, depending on which groups the selected tool profile switches on
+# (not to be confused with the browser profile the search tools take).
+TOOL_GROUPS = {"search": [], "math": [], "paint": []}
+TOOL_PROFILES = {
+    "search": ["search"],
+    "full": ["search", "math", "paint"],
+}
+
+def tool(group: str):
+    """Mark a function as an MCP tool belonging to a tool group"""
+    def register(fn):
+        TOOL_GROUPS[group].append(fn)
+        return fn
+    return register
+
 #addition tool
-@mcp.tool()
+@tool("math")
 def add(a: int, b: int) -> int:
     """Add two numbers"""
-    print("CALLED: add(a: int, b: int) -> int:")
+    mcp_log("CALLED", "add(a: int, b: int) -> int:")
     return int(a + b)
 
-@mcp.tool()
+@tool("math")
 def add_list(l: list) -> int:
     """Add all numbers in a list"""
-    print("CALLED: add(l: list) -> int:")
+    mcp_log("CALLED", "add(l: list) -> int:")
     return sum(l)
 
 # subtraction tool
-@mcp.tool()
+@tool("math")
 def subtract(a: int, b: int) -> int:
     """Subtract two numbers"""
-    print("CALLED: subtract(a: int, b: int) -> int:")
+    mcp_log("CALLED", "subtract(a: int, b: int) -> int:")
     return int(a - b)
 
 # multiplication tool
-@mcp.tool()
+@tool("math")
 def multiply(a: int, b: int) -> int:
     """Multiply two numbers"""
-    print("CALLED: multiply(a: int, b: int) -> int:")
+    mcp_log("CALLED", "multiply(a: int, b: int) -> int:")
     return int(a * b)
 
 #  division tool
-@mcp.tool() 
+@tool("math")
 def divide(a: int, b: int) -> float:
     """Divide two numbers"""
-    print("CALLED: divide(a: int, b: int) -> float:")
+    mcp_log("CALLED", "divide(a: int, b: int) -> float:")
     return float(a / b)
 
 # power tool
-@mcp.tool()
+@tool("math")
 def power(a: int, b: int) -> int:
     """Power of two numbers"""
-    print("CALLED: power(a: int, b: int) -> int:")
+    mcp_log("CALLED", "power(a: int, b: int) -> int:")
     return int(a ** b)
 
 # square root tool
-@mcp.tool()
+@tool("math")
 def sqrt(a: int) -> float:
     """Square root of a number"""
-    print("CALLED: sqrt(a: int) -> float:")
+    mcp_log("CALLED", "sqrt(a: int) -> float:")
     return float(a ** 0.5)
 
 # cube root tool
-@mcp.tool()
+@tool("math")
 def cbrt(a: int) -> float:
     """Cube root of a number"""
-    print("CALLED: cbrt(a: int) -> float:")
+    mcp_log("CALLED", "cbrt(a: int) -> float:")
     return float(a ** (1/3))
 
 # factorial tool
-@mcp.tool()
+@tool("math")
 def factorial(a: int) -> int:
     """factorial of a number"""
-    print("CALLED: factorial(a: int) -> int:")
+    mcp_log("CALLED", "factorial(a: int) -> int:")
     return int(math.factorial(a))
 
 # log tool
-@mcp.tool()
+@tool("math")
 def log(a: int) -> float:
     """log of a number"""
-    print("CALLED: log(a: int) -> float:")
+    mcp_log("CALLED", "log(a: int) -> float:")
     return float(math.log(a))
 
 # remainder tool
-@mcp.tool()
+@tool("math")
 def remainder(a: int, b: int) -> int:
     """remainder of two numbers divison"""
-    print("CALLED: remainder(a: int, b: int) -> int:")
+    mcp_log("CALLED", "remainder(a: int, b: int) -> int:")
     return int(a % b)
 
 # sin tool
-@mcp.tool()
+@tool("math")
 def sin(a: int) -> float:
     """sin of a number"""
-    print("CALLED: sin(a: int) -> float:")
+    mcp_log("CALLED", "sin(a: int) -> float:")
     return float(math.sin(a))
 
 # cos tool
-@mcp.tool()
+@tool("math")
 def cos(a: int) -> float:
     """cos of a number"""
-    print("CALLED: cos(a: int) -> float:")
+    mcp_log("CALLED", "cos(a: int) -> float:")
     return float(math.cos(a))
 
 # tan tool
-@mcp.tool()
+@tool("math")
 def tan(a: int) -> float:
     """tan of a number"""
-    print("CALLED: tan(a: int) -> float:")
+    mcp_log("CALLED", "tan(a: int) -> float:")
     return float(math.tan(a))
 
 # mine tool
-@mcp.tool()
+@tool("math")
 def mine(a: int, b: int) -> int:
     """special mining tool"""
-    print("CALLED: mine(a: int, b: int) -> int:")
+    mcp_log("CALLED", "mine(a: int, b: int) -> int:")
     return int(a - b - b)
 
-@mcp.tool()
+@tool("paint")
 def create_thumbnail(image_path: str) -> Image:
     """Create a thumbnail from an image"""
-    print("CALLED: create_thumbnail(image_path: str) -> Image:")
+    mcp_log("CALLED", "create_thumbnail(image_path: str) -> Image:")
+    from PIL import Image as PILImage
     img = PILImage.open(image_path)
     img.thumbnail((100, 100))
     return Image(data=img.tobytes(), format="png")
 
-@mcp.tool()
+@tool("math")
 def strings_to_chars_to_int(input: str) -> list[int]:
     """Return the ASCII values of the characters in a word"""
-    print("CALLED: strings_to_chars_to_int(intput: str) -> list[int]:")
+    mcp_log("CALLED", "strings_to_chars_to_int(intput: str) -> list[int]:")
     return [int(ord(char)) for char in input]
 
-@mcp.tool()
+@tool("math")
 def int_list_to_exponential_sum(int_list: list) -> float:
     """Return sum of exponentials of numbers in a list"""
-    print("CALLED: int_list_to_exponential_sum(int_list: list) -> float:")
+    mcp_log("CALLED", "int_list_to_exponential_sum(int_list: list) -> float:")
     return sum(math.exp(i) for i in int_list)
 
-@mcp.tool()
+@tool("math")
 def verify_string_to_int(expression: str, expected: list) -> TextContent:
     """Verify if conversion of string to int is correct"""
 
@@ -177,7 +186,7 @@ def verify_string_to_int(expression: str, expected: list) -> TextContent:
             text=f"Error: {str(e)}"
         )
     
-@mcp.tool()
+@tool("math")
 def verify_int_to_exponential_sum(expression: list, expected: float) -> TextContent:
     """Verify if int to exponential sum is correct"""
     try:
@@ -194,10 +203,11 @@ def verify_int_to_exponential_sum(expression: list, expected: float) -> TextCont
             text=f"Error: {str(e)}"
         )
 
-@mcp.tool()
+@tool("paint")
 def verify_open_paint() -> TextContent:
     """Verify if paint was correctly opened"""
-    console.print("[blue]FUNCTION CALL:[/blue] verify()")
+    from rich.console import Console
+    Console(file=sys.stderr).print("[blue]FUNCTION CALL:[/blue] verify()")
     
     global paint_app
     is_correct = True if paint_app is not None else False
@@ -207,10 +217,10 @@ def verify_open_paint() -> TextContent:
         text=str(is_correct)
     )
 
-@mcp.tool()
+@tool("math")
 def fibonacci_numbers(n: int) -> list:
     """Return the first n Fibonacci Numbers"""
-    print("CALLED: fibonacci_numbers(n: int) -> list:")
+    mcp_log("CALLED", "fibonacci_numbers(n: int) -> list:")
     if n <= 0:
         return []
     fib_sequence = [0, 1]
@@ -219,7 +229,7 @@ def fibonacci_numbers(n: int) -> list:
     return fib_sequence[:n]
 
 
-@mcp.tool()
+@tool("paint")
 async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> dict:
     """Draw a rectangle in Paint from (x1,y1) to (x2,y2)"""
     global paint_app
@@ -279,7 +289,7 @@ async def draw_rectangle(x1: int, y1: int, x2: int, y2: int) -> dict:
             ]
         }
 
-@mcp.tool()
+@tool("paint")
 async def add_text_in_paint(text: str, x1: int, y1: int) -> dict:
     """Add text in Paint at (x1,y1)"""
     global paint_app
@@ -342,12 +352,16 @@ async def add_text_in_paint(text: str, x1: int, y1: int) -> dict:
             ]
         }
 
-@mcp.tool()
+@tool("paint")
 async def open_paint() -> dict:
     """Open Microsoft Paint maximized on primary monitor"""
     global paint_app
 
     try:
+        from pywinauto.application import Application
+        import win32gui
+        import win32con
+
         paint_app = Application().start('mspaint.exe')
         time.sleep(1)
         # Get the Paint window
@@ -380,15 +394,29 @@ async def open_paint() -> dict:
 @mcp.resource("greeting://{name}")
 def get_greeting(name: str) -> str:
     """Get a personalized greeting"""
-    print("CALLED: get_greeting(name: str) -> str:")
+    mcp_log("CALLED", "get_greeting(name: str) -> str:")
     return f"Hello, {name}!"
 
 
+# Spans recorded while serving tool calls; the agent reads this after each call
+@mcp.resource("trace://spans")
+def get_trace_spans() -> str:
+    """Spans recorded since the last read, as a JSON list of traces"""
+    return json.dumps(drain_traces())
+
+
+# Lets the agent tell whether a cached answer's page has been re-indexed or removed since
+@mcp.resource("index://url-hash/{profile}/{quoted_url}")
+def get_url_hash(profile: str, quoted_url: str) -> str:
+    """Content hash of the page last indexed for the URL (percent-encoded) in the profile, empty if none"""
+    return indexed_hash(unquote(quoted_url), profile, INDEX_DIR) or ""
+
+
 # DEFINE AVAILABLE PROMPTS
 @mcp.prompt()
 def review_code(code: str) -> str:
     return f"Please review this code:\n\n{code}"
-    print("CALLED: review_code(code: str) -> str:")
+    mcp_log("CALLED", "review_code(code: str) -> str:")
 
 
 @mcp.prompt()
@@ -399,16 +427,6 @@ def debug_error(error: str) -> list[base.Message]:
         base.AssistantMessage("I'll help debug that. What have you tried so far?"),
     ]
 
-def get_embedding(text: str) -> np.ndarray:
-    response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
-    response.raise_for_status()
-    return np.array(response.json()["embedding"], dtype=np.float32)
-
-def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    words = text.split()
-    for i in range(0, len(words), size - overlap):
-        yield " ".join(words[i:i+size])
-
 def mcp_log(level: str, message: str) -> None:
     """Log a message to stderr to avoid interfering with JSON communication"""
     sys.stderr.write(f"{level}: {message}\n")
@@ -417,107 +435,108 @@ def mcp_log(level: str, message: str) -> None:
 def process_documents():
     """Process documents and create FAISS index"""
     mcp_log("INFO", "Indexing documents with MarkItDown...")
-    ROOT = Path(__file__).parent.resolve()
+    from bulk_indexer import index_records, read_documents
     DOC_PATH = ROOT / "documents"
-    INDEX_CACHE = ROOT / "faiss_index"
-    INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
-
-    def file_hash(path):
-        return hashlib.md5(Path(path).read_bytes()).hexdigest()
-
-    CACHE_META = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
-    metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-    index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() else None
-    all_embeddings = []
-    converter = MarkItDown()
-
-    for file in DOC_PATH.glob("*.*"):
-        fhash = file_hash(file)
-        if file.name in CACHE_META and CACHE_META[file.name] == fhash:
-            mcp_log("SKIP", f"Skipping unchanged file: {file.name}")
-            continue
-
-        mcp_log("PROC", f"Processing: {file.name}")
-        try:
-            result = converter.convert(str(file))
-            markdown = result.text_content
-            chunks = list(chunk_text(markdown))
-            embeddings_for_file = []
-            new_metadata = []
-            for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file.name}")):
-                embedding = get_embedding(chunk)
-                embeddings_for_file.append(embedding)
-                new_metadata.append({"doc": file.name, "chunk": chunk, "chunk_id": f"{file.stem}_{i}"})
-            if embeddings_for_file:
-                if index is None:
-                    dim = len(embeddings_for_file[0])
-                    index = faiss.IndexFlatL2(dim)
-                index.add(np.stack(embeddings_for_file))
-                metadata.extend(new_metadata)
-            CACHE_META[file.name] = fhash
-        except Exception as e:
-            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
-
-    CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
-    METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-    if index and index.ntotal > 0:
-        faiss.write_index(index, str(INDEX_FILE))
-        mcp_log("SUCCESS", "Saved FAISS index and metadata")
-    else:
-        mcp_log("WARN", "No new documents or updates to process.")
+    if not DOC_PATH.exists():
+        mcp_log("WARN", f"No documents folder at {DOC_PATH}")
+        return
+    index_records(read_documents(DOC_PATH), index_dir=INDEX_DIR)
 
 def ensure_faiss_ready():
-    from pathlib import Path
-    index_path = ROOT / "faiss_index" / "index.bin"
-    meta_path = ROOT / "faiss_index" / "metadata.json"
-    if not (index_path.exists() and meta_path.exists()):
+    if not profile_shards(DEFAULT_PROFILE, INDEX_DIR):
         mcp_log("INFO", "Index not found — running process_documents()...")
         process_documents()
     else:
         mcp_log("INFO", "Index already exists. Skipping regeneration.")
 
-@mcp.tool()
-def search_documents(query: str) -> list[str]:
-    """Search for relevant content from uploaded documents."""
-    ensure_faiss_ready()
-    mcp_log("SEARCH", f"Query: {query}")
-    try:
-        index = faiss.read_index(str(ROOT / "faiss_index" / "index.bin"))
-        metadata = json.loads((ROOT / "faiss_index" / "metadata.json").read_text())
-        query_vec = get_embedding(query).reshape(1, -1)
-        D, I = index.search(query_vec, k=5)
-        results = []
-        for idx in I[0]:
-            data = metadata[idx]
-            results.append(f"{data['chunk']}\n[Source: {data['url']}, ID: {data['chunk_id']}]")
-        return results
-    except Exception as e:
-        return [f"ERROR: Failed to search: {str(e)}"]
+shard_cache = ShardCache()
 
-@mcp.tool()
-def find_url_for_given_text(query: str) -> list[str]:
-    """Searches for a url for a given query."""
-    ensure_faiss_ready()
-    mcp_log("SEARCH", f"Query: {query}")
-    try:
-        index = faiss.read_index(str(ROOT / "faiss_index" / "index.bin"))
-        metadata = json.loads((ROOT / "faiss_index" / "metadata.json").read_text())
-        query_vec = get_embedding(query).reshape(1, -1)
-        D, I = index.search(query_vec, k=5)
-        results = []
-        for idx in I[0]:
-            data = metadata[idx]
-            results.append(f"{data['chunk']}\n[Source: {data['url']}, ID: {data['chunk_id']}]")
-        return results
-    except Exception as e:
-        return [f"ERROR: Failed to search: {str(e)}"]
+def search_filters(domain: str = None, visited_within_days: float = None, visited_after: str = None,
+                   visited_before: str = None) -> dict:
+    """Keyword arguments for search_shards from the search tools' optional filter arguments"""
+    after = to_timestamp(visited_after)
+    if visited_within_days:
+        after = max(after or 0.0, time.time() - float(visited_within_days) * 86400)
+    return {"domain": domain or None, "visited_after": after, "visited_before": to_timestamp(visited_before)}
+
+def search_index(tool_name: str, query: str, profile: str = DEFAULT_PROFILE, k: int = 5, **filters) -> list[str]:
+    """Embed the query and return the closest chunks across the profile's shards with their source URLs"""
+    mcp_log("SEARCH", f"Query: {query} (profile {profile}, filters {filters})")
+    with span(f"tool.{tool_name}", profile=profile):
+        try:
+            if profile == DEFAULT_PROFILE:
+                ensure_faiss_ready()
+            shards = profile_shards(profile, INDEX_DIR)
+            if not shards:
+                return []
+            with span("get_embedding"):
+                query_vec = get_embedding(query).reshape(1, -1)
+            # With a reranker, over-fetch and let it pick the k chunks the planner gets to read
+            reranker = get_reranker()
+            hits = search_shards(shards, query_vec, max(k, RERANK_CANDIDATES) if reranker else k, shard_cache,
+                                 **search_filters(**filters))
+            scores = [None] * len(hits)
+            if reranker and len(hits) > 1:
+                with span("rerank", candidates=len(hits), model=reranker.name):
+                    chunks = [data["chunk"] for _, data in hits]
+                    order = reranker.rerank(query, chunks, k)
+                    scores = reranker.score(query, [chunks[i] for i in order])  # cached by rerank
+                hits = [hits[i] for i in order]
+            results = []
+            for (distance, data), score in zip(hits, scores):
+                header = " | ".join(part for part in (data.get("title"), (data.get("visited_at") or "")[:10]) if part)
+                text = f"{header}\n{data['chunk']}" if header else data["chunk"]
+                # Character offsets of the chunk in the page text, so the client can locate the passage
+                offsets = f", Offsets: {data['start']}-{data['end']}" if data.get("start") is not None else ""
+                # Reranked hits are in score order, which their distances no longer follow
+                rerank = f", Rerank: {score:.4f}" if score is not None else ""
+                results.append(f"{text}\n[Source: {data['url']}, ID: {data['chunk_id']}, Distance: {distance:.4f}"
+                               f"{rerank}{offsets}]")
+            return results
+        except Exception as e:
+            return [f"ERROR: Failed to search: {str(e)}"]
+
+@tool("search")
+def search_documents(query: str, profile: str = DEFAULT_PROFILE) -> list[str]:
+    """Search for relevant content from uploaded documents."""
+    return search_index("search_documents", query, profile)
+
+@tool("search")
+def find_url_for_given_text(query: str, profile: str = DEFAULT_PROFILE, domain: str = None,
+                            visited_within_days: float = None, visited_after: str = None,
+                            visited_before: str = None) -> list[str]:
+    """Searches for a url for a given query. Optional filters narrow the pages searched: domain
+    (e.g. "github.com"), visited_within_days (e.g. 7 for "last week"), visited_after and
+    visited_before (ISO dates such as "2025-03-01")."""
+    return search_index("find_url_for_given_text", query, profile, domain=domain,
+                        visited_within_days=visited_within_days, visited_after=visited_after,
+                        visited_before=visited_before)
+
+def selected_tool_groups(argv: list) -> list:
+    """Resolve the tool groups to register from --tool-profile/--tools or MCP_TOOL_PROFILE/MCP_TOOL_GROUPS"""
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument("--tool-profile", default=os.getenv("MCP_TOOL_PROFILE", "full"), choices=sorted(TOOL_PROFILES))
+    parser.add_argument("--tools", default=os.getenv("MCP_TOOL_GROUPS"))
+    args, _ = parser.parse_known_args(argv)
+    if not args.tools:
+        return TOOL_PROFILES[args.tool_profile]
+    groups = [group.strip() for group in args.tools.split(",") if group.strip()]
+    unknown = set(groups) - set(TOOL_GROUPS)
+    if unknown:
+        raise ValueError(f"Unknown tool groups: {', '.join(sorted(unknown))}")
+    return groups
+
+def register_tools(groups: list) -> None:
+    for group in groups:
+        for fn in TOOL_GROUPS[group]:
+            mcp.add_tool(fn)
+    mcp_log("INFO", f"Registered tool groups: {', '.join(groups)}")
+
+register_tools(selected_tool_groups(sys.argv[1:]))
 
 if __name__ == "__main__":
     # Check if running with mcp dev command
-    print("STARTING")
+    mcp_log("INFO", "STARTING")
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
         mcp.run()  # Run without transport for dev server
     else:
@@ -538,4 +557,4 @@ if __name__ == "__main__":
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
-            print("\nShutting down...")
+            mcp_log("INFO", "Shutting down...")
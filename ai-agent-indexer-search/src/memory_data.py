@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
+from contextvars import ContextVar
 
 
 class InteractionHistory(BaseModel):
@@ -10,13 +11,22 @@ class InteractionHistory(BaseModel):
     timestamp: Optional[str] = datetime.now().isoformat()
 
 
-interaction_history: List[InteractionHistory] = []
-user_query: str = ""
-last_interaction: Optional[str] = None
+# Each request runs in its own asyncio task, so a context variable keeps
+# concurrent agent loops from reading each other's history.
+_interaction_history: ContextVar[Optional[List[InteractionHistory]]] = ContextVar("interaction_history", default=None)
+_user_query: ContextVar[str] = ContextVar("user_query", default="")
+
+def _history() -> List[InteractionHistory]:
+    history = _interaction_history.get()
+    if history is None:
+        history = []
+        _interaction_history.set(history)
+    return history
 
 def update_user_query(user_query) -> None:
-    """Update the user query in memory."""
-    user_query = user_query
+    """Update the user query in memory and start a fresh history for it."""
+    _user_query.set(user_query)
+    _interaction_history.set([])
 
 def add_interaction(input_text: str, output_text: str) -> None:
     """Add a new interaction to history."""
@@ -26,17 +36,16 @@ def add_interaction(input_text: str, output_text: str) -> None:
         output_text=output_text,
         timestamp=datetime.now().isoformat()
     )
-    interaction_history.append(interaction)
-    last_interaction = interaction.timestamp
+    _history().append(interaction)
 
 def get_recent_memory_interactions(limit: int = 50) -> List[InteractionHistory]:
     """Get most recent interactions."""
     return sorted(
-        interaction_history,
+        _history(),
         key=lambda x: x.timestamp,
         reverse=False
     )[:limit]
 
 def clear_history() -> None:
     """Clear interaction history."""
-    interaction_history.clear()
\ No newline at end of file
+    _history().clear()
@@ -20,3 +20,4 @@ class ActionOutput(BaseModel):
     tool: Optional[str] = None
     raw_response: str
     result: str
+    content: List[str] = []
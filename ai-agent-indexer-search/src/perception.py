@@ -1,15 +1,10 @@
 from google import genai
-import json
 from src.model import PerceptionOutput
-from dotenv import load_dotenv
-import os
-import re
-load_dotenv()
+from src.telemetry import record_llm_usage
+from src.llm_json import parse_llm_json
 
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-    
-def get_perception(user_query: str) -> PerceptionOutput:
-    """Process the input data and generate content using Gemini."""
+async def get_perception(user_query: str, client: genai.Client) -> PerceptionOutput:
+    """Process the input data and generate content using Gemini (the app's client, made in its lifespan)."""
     
     try:
         prompt = f"""
@@ -31,26 +26,24 @@ Important:
 What should i do next ?
     """
         #print("PERCEPTION:", f"Prompt: {prompt}")
-        response = client.models.generate_content(
+        response = await client.aio.models.generate_content(
             model="gemini-2.0-flash", 
             contents=prompt
         )
+        record_llm_usage("perception", response)
         
         # Extract the text from the response's candidates field
         candidates = response.candidates
         if candidates and len(candidates) > 0:
             text = candidates[0].content.parts[0].text
 
-            # Strip Markdown backticks if present
-            clean = re.sub(r"^```json|```$", "", text.strip(), flags=re.MULTILINE).strip()
-
-            parsed_output = json.loads(clean)
+            parsed_output = parse_llm_json(text)
             #print("PERCEPTION:", f"Parsed Output: {parsed_output}")
             # Create and return a PerceptionOutput object
             return PerceptionOutput(
                 user_query=user_query,  # Set the user_query field
                 intent=parsed_output.get("intent"),
-                entities=parsed_output.get("entities"),
+                entities=[str(entity) for entity in parsed_output.get("entities") or []],
                 tool_hint=parsed_output.get("tool_hint")
             )
         else:
@@ -58,4 +51,4 @@ What should i do next ?
     
     except Exception as e:
         print("PERCEPTION:", f"⚠️ Extraction failed: {e}")
-        return PerceptionOutput(user_query=user_query)
\ No newline at end of file
+        return PerceptionOutput(user_query=user_query, entities=[], intent=None)
\ No newline at end of file
@@ -1,15 +1,15 @@
 from src.model import PerceptionOutput
 from src.model import PlanOutput
+from src.telemetry import record_llm_usage
+from src.llm_json import parse_llm_json
 from typing import Optional, List
 from src.memory_data import InteractionHistory
 from google import genai
-import os
-from dotenv import load_dotenv
+from pydantic import ValidationError
 import re
 
-load_dotenv()
-
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+# The prompt also allows a bare "FINAL_ANSWER: [answer]" reply
+BARE_FINAL_ANSWER = re.compile(r"^FINAL_ANSWER:\s*\[?(.*?)\]?\s*$", re.DOTALL)
 
 def create_system_prompt(perception_output: PerceptionOutput, tools_description: List[str], interaction_history: List[InteractionHistory]) -> str:
     """
@@ -82,7 +82,8 @@ Below is the input summary for next step:
     return system_prompt
 
 
-def get_plan(perception_output: PerceptionOutput, tools_descriptions: Optional[str], interaction_history: List[InteractionHistory]) -> PlanOutput:
+async def get_plan(perception_output: PerceptionOutput, tools_descriptions: Optional[str], interaction_history: List[InteractionHistory],
+                   client: genai.Client) -> PlanOutput:
     """
     Process the perception output and tools descriptions to create a plan output.
     """
@@ -91,18 +92,29 @@ def get_plan(perception_output: PerceptionOutput, tools_descriptions: Optional[s
     #print("PLAN:", system_prompt)
 
     try:
-        response = client.models.generate_content(
+        response = await client.aio.models.generate_content(
             model="gemini-2.0-flash",
             contents=system_prompt
         )
+        record_llm_usage("plan", response)
         raw = response.text.strip()
-
-        # Strip Markdown backticks if present
-        clean = re.sub(r"^```json|```$", "", raw.strip(), flags=re.MULTILINE).strip()
-        #print("PLAN:", f"LLM Output: {clean}")
+        #print("PLAN:", f"LLM Output: {raw}")
 
     except Exception as e:
         print("PLAN:", f"⚠️ Decision generation failed: {e}")
         return PlanOutput(response_type="ERROR:", tool="unknown", arguments={}, reasoning_type="error_handling")
 
-    return PlanOutput.model_validate_json(clean)
+    return parse_plan(raw)
+
+
+def parse_plan(raw: str) -> PlanOutput:
+    """Turn the planner's reply into a PlanOutput, repairing sloppy JSON instead of failing the request"""
+    bare = BARE_FINAL_ANSWER.match(raw.strip())
+    if bare and "{" not in raw:
+        return PlanOutput(response_type="FINAL_ANSWER", final_answer=bare.group(1).strip())
+
+    try:
+        return PlanOutput.model_validate(parse_llm_json(raw))
+    except (ValueError, ValidationError) as e:
+        print("PLAN:", f"⚠️ Could not parse decision: {e}")
+        return PlanOutput(response_type="ERROR:", tool="unknown", arguments={}, reasoning_type="error_handling")
@@ -0,0 +1,120 @@
+"""Optional cross-encoder reranking of search hits on CPU, switched on with RERANK=1.
+
+The search tools then fetch RERANK_CANDIDATES chunks from FAISS, score each (query, chunk)
+pair with RERANK_MODEL in batches and pass on only the best few, so the planner reads a
+short, well-ordered list. RERANK_BACKEND=onnx runs the quantized ONNX export of the model
+(RERANK_ONNX_FILE) through ONNX Runtime; torch runs the full-precision weights.
+Standard library and numpy only at import time, like embedder.py.
+"""
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import hashlib
+import os
+import sys
+import threading
+
+import numpy as np
+
+RERANK = os.getenv("RERANK", "0").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "onnx")  # onnx | torch
+RERANK_ONNX_FILE = os.getenv("RERANK_ONNX_FILE", "onnx/model_quint8_avx2.onnx")  # int8 weights shipped with the model
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH = int(os.getenv("RERANK_BATCH", "32"))
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", os.cpu_count() or 1))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))  # (query, chunk) scores kept
+
+
+class Reranker:
+    """Scores (query, passage) pairs, higher is more relevant, remembering recent scores"""
+
+    name = ""
+
+    def __init__(self, cache_size: int = RERANK_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def predict(self, query: str, passages: List[str]) -> np.ndarray:
+        """One float32 score per passage"""
+        raise NotImplementedError
+
+    def score(self, query: str, passages: List[str]) -> np.ndarray:
+        """Scores for every passage; only pairs not seen recently go to the model, in one batch"""
+        keys = [(query, hashlib.sha1(passage.encode("utf-8")).hexdigest()) for passage in passages]
+        scores = np.empty(len(passages), dtype=np.float32)
+        missing = []
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[i] = self._scores[key]
+                else:
+                    missing.append(i)
+        if missing:
+            scores[missing] = self.predict(query, [passages[i] for i in missing])
+            with self._cache_lock:
+                for i in missing:
+                    self._scores[keys[i]] = float(scores[i])
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, passages: List[str], top_k: int) -> List[int]:
+        """Indexes of the `top_k` best passages, best first; ties keep the original order"""
+        scores = self.score(query, passages)
+        return [int(i) for i in np.argsort(-scores, kind="stable")[:top_k]]
+
+
+class CrossEncoderReranker(Reranker):
+    """sentence-transformers CrossEncoder on CPU; `backend` is onnx (quantized weights) or torch"""
+
+    def __init__(self, model: str = RERANK_MODEL, backend: str = RERANK_BACKEND, threads: int = RERANK_THREADS,
+                 batch_size: int = RERANK_BATCH, onnx_file: str = RERANK_ONNX_FILE,
+                 cache_size: int = RERANK_CACHE_SIZE):
+        super().__init__(cache_size)
+        from sentence_transformers import CrossEncoder
+
+        self.name = f"cross-encoder-{backend}"
+        self.batch_size = batch_size
+        model_kwargs = {}
+        if backend == "onnx":
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            model_kwargs = {"file_name": onnx_file, "provider": "CPUExecutionProvider", "session_options": options}
+        else:
+            import torch
+
+            torch.set_num_threads(threads)
+        self.model = CrossEncoder(model, device="cpu", backend=backend, model_kwargs=model_kwargs)
+        self._lock = threading.Lock()  # one batch at a time; each already uses every thread
+
+    def predict(self, query: str, passages: List[str]) -> np.ndarray:
+        with self._lock:
+            scores = self.model.predict([(query, passage) for passage in passages], batch_size=self.batch_size,
+                                        convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(scores, dtype=np.float32).reshape(-1)
+
+
+_reranker: Optional[Reranker] = None
+_reranker_failed = False
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[Reranker]:
+    """The process-wide reranker, or None when RERANK is off or the model could not be loaded"""
+    global _reranker, _reranker_failed
+    if not RERANK or _reranker_failed:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None and not _reranker_failed:
+                try:
+                    _reranker = CrossEncoderReranker()
+                except Exception as e:
+                    # stderr, as the MCP server's stdout carries the protocol
+                    sys.stderr.write(f"WARN: Reranking disabled, could not load {RERANK_MODEL}: {e}\n")
+                    _reranker_failed = True
+    return _reranker
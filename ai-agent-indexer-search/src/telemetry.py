@@ -0,0 +1,216 @@
+"""Span timing and Prometheus-style metrics shared by the agent, the indexer and the MCP server.
+
+Standard library only, so it can be imported as `src.telemetry` from main.py and as
+`telemetry` from the scripts that run inside src/.
+"""
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACE_LOG = os.getenv("TRACE_LOG", "0") == "1"
+
+_lock = threading.Lock()
+_metrics: Dict[str, "_Metric"] = {}
+
+
+def _label_key(labels: Dict[str, object]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with _lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with _lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with _lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', repr(float(bound))),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+def counter(name: str, help: str) -> Counter:
+    """Get or create a counter; modules asking for the same name share it"""
+    with _lock:
+        metric = _metrics.get(name) or _metrics.setdefault(name, Counter(name, help))
+    return metric
+
+
+def gauge(name: str, help: str) -> Gauge:
+    """Get or create a gauge; modules asking for the same name share it"""
+    with _lock:
+        metric = _metrics.get(name) or _metrics.setdefault(name, Gauge(name, help))
+    return metric
+
+
+def histogram(name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    """Get or create a histogram; modules asking for the same name share it"""
+    with _lock:
+        metric = _metrics.get(name) or _metrics.setdefault(name, Histogram(name, help, buckets))
+    return metric
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        metrics = list(_metrics.values())
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+SPAN_SECONDS = histogram("span_duration_seconds", "Time spent in each traced stage")
+LLM_TOKENS = counter("llm_tokens_total", "Tokens sent to and received from the LLM")
+
+_current_span: ContextVar[Optional[dict]] = ContextVar("current_span", default=None)
+_trace_spans: ContextVar[Optional[list]] = ContextVar("trace_spans", default=None)
+
+# Finished traces waiting to be pulled by another process (see drain_traces)
+_finished_traces: deque = deque(maxlen=1000)
+
+
+def _reset(var: ContextVar, token) -> None:
+    try:
+        var.reset(token)
+    except ValueError:
+        # An async generator closed from another context; nothing left to restore
+        pass
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[dict]:
+    """Time a stage; nested spans form one trace, which is exported when its root span ends"""
+    parent = _current_span.get()
+    record = {
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "start": time.time(),
+        "attrs": attrs,
+    }
+    spans_token = _trace_spans.set([]) if parent is None else None
+    span_token = _current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["attrs"]["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        record["duration_ms"] = round(duration * 1000, 3)
+        SPAN_SECONDS.observe(duration, span=name)
+        spans = _trace_spans.get()
+        if spans is not None:
+            spans.append(record)
+        _reset(_current_span, span_token)
+        if spans_token is not None:
+            _reset(_trace_spans, spans_token)
+            _finished_traces.append(spans)
+            if TRACE_LOG:
+                sys.stderr.write(f"TRACE: {json.dumps(spans)}\n")
+                sys.stderr.flush()
+
+
+def drain_traces() -> List[list]:
+    """Hand over, and forget, the traces finished in this process since the last call"""
+    traces = []
+    while _finished_traces:
+        traces.append(_finished_traces.popleft())
+    return traces
+
+
+def add_remote_spans(spans: List[dict]) -> None:
+    """Graft spans recorded by another process under the current span and count them here"""
+    parent = _current_span.get()
+    trace = _trace_spans.get()
+    for record in spans:
+        SPAN_SECONDS.observe(record["duration_ms"] / 1000, span=record["name"])
+        if parent is None or trace is None:
+            continue
+        record = {**record, "trace_id": parent["trace_id"], "attrs": {**record["attrs"], "remote": True}}
+        if record["parent_id"] is None:
+            record["parent_id"] = parent["span_id"]
+        trace.append(record)
+
+
+def record_llm_usage(stage: str, response) -> None:
+    """Count prompt and output tokens reported on a Gemini response"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_token_count", None) or 0, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "candidates_token_count", None) or 0, stage=stage, kind="output")
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.resolve()
+# The src modules import each other by bare name, as they do when run from src/;
+# the agent's modules (src.action, src.llm_json, ...) are imported from the project root like main.py does
+sys.path[:0] = [str(ROOT / "src"), str(ROOT)]
@@ -0,0 +1,101 @@
+"""Reading search tool results: hits, their offsets, and when the top one is confident enough to stop."""
+import pytest
+
+from src.action import confident_url, search_hits, source_urls
+
+
+def hit(url, distance, text="some chunk text", offsets=None, header=None, rerank=None):
+    """A search result item as mcp_server.search_index formats it"""
+    body = f"{header}\n{text}" if header else text
+    suffix = f", Rerank: {rerank:.4f}" if rerank is not None else ""
+    suffix += f", Offsets: {offsets[0]}-{offsets[1]}" if offsets else ""
+    return f"{body}\n[Source: {url}, ID: {url}_0, Distance: {distance:.4f}{suffix}]"
+
+
+QUERY = "when was the treaty signed"
+
+
+@pytest.mark.parametrize("content, margin, expected", [
+    # The best hit is well ahead of the best hit from another URL
+    ([hit("https://a.com/", 0.2), hit("https://b.com/", 0.5)], 0.8, "https://a.com/"),
+    # ...but not far enough ahead
+    ([hit("https://a.com/", 0.45), hit("https://b.com/", 0.5)], 0.8, None),
+    # The runner-up is the same page; the margin is taken against the next URL
+    ([hit("https://a.com/", 0.2), hit("https://a.com/", 0.21), hit("https://b.com/", 0.5)], 0.8, "https://a.com/"),
+    ([hit("https://a.com/", 0.45), hit("https://a.com/", 0.9), hit("https://b.com/", 0.5)], 0.8, None),
+    # Only one URL: nothing to compare with, however close
+    ([hit("https://a.com/", 0.01), hit("https://a.com/", 0.9)], 0.8, None),
+    ([hit("https://a.com/", 0.01)], 0.8, None),
+    # A margin of 0 turns the distance rule off
+    ([hit("https://a.com/", 0.01), hit("https://b.com/", 0.9)], 0.0, None),
+    # The query appears verbatim (case and whitespace aside) in the top hit
+    ([hit("https://a.com/", 0.9, "We know When  was the TREATY signed, in 1648."), hit("https://b.com/", 0.5)],
+     0.8, "https://a.com/"),
+    ([hit("https://a.com/", 0.9, "when was the treaty"), hit("https://b.com/", 0.5)], 0.8, None),
+    # Only the top hit counts for the verbatim rule
+    ([hit("https://b.com/", 0.5), hit("https://a.com/", 0.55, f"{QUERY}.")], 0.8, None),
+    # Reranked hits never stop on distance, however far ahead, but still on the verbatim rule
+    ([hit("https://a.com/", 0.2, rerank=1.5), hit("https://b.com/", 0.5, rerank=-2.0)], 0.8, None),
+    ([hit("https://a.com/", 0.6, rerank=7.5), hit("https://b.com/", 0.1, rerank=0.3)], 0.8, None),
+    ([hit("https://a.com/", 0.9, f"{QUERY}?", rerank=7.5), hit("https://b.com/", 0.1, rerank=0.3)],
+     0.8, "https://a.com/"),
+    ([], 0.8, None),
+    (["ERROR: Failed to search: boom"], 0.8, None),
+])
+def test_confident_url(content, margin, expected):
+    assert confident_url(content, QUERY, margin) == expected
+
+
+def test_short_queries_never_stop_verbatim():
+    content = [hit("https://a.com/", 0.9, "python docs"), hit("https://b.com/", 0.5)]
+    assert confident_url(content, "python docs", 0.8) is None
+
+
+def test_search_hits_with_and_without_offsets():
+    content = [
+        hit("https://a.com/", 0.25, "the chunk", offsets=(100, 109), header="Title | 2026-01-01"),
+        hit("https://b.com/", 1.5, "another chunk", header="Other"),
+        hit("https://c.com/", 0.75, "reranked chunk", offsets=(0, 14), header="Third", rerank=-3.25),
+        "not a hit",
+    ]
+    first, second, third = search_hits(content)
+    assert first == ("https://a.com/", 0.25, "the chunk", 100, 109, None)  # the header is cut off using the offsets
+    assert second == ("https://b.com/", 1.5, "Other\nanother chunk", None, None, None)
+    assert third == ("https://c.com/", 0.75, "reranked chunk", 0, 14, -3.25)
+
+
+def test_source_urls_are_distinct_in_rank_order():
+    result = str([hit("https://b.com/", 0.1), hit("https://a.com/", 0.2), hit("https://b.com/", 0.3)])
+    assert source_urls(result) == ["https://b.com/", "https://a.com/"]
+
+
+def test_reranked_search_results_carry_the_score(tmp_path, monkeypatch):
+    """mcp_server.search_index marks reranked hits, so the distance rule leaves them alone"""
+    import numpy as np
+
+    import mcp_server
+    from faiss_store import chunk_metadata, log_page, shard_dir
+    from reranker import Reranker
+
+    class ByLength(Reranker):
+        name = "by-length"
+
+        def predict(self, query, passages):
+            return np.array([len(passage) for passage in passages], dtype=np.float32)
+
+    urls = ["https://a.com/", "https://b.com/"]
+    for i, (url, chunk) in enumerate(zip(urls, ["near", "far but much longer"])):
+        vector = np.zeros((1, 4), dtype=np.float32)
+        vector[0, i] = 1.0
+        log_page(shard_dir("default", url, tmp_path), url, "hash", [chunk_metadata(url, chunk, 0)], vector)
+    monkeypatch.setattr(mcp_server, "INDEX_DIR", tmp_path)
+    monkeypatch.setattr(mcp_server, "get_embedding", lambda query: np.eye(4, dtype=np.float32)[0])
+    monkeypatch.setattr(mcp_server, "shard_cache", mcp_server.ShardCache())
+
+    monkeypatch.setattr(mcp_server, "get_reranker", lambda: None)
+    assert confident_url(mcp_server.search_index("test", "some query"), "some query", 0.8) == "https://a.com/"
+
+    monkeypatch.setattr(mcp_server, "get_reranker", lambda: ByLength())
+    content = mcp_server.search_index("test", "some query")
+    assert [(hit.url, hit.rerank) for hit in search_hits(content)] == [("https://b.com/", 19.0), ("https://a.com/", 4.0)]
+    assert confident_url(content, "some query", 0.8) is None
@@ -0,0 +1,109 @@
+"""Answer cache: similarity threshold, expiry, eviction and invalidation once a page is re-indexed."""
+from urllib.parse import quote
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache
+from faiss_store import chunk_metadata, log_page, shard_dir
+
+DIM = 8
+URL = "https://a.com/page"
+
+
+def vector(*components):
+    return np.array(components + (0.0,) * (DIM - len(components)), dtype=np.float32)
+
+
+def cache_answer(cache, profile="default", vec=None, url=URL, content_hash="v1"):
+    vec = vector(1.0) if vec is None else vec
+    return cache.add(profile, vec, "question", url, content_hash, {"highlight_text": "passage"})
+
+
+def test_hit_needs_similarity_above_threshold():
+    cache = AnswerCache(threshold=0.9)
+    entry_id = cache_answer(cache)
+    # Same direction at another length is the same question
+    found = cache.lookup("default", vector(3.0))
+    assert found is not None and found[0] == entry_id
+    assert found[1]["url"] == URL and found[1]["similarity"] == pytest.approx(1.0)
+    assert cache.lookup("default", vector(1.0, 0.4)) is not None   # cos ~0.93
+    assert cache.lookup("default", vector(1.0, 0.6)) is None       # cos ~0.86
+    assert cache.lookup("default", vector(0.0, 1.0)) is None
+
+
+def test_profiles_are_separate():
+    cache = AnswerCache()
+    cache_answer(cache, profile="work")
+    assert cache.lookup("default", vector(1.0)) is None
+    assert cache.lookup("work", vector(1.0)) is not None
+
+
+def test_expired_entry_is_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(ttl_seconds=60)
+    cache_answer(cache)
+    now[0] += 60
+    assert cache.lookup("default", vector(1.0)) is not None
+    now[0] += 1
+    assert cache.lookup("default", vector(1.0)) is None
+    assert len(cache) == 0
+
+
+def test_oldest_entry_is_evicted_beyond_max_entries():
+    cache = AnswerCache(max_entries=2)
+    first = cache_answer(cache, vec=vector(1.0), url="https://a.com/1")
+    cache_answer(cache, vec=vector(0.0, 1.0), url="https://a.com/2")
+    cache_answer(cache, vec=vector(0.0, 0.0, 1.0), url="https://a.com/3")
+    assert len(cache) == 2
+    assert cache.lookup("default", vector(1.0)) is None
+    assert cache.lookup("default", vector(0.0, 1.0))[1]["url"] == "https://a.com/2"
+    assert cache.lookup("default", vector(0.0, 0.0, 1.0))[1]["url"] == "https://a.com/3"
+    cache.invalidate(first)  # already evicted: a no-op
+    assert len(cache) == 2
+
+
+def test_disabled_when_max_entries_is_zero():
+    assert not AnswerCache(max_entries=0).enabled
+    assert AnswerCache().enabled
+
+
+def test_dimension_change_drops_the_profile():
+    cache = AnswerCache()
+    cache_answer(cache, profile="default")
+    cache_answer(cache, profile="work")
+    cache.add("default", np.ones(DIM * 2, dtype=np.float32), "question", URL, "v1", {})
+    assert len(cache) == 2
+    assert cache.lookup("default", vector(1.0)) is None
+    assert cache.lookup("default", np.ones(DIM * 2, dtype=np.float32)) is not None
+    assert cache.lookup("work", vector(1.0)) is not None
+
+
+def test_entry_is_invalidated_once_its_page_is_reindexed(tmp_path, monkeypatch):
+    """The check the agent makes on a hit, through the index://url-hash resource."""
+    import mcp_server
+
+    monkeypatch.setattr(mcp_server, "INDEX_DIR", tmp_path)
+    shard = shard_dir("default", URL, tmp_path)
+
+    def index_page(content_hash):
+        log_page(shard, URL, content_hash, [chunk_metadata(URL, "text", 0)], np.ones((1, DIM), dtype=np.float32))
+
+    def url_hash():
+        return mcp_server.get_url_hash("default", quote(URL, safe=""))
+
+    assert url_hash() == ""
+    index_page("v1")
+    cache = AnswerCache()
+    cache_answer(cache, content_hash=url_hash())
+
+    entry_id, entry = cache.lookup("default", vector(1.0))
+    assert url_hash() == entry["content_hash"] == "v1"  # still fresh: served from the cache
+
+    index_page("v2")
+    assert url_hash() != entry["content_hash"]
+    cache.invalidate(entry_id)
+    assert cache.lookup("default", vector(1.0)) is None
+    assert len(cache) == 0
@@ -0,0 +1,44 @@
+"""Decoding embedding responses and batching texts through the embedder."""
+import json
+
+import numpy as np
+import pytest
+
+import embedder
+from embedder import decode_vectors, embed_texts
+
+VECTORS = np.array([[0.25, -1.5e-3, 3.0], [1.0, 2.0, -0.5]], dtype=np.float32)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+@pytest.mark.parametrize("key, body, rows, expected", [
+    ("embeddings", json.dumps({"model": "m", "embeddings": VECTORS.tolist(), "total_duration": 1}), 2, VECTORS),
+    ("embedding", json.dumps({"embedding": VECTORS[0].tolist()}), 1, VECTORS[:1]),
+    ("embeddings", '{"embeddings": [[1e-05, 2E+01]]}', 1, np.array([[1e-5, 20]], dtype=np.float32)),
+])
+def test_decode_vectors(monkeypatch, use_orjson, key, body, rows, expected):
+    if not use_orjson:
+        monkeypatch.setattr(embedder, "orjson", None)
+    elif embedder.orjson is None:
+        pytest.skip("orjson not installed")
+    decoded = decode_vectors(body.encode(), key, rows)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, expected, rtol=1e-6)
+
+
+class CountingEmbedder(embedder.Embedder):
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(len(texts))
+        return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float32)
+
+
+@pytest.mark.parametrize("batch_size, calls", [(None, [5]), (10, [5]), (2, [2, 2, 1])])
+def test_embed_texts_batches(monkeypatch, batch_size, calls):
+    fake = CountingEmbedder()
+    monkeypatch.setattr(embedder, "get_embedder", lambda: fake)
+    vectors = embed_texts(["a", "bb", "ccc", "dddd", "eeeee"], batch_size)
+    assert fake.calls == calls
+    assert vectors.shape == (5, 2) and vectors[:, 0].tolist() == [1, 2, 3, 4, 5]
@@ -0,0 +1,180 @@
+"""Recovery of a shard from its snapshot, manifest and write-ahead log after a crash."""
+import json
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import faiss_store
+from faiss_store import (LOCK_FILE, MANIFEST_FILE, WAL_FILE, check_shard, chunk_metadata, index_files, indexed_hash, load_store,
+                         log_page, log_visit, recover_stores, save_store, shard_dir, shard_lock)
+
+DIM = 8
+
+
+def log_test_page(shard, url, chunks=2, content_hash=None):
+    rows = [chunk_metadata(url, f"{url} chunk {i}", i) for i in range(chunks)]
+    vectors = np.random.default_rng(len(url)).random((chunks, DIM), dtype=np.float32)
+    return log_page(shard, url, content_hash or f"hash-{url}", rows, vectors)
+
+
+def assert_consistent(shard, urls):
+    index, metadata, cache_meta = load_store(shard)
+    assert index.ntotal == len(metadata)
+    assert sorted({data["url"] for data in metadata}) == sorted(urls)
+    assert sorted(cache_meta) == sorted(urls)
+
+
+def test_interrupted_first_snapshot(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    log_test_page(shard, "https://a.com/")
+    index, metadata, cache_meta = load_store(shard)
+    # The snapshot stopped after the cache and metadata, before index.bin and the manifest
+    _, metadata_file, cache_file = index_files(shard)
+    shard.mkdir(parents=True, exist_ok=True)
+    cache_file.write_text(json.dumps(cache_meta))
+    metadata_file.write_text(json.dumps(metadata))
+
+    assert_consistent(shard, ["https://a.com/"])
+    assert recover_stores(tmp_path) == 1
+    assert check_shard(shard)["ok"]
+    assert_consistent(shard, ["https://a.com/"])
+
+
+def test_interrupted_later_snapshot(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    log_test_page(shard, "https://a.com/")
+    save_store(*load_store(shard), shard)
+    log_test_page(shard, "https://b.com/", chunks=3)
+    manifest = (shard / MANIFEST_FILE).read_bytes()
+    wal = (shard / WAL_FILE).read_bytes()
+    # Every file but the manifest was replaced, and the log not yet cleared
+    save_store(*load_store(shard), shard)
+    (shard / MANIFEST_FILE).write_bytes(manifest)
+    (shard / WAL_FILE).write_bytes(wal)
+
+    assert not check_shard(shard)["ok"]
+    assert_consistent(shard, ["https://a.com/", "https://b.com/"])
+    assert load_store(shard)[0].ntotal == 5  # b.com rolled back and replayed once, not twice
+    recover_stores(tmp_path)
+    assert check_shard(shard)["ok"]
+
+
+def test_torn_log_line(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    log_test_page(shard, "https://a.com/")
+    log_test_page(shard, "https://b.com/")
+    with open(shard / WAL_FILE, "ab") as f:
+        f.write(b'0badc0de {"seq": 3, "url": "https://c.co')
+
+    assert check_shard(shard)["torn_log_bytes"] > 0
+    assert_consistent(shard, ["https://a.com/", "https://b.com/"])
+    assert log_test_page(shard, "https://c.com/") == 3  # the torn tail is cut off before appending
+    assert check_shard(shard)["torn_log_bytes"] == 0
+    assert_consistent(shard, ["https://a.com/", "https://b.com/", "https://c.com/"])
+
+
+def test_indexed_hash_follows_log_snapshot_and_other_writers(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    assert indexed_hash("https://a.com/", "default", tmp_path) is None
+    log_test_page(shard, "https://a.com/", content_hash="v1")
+    assert indexed_hash("https://a.com/", "default", tmp_path) == "v1"
+    save_store(*load_store(shard), shard)
+    assert indexed_hash("https://a.com/", "default", tmp_path) == "v1"
+    # Another process (the bulk indexer) rewrites the snapshot
+    cache_file = index_files(shard)[2]
+    cache_file.write_text(json.dumps({"https://a.com/": "v2", "https://b.com/": "v1"}))
+    assert indexed_hash("https://a.com/", "default", tmp_path) == "v2"
+    assert indexed_hash("https://b.com/", "default", tmp_path) == "v1"
+
+
+def test_logged_page_replaces_earlier_chunks(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    log_test_page(shard, "https://a.com/", chunks=3, content_hash="v1")
+    log_test_page(shard, "https://b.com/")
+    save_store(*load_store(shard), shard)
+    log_test_page(shard, "https://a.com/", chunks=1, content_hash="v2")
+    index, metadata, cache_meta = load_store(shard)
+    assert index.ntotal == len(metadata) == 3
+    assert [data["url"] for data in metadata] == ["https://b.com/", "https://b.com/", "https://a.com/"]
+    assert cache_meta["https://a.com/"] == "v2"
+
+    log_page(shard, "https://a.com/", None, [], None)  # removal
+    index, metadata, cache_meta = load_store(shard)
+    assert index.ntotal == len(metadata) == 2
+    assert "https://a.com/" not in cache_meta
+    assert indexed_hash("https://a.com/", "default", tmp_path) is None
+
+
+def test_indexed_hash_finds_pages_from_earlier_months(tmp_path, monkeypatch):
+    monkeypatch.setattr(faiss_store, "SHARD_BY", "month")
+    log_test_page(tmp_path / "profiles" / "alice" / "2026-01", "https://a.com/", content_hash="v1")
+    assert indexed_hash("https://a.com/", "alice", tmp_path) == "v1"
+    assert indexed_hash("https://a.com/", "bob", tmp_path) is None
+
+
+def test_logged_visit_moves_visit_time_forward(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    rows = [chunk_metadata("https://a.com/", "chunk", 0, visited_at="2026-01-01T00:00:00+00:00")]
+    log_page(shard, "https://a.com/", "v1", rows, np.ones((1, DIM), dtype=np.float32))
+    save_store(*load_store(shard), shard)
+    log_visit(shard, "https://a.com/", "2026-03-01T00:00:00+00:00")
+    log_visit(shard, "https://a.com/", "2026-02-01T00:00:00+00:00")  # out of order; the later visit stands
+    assert load_store(shard)[1][0]["visited_at"] == "2026-03-01T00:00:00+00:00"
+    assert indexed_hash("https://a.com/", "default", tmp_path) == "v1"
+    recover_stores(tmp_path)
+    assert load_store(shard)[1][0]["visited_at"] == "2026-03-01T00:00:00+00:00"
+    assert check_shard(shard)["ok"]
+
+
+@pytest.mark.skipif(faiss_store.fcntl is None, reason="no lock file without fcntl")
+def test_shard_lock_keeps_other_processes_out(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    probe = (f"import fcntl; f = open({str(shard / LOCK_FILE)!r}, 'a+b'); "
+             "fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)")
+    with shard_lock(shard):
+        with shard_lock(shard):  # reentrant, as save_store inside a caller's load -> save
+            log_test_page(shard, "https://a.com/")
+        assert subprocess.run([sys.executable, "-c", probe], capture_output=True).returncode != 0
+    assert subprocess.run([sys.executable, "-c", probe], capture_output=True).returncode == 0
+
+
+def test_unnormalised_store_is_normalised_on_first_load(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    rows = [chunk_metadata("https://a.com/", f"chunk {i}", i) for i in range(3)]
+    vectors = np.arange(1, 3 * DIM + 1, dtype=np.float32).reshape(3, DIM)  # raw /api/embeddings output
+    log_page(shard, "https://a.com/", "v1", rows, vectors)
+    save_store(*load_store(shard), shard)
+    assert "not unit length" in check_shard(shard)["problems"][0]
+
+    loaded = faiss_store.load_shard(shard)
+    expected = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.testing.assert_allclose(loaded.index.reconstruct_n(0, 3), expected, rtol=1e-6)
+    index, metadata, cache_meta = load_store(shard)  # rewritten on disk, once
+    assert faiss_store.unit_length(index) and metadata == rows and cache_meta == {"https://a.com/": "v1"}
+    assert check_shard(shard)["ok"]
+    assert recover_stores(tmp_path) == 0
+
+
+def test_repair_normalises_unnormalised_store(tmp_path):
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    log_page(shard, "https://a.com/", "v1", [chunk_metadata("https://a.com/", "chunk", 0)],
+             np.full((1, DIM), 3, dtype=np.float32))
+    assert recover_stores(tmp_path) == 1
+    assert faiss_store.unit_length(load_store(shard)[0])
+
+
+def test_reembed_replaces_vectors(tmp_path, monkeypatch):
+    import embedder
+
+    shard = shard_dir("default", "https://a.com/", tmp_path)
+    log_test_page(shard, "https://a.com/", chunks=3)
+    save_store(*load_store(shard), shard)
+    assert not faiss_store.unit_length(load_store(shard)[0])
+    monkeypatch.setattr(embedder, "embed_texts", lambda texts, batch_size=None: np.eye(len(texts), DIM, dtype=np.float32))
+    assert faiss_store.reembed_store(shard) == 3
+    index, metadata, _ = load_store(shard)
+    assert faiss_store.unit_length(index)
+    assert index.ntotal == len(metadata) == 3
+    assert check_shard(shard)["ok"]
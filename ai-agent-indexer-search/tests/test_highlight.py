@@ -0,0 +1,70 @@
+"""Choosing the passage to highlight in a search hit and where it sits in the indexed page."""
+import pytest
+
+from faiss_store import chunk_spans
+from src.action import search_hits
+from src.highlight import best_sentence, locate_passage, sentence_spans
+
+
+def test_sentence_spans_split_on_punctuation_and_lines():
+    text = "First one.  Second one?\nThird line\n\nFourth!"
+    assert [text[start:end] for start, end in sentence_spans(text)] == [
+        "First one.", "Second one?", "Third line", "Fourth!"]
+
+
+def test_long_runs_are_cut_into_windows():
+    text = " ".join(f"w{i}" for i in range(10))
+    assert [text[start:end] for start, end in sentence_spans(text, max_words=4)] == [
+        "w0 w1 w2 w3", "w4 w5 w6 w7", "w8 w9"]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("when was the treaty of westphalia signed", "The Treaty of Westphalia was signed in 1648."),
+    ("thirty years war", "It ended the Thirty Years' War."),
+    # Rare terms outweigh a longer sentence that repeats common ones
+    ("peace congress munster", "Delegates met at the peace congress in Münster and Osnabrück."),
+])
+def test_best_sentence_of_multi_sentence_chunk(query, expected):
+    chunk = ("The war was long and the peace was hard to make, the peace took years. "
+             "Delegates met at the peace congress in Münster and Osnabrück. "
+             "The Treaty of Westphalia was signed in 1648. It ended the Thirty Years' War.")
+    start, end = best_sentence(chunk, query)
+    assert chunk[start:end] == expected
+
+
+@pytest.mark.parametrize("chunk, query", [
+    ("Nothing in common here.", "treaty westphalia"),
+    ("", "treaty"),
+    ("Some text.", "the of and"),  # only stopwords, and none of them in the chunk
+])
+def test_no_overlap_falls_back_to_the_query(chunk, query):
+    assert best_sentence(chunk, query) is None
+    passage = locate_passage(chunk, query, 10, 10 + len(chunk))
+    assert passage["highlight_text"] == query
+    assert passage["highlight_start"] is None and passage["highlight_end"] is None
+    assert passage["chunk_start"] == 10
+
+
+def test_unknown_offsets_still_give_the_sentence():
+    passage = locate_passage("Intro. The answer is here.", "answer")
+    assert passage["highlight_text"] == "The answer is here."
+    assert passage["chunk_start"] is None and passage["highlight_start"] is None
+
+
+def test_repeated_chunk_is_located_by_its_offsets():
+    repeated = " ".join(f"filler{i}" for i in range(60)) + ". The release notes list the breaking changes."
+    page = repeated + "\n\n" + " ".join(f"other{i}" for i in range(200)) + "\n\n" + repeated
+    chunks = list(chunk_spans(page, size=40, overlap=0))
+    # The chunk holding the second copy of the sentence, as search_index formats a hit for it
+    chunk, start, end = [span for span in chunks if "release notes" in span[0]][-1]
+    assert page.find(chunk) < start  # the same text also occurs earlier in the page
+    item = f"Release | 2026-01-01\n{chunk}\n[Source: https://a.com/, ID: https://a.com/_9, Distance: 0.1, Offsets: {start}-{end}]"
+
+    hit, = search_hits([item])
+    assert (hit.text, hit.start, hit.end) == (chunk, start, end)  # the title/date header is cut off
+    passage = locate_passage(hit.text, "breaking changes in the release notes", hit.start, hit.end)
+    text = passage["highlight_text"]
+    assert text == "The release notes list the breaking changes."
+    assert page[passage["highlight_start"]:passage["highlight_end"]] == text
+    # popup.js counts the occurrences before highlight_start to pick which match to scroll to
+    assert page[:passage["highlight_start"]].count(text) == 1
@@ -0,0 +1,153 @@
+"""Ingest scheduler: token buckets, priorities, debouncing, rate limits and the domain lists."""
+import pytest
+
+from ingest_scheduler import IngestScheduler, TokenBucket
+
+
+def noop(**page):
+    pass
+
+
+def scheduler(handler=noop, **kwargs):
+    kwargs = {"allowlist": [], "blocklist": [], "debounce_seconds": 300, "domain_rate": 0, "domain_burst": 1,
+              "max_queue": 100, **kwargs}
+    return IngestScheduler(handler, **kwargs)
+
+
+def drain(sched, now=0.0):
+    """URLs in the order the scheduler would start them at `now`"""
+    urls = []
+    while True:
+        chosen, _ = sched._take_next(now)
+        if chosen is None:
+            return urls
+        (_, url), _ = chosen
+        urls.append(url)
+
+
+@pytest.fixture
+def running():
+    started = []
+
+    def start(sched):
+        sched.start()
+        started.append(sched)
+        return sched
+
+    yield start
+    for sched in started:
+        sched.stop()
+
+
+def test_token_bucket_refills_at_rate_up_to_burst():
+    bucket = TokenBucket(rate=1.0, burst=2, now=0.0)
+    assert bucket.take(0.0) == 0.0
+    assert bucket.take(0.0) == 0.0
+    assert bucket.take(0.0) == pytest.approx(1.0)
+    assert bucket.take(0.5) == pytest.approx(0.5)
+    assert bucket.take(1.0) == 0.0
+    # A long pause refills no more than the burst
+    assert [bucket.take(100.0) for _ in range(3)] == [0.0, 0.0, pytest.approx(1.0)]
+
+
+@pytest.mark.parametrize("allowlist, blocklist, url, allowed", [
+    ([], [], "https://example.com/", True),
+    ([], [], "http://localhost:8000/", True),  # nothing is blocked by default
+    ([], [], "chrome://settings/", False),
+    ([], [], "file:///home/me/notes.html", False),
+    ([], ["example.com"], "https://example.com/a", False),
+    ([], ["example.com"], "https://docs.example.com/a", False),
+    ([], ["example.com"], "https://notexample.com/a", True),
+    (["github.com"], [], "https://github.com/a", True),
+    (["github.com"], [], "https://gist.github.com/a", True),
+    (["github.com"], [], "https://gitlab.com/a", False),
+    # The blocklist wins over the allowlist
+    (["github.com"], ["gist.github.com"], "https://gist.github.com/a", False),
+])
+def test_allow_and_block_lists(allowlist, blocklist, url, allowed):
+    sched = scheduler(allowlist=allowlist, blocklist=blocklist)
+    assert sched.allowed(url) is allowed
+    assert sched.submit(url, "default", refresh=False) == ("queued" if allowed else "blocked")
+
+
+def test_default_blocklist_is_empty():
+    assert IngestScheduler(noop).allowed("http://127.0.0.1:8000/")
+
+
+def test_new_pages_go_before_refreshes():
+    sched = scheduler()
+    sched.submit("https://a.com/1", "default", refresh=True)
+    sched.submit("https://a.com/2", "default", refresh=True)
+    sched.submit("https://a.com/3", "default", refresh=False)
+    sched.submit("https://a.com/4", "default", refresh=False)
+    assert drain(sched) == ["https://a.com/3", "https://a.com/4", "https://a.com/1", "https://a.com/2"]
+
+
+def test_repeat_upload_of_a_queued_page_keeps_its_place_with_the_latest_content():
+    sched = scheduler()
+    assert sched.submit("https://a.com/1", "default", refresh=False, text="old") == "queued"
+    assert sched.submit("https://a.com/2", "default", refresh=False) == "queued"
+    assert sched.submit("https://a.com/1", "default", refresh=False, text="new") == "coalesced"
+    assert sched.submit("https://a.com/1", "work", refresh=False) == "queued"  # another profile is another page
+    (key, job), _ = sched._take_next(0.0)
+    assert key == ("default", "https://a.com/1") and job["page"] == {"text": "new"}
+    assert drain(sched) == ["https://a.com/2", "https://a.com/1"]
+
+
+def test_domain_rate_limit_defers_only_that_domain():
+    sched = scheduler(domain_rate=60, domain_burst=2)  # a page a second, two at once
+    for i in range(3):
+        sched.submit(f"https://a.com/{i}", "default", refresh=False)
+    sched.submit("https://b.com/0", "default", refresh=False)
+    assert drain(sched, now=0.0) == ["https://a.com/0", "https://a.com/1", "https://b.com/0"]
+    chosen, wait = sched._take_next(0.25)
+    assert chosen is None and wait == pytest.approx(0.75)
+    assert drain(sched, now=1.0) == ["https://a.com/2"]
+
+
+def test_full_queue_drops_the_newest_refresh_for_a_new_page():
+    sched = scheduler(max_queue=3)
+    assert sched.submit("https://a.com/r1", "default", refresh=True) == "queued"
+    assert sched.submit("https://a.com/r2", "default", refresh=True) == "queued"
+    assert sched.submit("https://a.com/n1", "default", refresh=False) == "queued"
+    assert sched.submit("https://a.com/r3", "default", refresh=True) == "full"
+    assert sched.submit("https://a.com/n2", "default", refresh=False) == "queued"  # drops r2
+    assert sched.submit("https://a.com/n3", "default", refresh=False) == "queued"  # drops r1
+    assert sched.submit("https://a.com/n4", "default", refresh=False) == "full"    # no refreshes left
+    assert drain(sched) == ["https://a.com/n1", "https://a.com/n2", "https://a.com/n3"]
+
+
+def test_indexed_page_is_debounced(running):
+    indexed = []
+    sched = running(scheduler(lambda url, profile, **page: indexed.append(url), debounce_seconds=300))
+    assert sched.submit("https://a.com/", "default", refresh=False) == "queued"
+    assert sched.wait_idle(5)
+    assert sched.submit("https://a.com/", "default", refresh=True) == "debounced"
+    assert sched.submit("https://a.com/", "work", refresh=True) == "queued"
+    assert sched.wait_idle(5)
+    assert indexed == ["https://a.com/", "https://a.com/"]
+
+
+def test_debounce_expires(running):
+    sched = running(scheduler(debounce_seconds=0))
+    assert sched.submit("https://a.com/", "default", refresh=False) == "queued"
+    assert sched.wait_idle(5)
+    assert sched.submit("https://a.com/", "default", refresh=True) == "queued"
+    assert sched.wait_idle(5)
+
+
+def test_failed_page_is_not_debounced(running):
+    calls = []
+
+    def handler(url, profile, **page):
+        calls.append(url)
+        if len(calls) == 1:
+            raise RuntimeError("embedding server down")
+
+    sched = running(scheduler(handler))
+    assert sched.submit("https://a.com/", "default", refresh=False) == "queued"
+    assert sched.wait_idle(5)
+    assert sched.submit("https://a.com/", "default", refresh=False) == "queued"
+    assert sched.wait_idle(5)
+    assert sched.submit("https://a.com/", "default", refresh=False) == "debounced"
+    assert calls == ["https://a.com/", "https://a.com/"]
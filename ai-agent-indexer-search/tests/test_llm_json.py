@@ -0,0 +1,37 @@
+"""Parsing the JSON objects the LLM returns, including the ways models get them wrong."""
+import pytest
+
+from src.llm_json import parse_llm_json, repair_json
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ('{"response_type": "FINAL_ANSWER", "final_answer": "https://a.com/"}',
+     {"response_type": "FINAL_ANSWER", "final_answer": "https://a.com/"}),
+    ('```json\n{"intent": "find", "entities": ["a"]}\n```', {"intent": "find", "entities": ["a"]}),
+    ('```\n{"intent": "find"}\n```', {"intent": "find"}),
+    ('{"entities": ["a", "b",], "tool_hint": null,}', {"entities": ["a", "b"], "tool_hint": None}),
+    ("{'intent': 'find', 'entities': ['INDIA']}", {"intent": "find", "entities": ["INDIA"]}),
+    ('{"arguments": {"key1"="value1", "flag"= False, "n"= None}}', {"arguments": {"key1": "value1", "flag": False, "n": None}}),
+    ('{"tool": "search", "arguments": {"query": "x"}', {"tool": "search", "arguments": {"query": "x"}}),
+    ('Here you go: {"a": 1} and then {"b": 2}', {"a": 1}),
+    ('{"a": 1}\n{"b": 2}', {"a": 1}),
+    ('{"text": "a, } inside, ]"}', {"text": "a, } inside, ]"}),
+])
+def test_parse_llm_json(reply, expected):
+    assert parse_llm_json(reply) == expected
+
+
+@pytest.mark.parametrize("reply", ["", "no json here", "[1, 2, 3]", "{not: valid: at all"])
+def test_parse_llm_json_rejects(reply):
+    with pytest.raises(ValueError):
+        parse_llm_json(reply)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": True, "b": None,}', '{"a": true, "b": null}'),
+    ('{"a"="x=y"}', '{"a":"x=y"}'),
+    ('{"a": [1, {"b": 2', '{"a": [1, {"b": 2}]}'),
+    ('{"s": "True, None"}', '{"s": "True, None"}'),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
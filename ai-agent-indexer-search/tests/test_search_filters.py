@@ -0,0 +1,83 @@
+"""Domain and visit-time filters applied inside the FAISS search."""
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from faiss_store import (ShardCache, chunk_metadata, domain_matches, filter_mask, iso_time, load_shard, save_store,
+                         search_shards)
+
+DAY = 86400
+NOW = time.time()
+PAGES = [  # url, days since the visit (None: unknown)
+    ("https://github.com/a", 1),
+    ("https://docs.github.com/b", 3),
+    ("https://www.github.io/c", 20),
+    ("https://notgithub.com/d", 2),
+    ("https://example.com/e", None),
+]
+
+
+@pytest.fixture
+def shard(tmp_path):
+    rows = [chunk_metadata(url, url, 0, visited_at=None if days is None else iso_time(NOW - days * DAY))
+            for url, days in PAGES]
+    index = faiss.IndexFlatL2(8)
+    index.add(np.eye(len(PAGES), 8, dtype=np.float32))
+    save_store(index, rows, {url: "hash" for url, _ in PAGES}, tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize("domain, wanted, expected", [
+    ("github.com", "github.com", True),
+    ("docs.github.com", "github.com", True),
+    ("github.com", "www.github.com", True),
+    ("github.com", "GitHub.com ", True),
+    ("notgithub.com", "github.com", False),
+    ("github.com", "docs.github.com", False),
+    ("github.io", "github", True),  # a bare name matches any of its hosts
+    ("docs.github.com", "github", True),
+    ("notgithub.com", "github", False),
+    ("github.com", "git", False),
+])
+def test_domain_matches(domain, wanted, expected):
+    assert domain_matches(domain, wanted) is expected
+
+
+def matching_urls(shard, **filters):
+    loaded = load_shard(shard)
+    mask = filter_mask(loaded, **filters)
+    return [data["url"] for data, kept in zip(loaded.metadata, mask) if kept]
+
+
+def test_no_filters_means_no_mask(shard):
+    assert filter_mask(load_shard(shard)) is None
+
+
+def test_domain_filter_includes_subdomains(shard):
+    assert matching_urls(shard, domain="github.com") == ["https://github.com/a", "https://docs.github.com/b"]
+    assert matching_urls(shard, domain="github.io") == ["https://www.github.io/c"]
+
+
+def test_visit_filters_exclude_unknown_visit_times(shard):
+    assert matching_urls(shard, visited_after=NOW - 7 * DAY) == [
+        "https://github.com/a", "https://docs.github.com/b", "https://notgithub.com/d"]
+    assert matching_urls(shard, visited_before=NOW - 7 * DAY) == ["https://www.github.io/c"]
+    assert "https://example.com/e" not in matching_urls(shard, visited_after=0)
+
+
+def test_visited_within_days_becomes_visited_after():
+    from mcp_server import search_filters
+
+    filters = search_filters(domain="", visited_within_days=7, visited_after="2000-01-01")
+    assert filters["domain"] is None
+    assert abs(filters["visited_after"] - (time.time() - 7 * DAY)) < 5  # the later of the two bounds
+    assert search_filters(visited_after="2999-01-01", visited_within_days=7)["visited_after"] > time.time()
+
+
+def test_search_only_compares_matching_vectors(shard):
+    query = np.eye(len(PAGES), 8, dtype=np.float32)[3:4]  # closest to notgithub.com
+    hits = search_shards([shard], query, 5, ShardCache(), domain="github.com", visited_after=NOW - 7 * DAY)
+    assert [data["url"] for _, data in hits] == ["https://github.com/a", "https://docs.github.com/b"]
+    assert search_shards([shard], query, 5, ShardCache(), domain="nowhere.org") == []
@@ -7,9 +7,60 @@ function logDebug(message, data = null) {
   }
 }
 
+const INDEX_URL = 'http://127.0.0.1:8080/index-website';
+
+// Index profile for this browser profile: 'default', which also holds the history indexed before
+// profiles existed, unless the user chose a separate index in the popup (a random id, created once)
+async function getProfileId() {
+  const { profileId, separateProfile } = await chrome.storage.local.get(['profileId', 'separateProfile']);
+  return separateProfile && profileId ? profileId : 'default';
+}
+
 // Add a cache to track processed tab IDs and URLs
 const processedTabs = new Map();
 
+// Hex SHA-256 of the page text; the indexer stores the same hash per URL
+async function sha256Hex(text) {
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Ask the indexer whether it already holds this exact content for the URL
+async function isAlreadyIndexed(url, contentHash, profile) {
+  try {
+    const query = new URLSearchParams({ url, profile });
+    const response = await fetch(`${INDEX_URL}?${query}`, {
+      method: 'HEAD',
+      headers: { 'If-None-Match': `"${contentHash}"` },
+      cache: 'no-store',
+      mode: 'cors'
+    });
+    return response.status === 304;
+  } catch (error) {
+    logDebug('Index check failed, uploading anyway', error);
+    return false;
+  }
+}
+
+// Tell the indexer an unchanged page was visited again, so searches limited to recent visits find it
+async function recordVisit(url, profile) {
+  try {
+    await fetch(`${INDEX_URL}/visit`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ url, profile, visited_at: new Date().toISOString() }),
+      mode: 'cors'
+    });
+  } catch (error) {
+    logDebug('Could not record visit', error);
+  }
+}
+
+async function gzipJson(payload) {
+  const stream = new Blob([JSON.stringify(payload)]).stream().pipeThrough(new CompressionStream('gzip'));
+  return new Response(stream).arrayBuffer();
+}
+
 // Add a flag to track if the tab was opened by the popup.js service
 const tabsOpenedByPopup = new Set();
 
@@ -41,29 +92,41 @@ chrome.webNavigation.onCompleted.addListener(async (details) => {
 
       const tabContent = await chrome.scripting.executeScript({
         target: { tabId: tab.id },
+        // Send the rendered text rather than the full HTML; it is a fraction of the size
         func: () => ({
           url: window.location.href,
-          body: document.documentElement.outerHTML
+          title: document.title,
+          text: document.body ? document.body.innerText : ''
         })
       });
 
       if (tabContent && tabContent[0] && tabContent[0].result) {
-        const { url, body } = tabContent[0].result;
+        const { url, title, text } = tabContent[0].result;
+
+        logDebug('URL and text extracted', { url, length: text.length });
 
-        logDebug('URL and HTML extracted', { url, body });
+        const profile = await getProfileId();
+        const contentHash = await sha256Hex(text);
+        if (await isAlreadyIndexed(url, contentHash, profile)) {
+          logDebug('Content already indexed, skipping upload', { url, contentHash });
+          await recordVisit(url, profile);
+          processedTabs.set(tab.id, details.url);
+          return;
+        }
 
         const requestOptions = {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
             'Accept': 'application/json',
             'Origin': chrome.runtime.getURL('')
           },
-          body: JSON.stringify({ url, body }),
+          body: await gzipJson({ url, text, profile, title, visited_at: new Date().toISOString() }),
           mode: 'cors'
         };
 
-        await fetch('http://127.0.0.1:8080/index-website', requestOptions)
+        await fetch(INDEX_URL, requestOptions)
           .then(response => {
             if (!response.ok) {
               if (response.status === 404) {
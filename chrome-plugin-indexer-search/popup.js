@@ -1,4 +1,134 @@
-document.getElementById('searchButton').addEventListener('click', () => {
+const SEARCH_STREAM_URL = 'http://127.0.0.1:8081/search-agent/stream';
+
+// Index profile for this browser profile: 'default', which also holds the history indexed before
+// profiles existed, unless the user chose a separate index in the popup (a random id, created once)
+async function getProfileId() {
+  const { profileId, separateProfile } = await chrome.storage.local.get(['profileId', 'separateProfile']);
+  return separateProfile && profileId ? profileId : 'default';
+}
+
+// passage: { highlight_text, highlight_start } from the search response; highlight_start is the
+// sentence's offset in the page's innerText as it was indexed, used to pick the right occurrence
+const openAndHighlight = (url, passage) => {
+  chrome.tabs.create({ url }, (tab) => {
+    chrome.scripting.executeScript({
+      target: { tabId: tab.id },
+      func: ({ highlight_text: text, highlight_start: start }) => {
+        const markRange = (range) => {
+          const rect = range.getBoundingClientRect();
+          const highlightDiv = document.createElement('div');
+          highlightDiv.style.position = 'absolute';
+          highlightDiv.style.left = `${rect.left + window.scrollX}px`;
+          highlightDiv.style.top = `${rect.top + window.scrollY}px`;
+          highlightDiv.style.width = `${rect.width}px`;
+          highlightDiv.style.height = `${rect.height}px`;
+          highlightDiv.style.border = '2px solid red';
+          highlightDiv.style.zIndex = '9999';
+          document.body.appendChild(highlightDiv);
+
+          window.scrollTo({ top: rect.top + window.scrollY - 100, behavior: 'smooth' });
+        };
+
+        // The browser's own find jumps straight to the sentence, even when it spans several elements;
+        // the occurrences before the indexed offset tell it which match to stop at
+        const findPassage = () => {
+          let skip = 0;
+          if (Number.isInteger(start)) {
+            const before = document.body.innerText.slice(0, start);
+            for (let i = before.indexOf(text); i !== -1; i = before.indexOf(text, i + 1)) skip++;
+          }
+          for (let i = 0; i <= skip; i++) {
+            if (!window.find(text, true, false, true)) return null;
+          }
+          const selection = window.getSelection();
+          const range = selection.rangeCount ? selection.getRangeAt(0).cloneRange() : null;
+          selection.removeAllRanges();
+          return range;
+        };
+
+        // Fallback for text the page does not contain as one run, e.g. when it has changed since indexing
+        const findTextNode = () => {
+          const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT, {
+            acceptNode: (node) => node.textContent.includes(text) ? NodeFilter.FILTER_ACCEPT : NodeFilter.FILTER_REJECT
+          });
+
+          const textNode = walker.nextNode();
+          if (!textNode) return null;
+
+          const range = document.createRange();
+          const startIndex = textNode.textContent.indexOf(text);
+          range.setStart(textNode, startIndex);
+          range.setEnd(textNode, startIndex + text.length);
+          return range;
+        };
+
+        const range = findPassage() || findTextNode();
+        if (range) {
+          markRange(range);
+        }
+      },
+      args: [passage]
+    });
+  });
+};
+
+// Show the latest candidate URLs while the agent keeps refining its answer
+const renderCandidates = (urls, searchText) => {
+  const results = document.getElementById('results');
+  results.innerHTML = '';
+  urls.forEach((url) => {
+    const item = document.createElement('li');
+    const link = document.createElement('a');
+    link.href = url;
+    link.textContent = url;
+    link.title = url;
+    link.addEventListener('click', (event) => {
+      event.preventDefault();
+      openAndHighlight(url, { highlight_text: searchText });
+    });
+    item.appendChild(link);
+    results.appendChild(item);
+  });
+};
+
+// Opting in keeps the id, so switching back and forth returns to the same separate index
+const separateProfile = document.getElementById('separateProfile');
+chrome.storage.local.get('separateProfile').then(({ separateProfile: enabled }) => {
+  separateProfile.checked = Boolean(enabled);
+});
+separateProfile.addEventListener('change', async () => {
+  const { profileId } = await chrome.storage.local.get('profileId');
+  await chrome.storage.local.set({
+    profileId: profileId || crypto.randomUUID(),
+    separateProfile: separateProfile.checked,
+  });
+});
+
+const setStatus = (text) => {
+  document.getElementById('status').textContent = text;
+};
+
+// Read newline-delimited JSON events from the stream as they arrive
+const readEvents = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+
+    const lines = buffered.split('\n');
+    buffered = lines.pop();
+    lines.filter((line) => line.trim()).forEach((line) => onEvent(JSON.parse(line)));
+  }
+  if (buffered.trim()) {
+    onEvent(JSON.parse(buffered));
+  }
+};
+
+document.getElementById('searchButton').addEventListener('click', async () => {
   const searchText = document.getElementById('searchInput').value;
 
   if (searchText.trim() === '') {
@@ -6,63 +136,40 @@ document.getElementById('searchButton').addEventListener('click', () => {
     return;
   }
 
-  fetch('http://127.0.0.1:8081/search-agent', {
+  renderCandidates([], searchText);
+  setStatus('Searching...');
+
+  const profile = await getProfileId();
+
+  fetch(SEARCH_STREAM_URL, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
     },
-    body: JSON.stringify({ query: searchText })
+    body: JSON.stringify({ query: searchText, profile })
   })
     .then(response => {
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
-      return response.json();
-    })
-    .then(data => {
-      const { url, highlight_text } = data;
-      
-      chrome.tabs.create({ url }, (tab) => {
-        chrome.scripting.executeScript({
-          target: { tabId: tab.id },
-          func: (highlight_text) => {
-            const findAndHighlightText = (text) => {
-              const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT, {
-                acceptNode: (node) => node.textContent.includes(text) ? NodeFilter.FILTER_ACCEPT : NodeFilter.FILTER_REJECT
-              });
-
-              const textNode = walker.nextNode();
-
-              if (textNode) {
-                const range = document.createRange();
-                const startIndex = textNode.textContent.indexOf(text);
-                const endIndex = startIndex + text.length;
-                range.setStart(textNode, startIndex);
-                range.setEnd(textNode, endIndex);
-
-                const rect = range.getBoundingClientRect();
-                const highlightDiv = document.createElement('div');
-                highlightDiv.style.position = 'absolute';
-                highlightDiv.style.left = `${rect.left + window.scrollX}px`;
-                highlightDiv.style.top = `${rect.top + window.scrollY}px`;
-                highlightDiv.style.width = `${rect.width}px`;
-                highlightDiv.style.height = `${rect.height}px`;
-                highlightDiv.style.border = '2px solid red';
-                highlightDiv.style.zIndex = '9999';
-                document.body.appendChild(highlightDiv);
-
-                window.scrollTo({ top: rect.top + window.scrollY - 100, behavior: 'smooth' });
-              }
-            };
-
-            findAndHighlightText(highlight_text);
-          },
-          args: [highlight_text]
-        });
+      return readEvents(response, (event) => {
+        if (event.type === 'candidates') {
+          renderCandidates(event.urls, searchText);
+          setStatus(event.stage === 'retrieval' ? 'Best guesses so far, refining...' : 'Refining...');
+        } else if (event.type === 'final') {
+          if (!event.url) {
+            throw new Error('No results found for the query');
+          }
+          setStatus('Found it');
+          openAndHighlight(event.url, event);
+        } else if (event.type === 'error') {
+          throw new Error(event.detail);
+        }
       });
     })
     .catch(error => {
       console.error('Error during search:', error);
+      setStatus('');
       alert(`Error: ${error.message}`);
     });
-});
\ No newline at end of file
+});